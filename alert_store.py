@@ -0,0 +1,135 @@
+# alert_store.py
+# 🗃️ Indexed alert log (SQLite, WAL) with dedup/cooldown queries and CSV export
+#
+# Replaces the per-alert append to alerts_log.csv. Scans log their alerts in one
+# transaction, and "did we already alert on X today / in the last N minutes" is an
+# index lookup instead of a full CSV read. export_csv() rebuilds alerts_log.csv
+# (timestamp, symbol, alert) for anything that still reads the file.
+
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+ALERT_DB_PATH = os.getenv("ALERT_DB_PATH", os.path.join(os.getenv("MACD_CACHE_DIR", ".cache"), "alerts.sqlite"))
+LEGACY_CSV = "alerts_log.csv"
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+MAX_PARAMS = 900  # stay under SQLite's bound-parameter limit
+# Re-alert a bullish candidate only after this many minutes (unset: once per day); shared by
+# the scanner's summary and the per-stock report alerts
+CANDIDATE_COOLDOWN = (float(os.environ["SCANNER_ALERT_COOLDOWN_MINUTES"])
+                      if os.getenv("SCANNER_ALERT_COOLDOWN_MINUTES") else None)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    id     INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts     TEXT NOT NULL,
+    date   TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    alert  TEXT NOT NULL,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS alerts_symbol_date_alert ON alerts (symbol, date, alert);
+CREATE INDEX IF NOT EXISTS alerts_alert_symbol_ts ON alerts (alert, symbol, ts);
+"""
+
+class AlertStore:
+    def __init__(self, path=ALERT_DB_PATH, legacy_csv=LEGACY_CSV):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        is_new = not os.path.exists(path)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        if is_new and legacy_csv and os.path.exists(legacy_csv):
+            self.import_csv(legacy_csv)
+
+    # --- Writes ---
+    def log_many(self, alerts, when=None):
+        # alerts: iterable of (symbol, alert) or (symbol, alert, detail); one transaction
+        when = when or datetime.now()
+        ts, date = when.strftime(TS_FORMAT), when.strftime("%Y-%m-%d")
+        rows = [(ts, date, a[0], a[1], a[2] if len(a) > 2 else None) for a in alerts]
+        if not rows:
+            return 0
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT INTO alerts (ts, date, symbol, alert, detail) VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def log(self, symbol, alert, detail=None, when=None):
+        return self.log_many([(symbol, alert, detail)], when)
+
+    def import_csv(self, path):
+        df = pd.read_csv(path, dtype=str).dropna(subset=["timestamp", "symbol", "alert"])
+        rows = [(ts, ts[:10], symbol, alert, None) for ts, symbol, alert in df[["timestamp", "symbol", "alert"]].itertuples(index=False)]
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT INTO alerts (ts, date, symbol, alert, detail) VALUES (?, ?, ?, ?, ?)", rows)
+        print(f"🗃️ Imported {len(rows)} alerts from {path}")
+
+    # --- Dedup / cooldown ---
+    def last_alerted(self, symbols, alert, since):
+        # {symbol: latest ts} for symbols alerted with `alert` at or after `since`
+        symbols = list(dict.fromkeys(symbols))
+        since = since.strftime(TS_FORMAT)
+        found = {}
+        with self.lock:
+            for i in range(0, len(symbols), MAX_PARAMS):
+                chunk = symbols[i:i + MAX_PARAMS]
+                found.update(self.conn.execute(
+                    f"SELECT symbol, MAX(ts) FROM alerts WHERE alert = ? AND symbol IN ({','.join('?' * len(chunk))})"
+                    f" AND ts >= ? GROUP BY symbol", [alert, *chunk, since]
+                ).fetchall())
+        return found
+
+    def _since(self, cooldown_minutes, now):
+        # No cooldown given means "once per day"
+        now = now or datetime.now()
+        if cooldown_minutes is None:
+            return now.replace(hour=0, minute=0, second=0, microsecond=0)
+        return now - timedelta(minutes=cooldown_minutes)
+
+    def filter_new(self, symbols, alert, cooldown_minutes=None, now=None):
+        # Symbols not alerted with `alert` within the cooldown (today, by default), in input order
+        recent = self.last_alerted(symbols, alert, self._since(cooldown_minutes, now))
+        return [s for s in symbols if s not in recent]
+
+    def in_cooldown(self, symbol, alert, cooldown_minutes=None, now=None):
+        return not self.filter_new([symbol], alert, cooldown_minutes, now)
+
+    def already_alerted_today(self, symbol, alert=None, today=None):
+        date = (today or datetime.now()).strftime("%Y-%m-%d")
+        query, params = "SELECT 1 FROM alerts WHERE symbol = ? AND date = ?", [symbol, date]
+        if alert:
+            query, params = query + " AND alert = ?", params + [alert]
+        with self.lock:
+            return self.conn.execute(query + " LIMIT 1", params).fetchone() is not None
+
+    # --- Export ---
+    def export_csv(self, path=LEGACY_CSV, since=None):
+        query, params = "SELECT ts AS timestamp, symbol, alert FROM alerts", []
+        if since is not None:
+            query, params = query + " WHERE ts >= ?", [since.strftime(TS_FORMAT)]
+        with self.lock:
+            df = pd.read_sql_query(query + " ORDER BY id", self.conn, params=params)
+        df.to_csv(path, index=False)
+        return len(df)
+
+    def close(self):
+        self.conn.close()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AlertStore()
+        return _store
+
+if __name__ == "__main__":
+    n = get_store().export_csv()
+    print(f"💾 Exported {n} alerts to {LEGACY_CSV}")
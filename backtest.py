@@ -0,0 +1,203 @@
+# backtest.py
+# 📊 Vectorized replay of the confluence entry and MACD-weakness exit over stored candles
+#
+# Every bar of every symbol is scored at once with array operations; only the
+# trade bookkeeping walks signals (one step per trade, not per bar).
+#
+# It replays whatever candle_store holds, which the scanner trims to
+# CANDLE_RETENTION_DAYS (60 by default). For multi-year history, backfill first:
+# `--backfill-days 1095` walks SmartAPI back in 200-day requests per symbol and pins
+# those series so later scans and compaction never trim them.
+# Usage: python backtest.py [--symbols A B ...] [--backfill-days N] [--min-confluence 4] [--out trades.csv]
+
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import candle_store
+from indicator_panel import build_panel_from_columns, add_panel_indicators
+
+DEFAULT_PARAMS = {
+    "min_confluence": 4,    # 5 = Strong, 4 = Moderate and above
+    "macd_gap": 0.3,        # MACD below signal by at most this much
+    "rsi_min": 40,
+    "volume_mult": 1.5,     # volume vs 20-bar average
+    "weak_gap": 0.1,        # exit when MACD gap shrinks below this
+}
+WARMUP_BARS = 35  # same minimum history the live scanner requires
+
+# --- Data ---
+def load_history_panel(symbols=None, interval="15min", store_dir=None):
+    symbols = symbols or candle_store.list_symbols(interval, store_dir)
+    series = {}
+    for symbol in symbols:
+        columns = candle_store.load_columns(symbol, interval, store_dir=store_dir)
+        if columns is not None:
+            series[symbol] = columns
+    return add_panel_indicators(build_panel_from_columns(series, min_bars=WARMUP_BARS))
+
+# --- Per-bar signals (symbols × bars) ---
+def _valid_bars(panel, warmup):
+    cols = np.arange(panel["close"].shape[1])
+    return cols[None, :] >= (panel["start"][:, None] + warmup - 1)
+
+def rolling_mean(values, start, window):
+    # Trailing mean over `window` bars, NaN until a symbol has that many (as rolling().mean())
+    n_bars = values.shape[1]
+    out = np.full(values.shape, np.nan)
+    if n_bars < window:
+        return out
+    csum = np.cumsum(np.nan_to_num(values), axis=1)
+    out[:, window - 1:] = csum[:, window - 1:]
+    out[:, window:] -= csum[:, :-window]
+    out /= window
+    cols = np.arange(n_bars)
+    out[cols[None, :] < (start[:, None] + window - 1)] = np.nan
+    return out
+
+def _prev(values):
+    shifted = np.full(values.shape, np.nan)
+    shifted[:, 1:] = values[:, :-1]
+    return shifted
+
+def signal_inputs(panel):
+    # Threshold-independent arrays behind confluence_scores / weakness_signals, so a
+    # sweep can compute them once and re-apply thresholds per parameter set
+    o, c = panel["open"], panel["close"]
+    gap = panel["MACD"] - panel["MACD_signal"]
+    with np.errstate(invalid="ignore"):
+        o_prev, c_prev = _prev(o), _prev(c)
+        return {
+            "macd_diff": gap,
+            "gap_falling": gap < _prev(gap),
+            "rsi": panel["RSI_14"],
+            "volume": panel["volume"],
+            "volume_avg": rolling_mean(panel["volume"], panel["start"], 20),
+            "above_ema200": c > panel["EMA_200"],
+            "engulf": (c > o) & (c_prev < o_prev) & (o < c_prev) & (c > o_prev),
+        }
+
+def confluence_scores(panel, macd_gap=0.3, rsi_min=40, volume_mult=1.5, inputs=None):
+    # Confluence (0-5) at every bar, using the same five checks as evaluate_bullish_candidate
+    inputs = inputs or signal_inputs(panel)
+    diff = inputs["macd_diff"]
+    with np.errstate(invalid="ignore"):
+        macd_close = (diff < 0) & (np.abs(diff) <= macd_gap)
+        rsi_ok = inputs["rsi"] > rsi_min
+        volume_surge = inputs["volume"] >= volume_mult * inputs["volume_avg"]
+    return (macd_close.astype(np.int8) + rsi_ok + volume_surge + inputs["above_ema200"] + inputs["engulf"]).astype(np.int8)
+
+def weakness_signals(panel, weak_gap=0.1, inputs=None):
+    # check_macd_weakness at every bar
+    inputs = inputs or signal_inputs(panel)
+    gap = inputs["macd_diff"]
+    with np.errstate(invalid="ignore"):
+        return (gap > 0) & inputs["gap_falling"] & (gap < weak_gap)
+
+# --- Trade simulation ---
+def simulate_trades(panel, entries, exits):
+    # Signals act at the next bar's open; a position exits on the first weakness
+    # bar after it is filled, or at the last close if none comes.
+    trades = []
+    n_bars = panel["close"].shape[1]
+    for row, symbol in enumerate(panel["symbols"]):
+        entry_bars = np.flatnonzero(entries[row])
+        exit_bars = np.flatnonzero(exits[row])
+        i = 0
+        while i < len(entry_bars):
+            entry_idx = entry_bars[i] + 1
+            if entry_idx >= n_bars:
+                break
+            j = np.searchsorted(exit_bars, entry_idx, side="left")
+            if j < len(exit_bars):
+                signal_idx = exit_bars[j]
+                exit_idx, reason = signal_idx + 1, "weakness"
+            else:
+                signal_idx = n_bars - 1
+                exit_idx, reason = n_bars, "end"
+
+            entry_price = panel["open"][row, entry_idx]
+            if exit_idx < n_bars:
+                exit_price = panel["open"][row, exit_idx]
+            else:
+                exit_idx, exit_price = n_bars - 1, panel["close"][row, n_bars - 1]
+
+            trades.append((symbol, panel["ts"][row, entry_idx], entry_price,
+                           panel["ts"][row, exit_idx], exit_price, exit_idx - entry_idx, reason))
+            i = np.searchsorted(entry_bars, signal_idx, side="right")
+
+    trades = pd.DataFrame(trades, columns=["symbol", "entry_ts", "entry_price", "exit_ts",
+                                           "exit_price", "bars_held", "exit_reason"])
+    trades["pnl"] = trades["exit_price"] - trades["entry_price"]
+    trades["return_pct"] = 100 * trades["pnl"] / trades["entry_price"]
+    for col in ["entry_ts", "exit_ts"]:
+        trades[col.replace("_ts", "_time")] = (
+            pd.to_datetime(trades[col].astype("int64"), unit="s", utc=True).dt.tz_convert(candle_store.MARKET_TZ)
+        )
+    return trades.drop(columns=["entry_ts", "exit_ts"])
+
+def summarize(trades):
+    if trades.empty:
+        return {"trades": 0, "hit_rate": 0.0, "total_return_pct": 0.0, "avg_return_pct": 0.0,
+                "total_pnl": 0.0, "max_drawdown_pct": 0.0}
+    # Equal notional per trade, booked in exit order
+    equity = trades.sort_values("exit_time")["return_pct"].cumsum().to_numpy()
+    drawdown = np.maximum.accumulate(np.maximum(equity, 0)) - equity
+    return {
+        "trades": len(trades),
+        "hit_rate": round(float(100 * (trades["pnl"] > 0).mean()), 2),
+        "total_return_pct": round(float(trades["return_pct"].sum()), 2),
+        "avg_return_pct": round(float(trades["return_pct"].mean()), 3),
+        "total_pnl": round(float(trades["pnl"].sum()), 2),
+        "max_drawdown_pct": round(float(drawdown.max()), 2),
+    }
+
+def run_backtest(panel, **params):
+    params = {**DEFAULT_PARAMS, **params}
+    valid = _valid_bars(panel, WARMUP_BARS)
+    confluence = confluence_scores(panel, params["macd_gap"], params["rsi_min"], params["volume_mult"])
+    entries = valid & (confluence >= params["min_confluence"])
+    exits = valid & weakness_signals(panel, params["weak_gap"])
+    trades = simulate_trades(panel, entries, exits)
+    return trades, summarize(trades)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest the confluence entry / MACD weakness exit")
+    parser.add_argument("--symbols", nargs="*", help="symbols to replay (default: everything in the candle store)")
+    parser.add_argument("--interval", default="15min")
+    parser.add_argument("--min-confluence", type=int, default=DEFAULT_PARAMS["min_confluence"])
+    parser.add_argument("--weak-gap", type=float, default=DEFAULT_PARAMS["weak_gap"])
+    parser.add_argument("--out", default="backtest_trades.csv")
+    parser.add_argument("--backfill-days", type=int, default=0,
+                        help="first fetch this many days of history per symbol from SmartAPI")
+    args = parser.parse_args(argv)
+
+    if args.backfill_days:
+        from smart_login import get_smartapi_client
+        from instrument_index import resolve_many
+        from utils import backfill_history
+        symbols = args.symbols or candle_store.list_symbols(args.interval)
+        if not symbols:
+            print("😐 No symbols to backfill: pass --symbols or run a scan first.")
+            return
+        client, tokens = get_smartapi_client(), resolve_many(symbols)
+        for symbol in symbols:
+            fetched = backfill_history(symbol, args.backfill_days, args.interval, client, tokens.get(symbol))
+            print(f"⏪ {symbol}: {fetched} older bars stored")
+
+    panel = load_history_panel(args.symbols, args.interval)
+    if not panel["symbols"]:
+        print("😐 No stored candle history to backtest.")
+        return
+    print(f"📊 Backtesting {len(panel['symbols'])} symbols × {panel['close'].shape[1]} bars")
+
+    trades, summary = run_backtest(panel, min_confluence=args.min_confluence, weak_gap=args.weak_gap)
+    trades.to_csv(args.out, index=False)
+    for key, value in summary.items():
+        print(f"• {key}: {value}")
+    print(f"💾 Saved {args.out}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
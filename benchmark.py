@@ -0,0 +1,168 @@
+# benchmark.py
+# ⏲️ End-to-end benchmark of the scanner and position guard against offline fakes
+#
+# Runs every stage of top_losers_macd_bot.main / position_guard_bot.main at several
+# universe sizes using FakeSmartConnect and the fake Screener/Telegram server, and
+# reports wall time, throughput, p50/p99 per-symbol latency and peak memory.
+# Usage: python benchmark.py [--sizes 50 600 2000] [--latency 0.02] [--memory] [--out benchmark_results.json]
+
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from fake_services import FakeSmartConnect, start_fake_http_server, write_fake_universe
+
+def _stage(results, name, fn, n_items=None, trace_memory=False):
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        value = fn()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+    if trace_memory:
+        tracemalloc.stop()
+
+    row = {"stage": name, "seconds": round(elapsed, 4), "peak_mb": round(peak / 2**20, 2) if trace_memory else None}
+    if n_items:
+        row["items"] = n_items
+        row["per_sec"] = round(n_items / elapsed, 1) if elapsed else None
+    results.append(row)
+    return value
+
+def _latency_stats(samples):
+    if not samples:
+        return {}
+    arr = np.array(samples) * 1000
+    return {"p50_ms": round(float(np.percentile(arr, 50)), 2),
+            "p99_ms": round(float(np.percentile(arr, 99)), 2),
+            "max_ms": round(float(arr.max()), 2)}
+
+def _max_rss_mb():
+    # Process-wide peak RSS (kilobytes on Linux); None where the resource module is missing
+    try:
+        import resource
+    except ImportError:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def run_size(n_symbols, args, http):
+    # Imported here so each size runs against the env/cwd set up for it
+    import utils
+    import instrument_index
+    import fetch_scheduler
+    import fundamentals_scraper
+    import telegram_dispatcher
+    import top_losers_macd_bot
+    import position_guard_bot
+    from indicator_panel import build_panel, add_panel_indicators
+    from panel_scoring import score_panel, grade_scores
+
+    write_fake_universe(n_symbols, "MACD_EQ_Segment_ScripMaster.csv", "top_losers.csv",
+                        "my_positions.csv", n_positions=min(args.positions, n_symbols))
+    instrument_index._index = None
+    fetch_scheduler.candle_limiter = fetch_scheduler.candle_rate_limiter(args.rate_per_sec, args.rate_per_sec * 60)
+    fundamentals_scraper.screener_limiter = fetch_scheduler.RateLimiter([fetch_scheduler.TokenBucket(args.rate_per_sec, 1)])
+    client = FakeSmartConnect(latency=args.latency, jitter=args.latency / 2)
+    results, latencies = [], {}
+    stage = lambda name, fn, n_items=None: _stage(results, name, fn, n_items, args.trace_memory)
+
+    symbols = stage("load_universe", lambda: top_losers_macd_bot.get_top_losers(top_n=n_symbols), n_symbols)
+    tokens = stage("resolve_tokens", lambda: instrument_index.resolve_many(symbols, fuzzy=False), n_symbols)
+
+    for label in ["fetch_cold", "fetch_warm"]:
+        samples = latencies.setdefault(label, [])
+
+        def fetch(symbol):
+            started = time.perf_counter()
+            df = utils.get_stock_data(symbol, interval="15min", days=7, smart_api=client, token=tokens[symbol])
+            samples.append(time.perf_counter() - started)
+            return df
+
+        frames = stage(label, lambda: fetch_scheduler.fetch_many(symbols, fetch), n_symbols)
+
+    ready = {s: df for s, df in zip(symbols, frames) if len(df) >= 35}
+    panel = stage("indicators", lambda: add_panel_indicators(build_panel(ready)), len(ready))
+    graded = stage("scoring", lambda: grade_scores(score_panel(panel)), len(ready))
+    stage("telegram", lambda: (utils.send_telegram_message("benchmark " * 50), telegram_dispatcher.flush()), 1)
+
+    enrich_symbols = list(graded["symbol"][:args.enrich_limit])
+    stage("fundamentals", lambda: fundamentals_scraper.fetch_many_fundamentals(enrich_symbols), len(enrich_symbols))
+    stage("fundamentals_cached", lambda: fundamentals_scraper.fetch_many_fundamentals(enrich_symbols),
+          len(enrich_symbols))
+
+    top_losers_macd_bot.get_smartapi_client = lambda: client
+    position_guard_bot.get_smartapi_client = lambda: client
+    stage("scanner_main", lambda: (top_losers_macd_bot.main(), telegram_dispatcher.flush()), n_symbols)
+    stage("position_guard_main", lambda: (position_guard_bot.main(), telegram_dispatcher.flush()),
+          min(args.positions, n_symbols))
+
+    return {
+        "symbols": n_symbols,
+        "stages": results,
+        "latency": {label: _latency_stats(samples) for label, samples in latencies.items()},
+        "api_calls": client.calls,
+        "api_rate_limited": client.rate_limited,
+        "max_rss_mb": _max_rss_mb(),
+    }
+
+def print_report(report):
+    print(f"\n📏 {report['symbols']} symbols — {report['api_calls']} API calls "
+          f"({report['api_rate_limited']} rate-limited), peak RSS {report['max_rss_mb']} MB")
+    print(f"{'stage':<22}{'seconds':>10}{'per_sec':>10}{'peak_mb':>10}")
+    for row in report["stages"]:
+        peak = "" if row["peak_mb"] is None else row["peak_mb"]
+        print(f"{row['stage']:<22}{row['seconds']:>10}{str(row.get('per_sec', '')):>10}{peak:>10}")
+    for label, stats in report["latency"].items():
+        print(f"• {label} per-symbol latency: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scan pipeline against offline fakes")
+    parser.add_argument("--sizes", nargs="*", type=int, default=[50, 600, 2000])
+    parser.add_argument("--latency", type=float, default=0.02, help="fake API latency in seconds")
+    parser.add_argument("--rate-per-sec", type=float, default=1000.0, help="client-side candle/Screener quota")
+    parser.add_argument("--positions", type=int, default=10)
+    parser.add_argument("--enrich-limit", type=int, default=20)
+    parser.add_argument("--memory", dest="trace_memory", action="store_true",
+                        help="trace per-stage peak memory with tracemalloc (slows every stage)")
+    parser.add_argument("--out", default="benchmark_results.json")
+    args = parser.parse_args(argv)
+
+    out_path = os.path.abspath(args.out)
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    http = start_fake_http_server()
+    os.environ.update({
+        "TELEGRAM_API_URL": http.base_url, "SCREENER_BASE_URL": http.base_url,
+        "TELEGRAM_BOT_TOKEN": "fake-token", "TELEGRAM_CHAT_ID": "fake-chat",
+    })
+    if repo_dir not in sys.path:
+        sys.path.insert(0, repo_dir)
+
+    reports = []
+    original_cwd = os.getcwd()
+    try:
+        for n_symbols in args.sizes:
+            with tempfile.TemporaryDirectory(prefix=f"macd_bench_{n_symbols}_") as workdir:
+                os.chdir(workdir)
+                report = run_size(n_symbols, args, http)
+                os.chdir(original_cwd)
+            print_report(report)
+            reports.append(report)
+    finally:
+        os.chdir(original_cwd)
+        http.stop()
+
+    with open(out_path, "w") as f:
+        json.dump(reports, f, indent=2)
+    print(f"\n💾 Saved {out_path}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
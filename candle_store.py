@@ -0,0 +1,377 @@
+# candle_store.py
+# 🗄️ Local incremental OHLC store — one memory-mapped .npy file per column,
+# per symbol and interval, so repeat runs only fetch the candles they're missing.
+#
+# Series are stored compactly (format version 2: int32 epoch minutes, float32 prices)
+# and read zero-copy into Candles, which widens to float64/DataFrames only on demand.
+# float32 keeps 24 significant bits: prices are exact to the paisa only below ₹1,31,072
+# (2^17); above that (e.g. MRF) they round to the nearest 1-2 paise, which the
+# indicators and grades don't notice but stored closes won't match the exchange's.
+#
+# Series are trimmed to CANDLE_RETENTION_DAYS on every write, except ones filled by
+# prepend_history (`python backtest.py --backfill-days N`), which are kept whole.
+
+import os
+import json
+import shutil
+import logging
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR = os.getenv("CANDLE_STORE_DIR", "candle_store")
+RETENTION_DAYS = int(os.getenv("CANDLE_RETENTION_DAYS", "60"))
+MARKET_TZ = "Asia/Kolkata"
+
+COLUMNS = {
+    "ts": np.int64,        # epoch seconds (bar open)
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "volume": np.int64,
+}
+PRICE_COLUMNS = ["open", "high", "low", "close", "volume"]
+OHLC = ["open", "high", "low", "close"]
+
+# Compact encoding used on disk and in Candles. Prices are snapped back to paise when
+# widened, which returns the fetched 2-decimal values exactly below ₹1,31,072.
+STORE_VERSION = 2
+STORED_COLUMNS = {
+    "ts": np.int32,        # epoch minutes (bar open)
+    "open": np.float32,
+    "high": np.float32,
+    "low": np.float32,
+    "close": np.float32,
+    "volume": np.int64,    # stays 64-bit: daily volumes of the busiest scrips pass 2**31
+}
+
+def _series_dir(symbol, interval, store_dir=None):
+    return os.path.join(store_dir or STORE_DIR, interval, quote(str(symbol), safe=""))
+
+def _empty_columns():
+    return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+# --- Compact encoding ---
+def encode_columns(columns):
+    # Wide columns (epoch seconds, float64) → stored encoding
+    stored = {"ts": (np.asarray(columns["ts"], dtype=np.int64) // 60).astype(np.int32)}
+    for name in PRICE_COLUMNS:
+        stored[name] = np.asarray(columns[name], dtype=STORED_COLUMNS[name])
+    return stored
+
+def decode_columns(stored):
+    # Stored encoding → wide columns (always fresh arrays, never views of a memory map)
+    columns = {"ts": np.asarray(stored["ts"], dtype=np.int64) * 60}
+    for name in OHLC:
+        columns[name] = np.round(np.asarray(stored[name], dtype=np.float64), 2)
+    columns["volume"] = np.array(stored["volume"], dtype=np.int64)
+    return columns
+
+# --- Metadata (coverage bookkeeping) ---
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, "meta.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_meta(path, meta):
+    tmp_path = os.path.join(path, "meta.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(path, "meta.json"))
+
+# --- Read ---
+def load_columns(symbol, interval, mmap=True, store_dir=None):
+    path = _series_dir(symbol, interval, store_dir)
+    if not os.path.isdir(path):
+        return None
+    columns = load_columns_at(path, mmap=mmap)
+    if columns is None:
+        logger.warning(f"Discarding unreadable candle store for {symbol}/{interval}")
+    return columns
+
+def load_stored_at(path, mmap=False):
+    # Columns in the stored encoding; version-1 series (seconds, float64) are converted on read
+    try:
+        columns = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+            for name in STORED_COLUMNS
+        }
+    except (OSError, ValueError):
+        return None
+
+    # A crash between column writes leaves mismatched lengths — treat as missing
+    if len({len(col) for col in columns.values()}) != 1:
+        return None
+    if columns["ts"].dtype == np.int64:
+        columns = encode_columns(columns)
+    return columns
+
+def load_columns_at(path, mmap=False):
+    stored = load_stored_at(path, mmap=mmap)
+    return None if stored is None else decode_columns(stored)
+
+def load_candles(symbol, interval, store_dir=None):
+    # Zero-copy Candles over the memory-mapped store files, or None when nothing is stored
+    path = _series_dir(symbol, interval, store_dir)
+    if not os.path.isdir(path):
+        return None
+    stored = load_stored_at(path, mmap=True)
+    if stored is None:
+        logger.warning(f"Discarding unreadable candle store for {symbol}/{interval}")
+        return None
+    return Candles(**stored)
+
+def coverage(symbol, interval, store_dir=None):
+    # (covered_from, last_ts) in epoch seconds, or (None, None) when nothing is stored
+    path = _series_dir(symbol, interval, store_dir)
+    meta = _read_meta(path)
+    stored = load_stored_at(path, mmap=True) if os.path.isdir(path) else None
+    if stored is None or len(stored["ts"]) == 0 or "covered_from" not in meta:
+        return None, None
+    return int(meta["covered_from"]), int(stored["ts"][-1]) * 60
+
+# --- Conversion ---
+def frame_to_columns(df):
+    if isinstance(df, Candles):
+        return df.columns()
+    if df.empty:
+        return _empty_columns()
+    ts = pd.to_datetime(df.index if "timestamp" not in df.columns else df["timestamp"])
+    ts = pd.Series(ts)
+    if ts.dt.tz is None:
+        ts = ts.dt.tz_localize(MARKET_TZ)
+    epoch = (ts - pd.Timestamp("1970-01-01", tz="UTC")) // pd.Timedelta(seconds=1)
+    columns = {"ts": epoch.to_numpy(dtype=np.int64)}
+    for name in PRICE_COLUMNS:
+        columns[name] = df[name].to_numpy(dtype=COLUMNS[name])
+    return columns
+
+def columns_to_frame(columns):
+    index = pd.to_datetime(np.asarray(columns["ts"]), unit="s", utc=True).tz_convert(MARKET_TZ)
+    df = pd.DataFrame(
+        {name: np.asarray(columns[name]) for name in PRICE_COLUMNS},
+        index=pd.DatetimeIndex(index, name="timestamp"),
+    )
+    return df
+
+# --- Write ---
+def write_columns(symbol, interval, columns, covered_from, store_dir=None, keep_history=False):
+    path = _series_dir(symbol, interval, store_dir)
+    os.makedirs(path, exist_ok=True)
+    _write_at(path, columns, covered_from, keep_history)
+
+def _write_at(path, columns, covered_from, keep_history=False):
+    stored = encode_columns(columns)
+    for name, dtype in STORED_COLUMNS.items():
+        tmp_path = os.path.join(path, f"{name}.tmp.npy")
+        np.save(tmp_path, np.ascontiguousarray(stored[name], dtype=dtype))
+        os.replace(tmp_path, os.path.join(path, f"{name}.npy"))
+    meta = {"covered_from": int(covered_from), "version": STORE_VERSION}
+    if keep_history:
+        meta["keep_history"] = True  # backfilled: exempt from retention
+    _write_meta(path, meta)
+
+def append_candles(symbol, interval, new_df, covered_from, retention_days=None, store_dir=None, now=None):
+    # Merge freshly fetched candles over the stored tail. The newest stored bar
+    # may have been partial when it was saved, so fetched bars always win.
+    stored = load_columns(symbol, interval, mmap=False, store_dir=store_dir)
+    old_meta = _read_meta(_series_dir(symbol, interval, store_dir))
+    new = frame_to_columns(new_df)
+
+    if stored is not None and len(new["ts"]):
+        keep = stored["ts"] < new["ts"][0]
+        merged = {name: np.concatenate([stored[name][keep], new[name]]) for name in COLUMNS}
+    elif stored is not None:
+        merged = stored
+    else:
+        merged = new
+
+    # Drop duplicate timestamps, keeping the last one fetched
+    if len(merged["ts"]):
+        _, last_idx = np.unique(merged["ts"][::-1], return_index=True)
+        order = np.sort(len(merged["ts"]) - 1 - last_idx)
+        merged = {name: col[order] for name, col in merged.items()}
+
+    # Older coverage only carries over when the new fetch joins onto it without a gap
+    if stored is not None and len(stored["ts"]) and "covered_from" in old_meta and stored["ts"][-1] >= covered_from:
+        covered_from = min(covered_from, int(old_meta["covered_from"]))
+
+    keep_history = stored is not None and old_meta.get("keep_history", False)
+    if not keep_history:
+        merged, covered_from = _apply_retention(merged, covered_from, retention_days, now)
+    write_columns(symbol, interval, merged, covered_from, store_dir=store_dir, keep_history=keep_history)
+    return merged
+
+def prepend_history(symbol, interval, old_df, covered_from, covered_to, store_dir=None):
+    # Merge a backfilled chunk covering [covered_from, covered_to) in under the stored
+    # series and pin the series against retention. Stored bars win where they overlap;
+    # coverage only extends back when the chunk reaches the stored coverage.
+    stored = load_columns(symbol, interval, mmap=False, store_dir=store_dir)
+    meta = _read_meta(_series_dir(symbol, interval, store_dir))
+    old = frame_to_columns(old_df)
+
+    if stored is None or not len(stored["ts"]) or "covered_from" not in meta:
+        merged = old
+    else:
+        keep = old["ts"] < stored["ts"][0]
+        merged = {name: np.concatenate([old[name][keep], stored[name]]) for name in COLUMNS}
+        if covered_to < int(meta["covered_from"]):
+            covered_from = int(meta["covered_from"])  # a gap: older bars are kept but not counted
+        else:
+            covered_from = min(covered_from, int(meta["covered_from"]))
+    write_columns(symbol, interval, merged, covered_from, store_dir=store_dir, keep_history=True)
+    return merged
+
+# --- Retention / compaction ---
+def _apply_retention(columns, covered_from, retention_days=None, now=None):
+    retention_days = RETENTION_DAYS if retention_days is None else retention_days
+    if not retention_days:
+        return columns, covered_from
+    now = pd.Timestamp.now(tz="UTC").timestamp() if now is None else now
+    cutoff = int(now - retention_days * 86400)
+    keep = columns["ts"] >= cutoff
+    if not keep.all():
+        columns = {name: col[keep] for name, col in columns.items()}
+    return columns, max(covered_from, cutoff)
+
+def compact_store(retention_days=None, store_dir=None, now=None):
+    # Trim every series to the retention window, delete series that fell out of it,
+    # and rewrite version-1 series in the compact encoding
+    store_dir = store_dir or STORE_DIR
+    trimmed, removed = 0, 0
+    if not os.path.isdir(store_dir):
+        return trimmed, removed
+
+    for interval in os.listdir(store_dir):
+        interval_dir = os.path.join(store_dir, interval)
+        if not os.path.isdir(interval_dir):
+            continue
+        for name in os.listdir(interval_dir):
+            path = os.path.join(interval_dir, name)
+            columns = load_columns_at(path)
+            meta = _read_meta(path)
+            if columns is None or "covered_from" not in meta:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+                continue
+
+            kept, covered_from = columns, int(meta["covered_from"])
+            if not meta.get("keep_history"):
+                kept, covered_from = _apply_retention(kept, covered_from, retention_days, now)
+            if len(kept["ts"]) == 0:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+            elif len(kept["ts"]) != len(columns["ts"]) or meta.get("version") != STORE_VERSION:
+                _write_at(path, kept, covered_from, meta.get("keep_history", False))
+                trimmed += 1
+
+    return trimmed, removed
+
+def list_symbols(interval, store_dir=None):
+    interval_dir = os.path.join(store_dir or STORE_DIR, interval)
+    if not os.path.isdir(interval_dir):
+        return []
+    return sorted(unquote(name) for name in os.listdir(interval_dir)
+                  if os.path.isdir(os.path.join(interval_dir, name)))
+
+def read_window(symbol, interval, from_ts, store_dir=None):
+    candles = load_candles(symbol, interval, store_dir=store_dir)
+    if candles is None:
+        return pd.DataFrame(columns=PRICE_COLUMNS)
+    return candles.since(from_ts).to_frame()
+
+def as_frame(data):
+    # DataFrame for code written against frames; Candles are widened (a copy) here
+    return data.to_frame() if isinstance(data, Candles) else data
+
+# --- Compact candle container ---
+class Candles:
+    # One symbol's bars in the stored encoding: contiguous int32 epoch-minute timestamps,
+    # float32 prices and int64 volume, usually views of the memory-mapped store files.
+    # Slicing returns views; indicators are computed on demand and kept as row views.
+    __slots__ = ["ts", "open", "high", "low", "close", "volume", "indicators"]
+
+    def __init__(self, ts, open, high, low, close, volume, indicators=None):
+        self.ts, self.open, self.high, self.low, self.close, self.volume = ts, open, high, low, close, volume
+        self.indicators = indicators if indicators is not None else {}
+
+    @classmethod
+    def from_columns(cls, columns):
+        # From wide columns (epoch seconds, float64), e.g. frame_to_columns output
+        return cls(**encode_columns(columns))
+
+    @classmethod
+    def from_frame(cls, df):
+        candles = cls.from_columns(frame_to_columns(df))
+        for name in df.columns if not df.empty else []:
+            if name not in PRICE_COLUMNS:
+                candles.indicators[name] = df[name].to_numpy(dtype=np.float64)
+        return candles
+
+    # --- Shape ---
+    def __len__(self):
+        return len(self.ts)
+
+    @property
+    def empty(self):
+        return len(self.ts) == 0
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in STORED_COLUMNS) + \
+            sum(values.nbytes for values in self.indicators.values())
+
+    def slice(self, start=None, stop=None):
+        window = slice(start, stop)
+        return Candles(*(getattr(self, name)[window] for name in STORED_COLUMNS),
+                       indicators={name: values[window] for name, values in self.indicators.items()})
+
+    def since(self, from_ts):
+        # Bars at or after epoch second from_ts (a view)
+        return self.slice(int(np.searchsorted(self.ts, int(-(-from_ts // 60)), side="left")))
+
+    def last_days(self, days, now=None):
+        now = pd.Timestamp.now(tz="UTC").timestamp() if now is None else now
+        return self.since(now - days * 86400)
+
+    # --- Widening (copies, on demand) ---
+    def ts_seconds(self):
+        return np.asarray(self.ts, dtype=np.int64) * 60
+
+    def columns(self):
+        return decode_columns({name: getattr(self, name) for name in STORED_COLUMNS})
+
+    def to_frame(self):
+        df = columns_to_frame(self.columns())
+        for name, values in self.indicators.items():
+            df[name] = values
+        return df
+
+    # --- Indicators ---
+    def add_trend_indicators(self):
+        # EMA_50 / EMA_200 as get_stock_data adds them (Series.ewm(adjust=False))
+        from indicator_panel import ema
+        close, start = self.columns()["close"][None, :], np.zeros(1, dtype=np.int64)
+        for length in (50, 200):
+            self.indicators[f"EMA_{length}"] = ema(close, start, length, sma_seed=False)[0]
+        return self
+
+    def add_indicators(self):
+        # Full add_panel_indicators set over a one-row panel; results are views of its rows
+        if self.empty:
+            return self
+        from indicator_panel import build_panel_from_columns, add_panel_indicators, INDICATOR_COLUMNS
+        panel = add_panel_indicators(build_panel_from_columns({"_": self.columns()}))
+        for name in INDICATOR_COLUMNS:
+            self.indicators[name] = panel[name][0]
+        return self
+
+if __name__ == "__main__":
+    trimmed, removed = compact_store()
+    print(f"🧹 Candle store compacted: {trimmed} series trimmed or upgraded, {removed} removed")
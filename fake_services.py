@@ -0,0 +1,462 @@
+# fake_services.py
+# 🧪 Offline stand-ins for SmartAPI, Screener.in and Telegram (for benchmarks and dry runs)
+#
+# FakeSmartConnect serves deterministic synthetic candles (or recorded ones) with
+# configurable latency and rate limiting. start_fake_http_server() runs a local
+# HTTP server that answers Screener company pages and Telegram sendMessage calls;
+# point SCREENER_BASE_URL / TELEGRAM_API_URL at its base_url. start_fake_tick_feed()
+# replays a session of synthetic ticks over a local websocket in SmartAPI's binary
+# QUOTE format; point SMARTAPI_FEED_URL at its url.
+
+import json
+import math
+import time
+import base64
+import random
+import struct
+import hashlib
+import threading
+import socketserver
+from collections import deque
+from urllib.parse import parse_qs
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pandas as pd
+
+INTERVAL_MINUTES = {
+    "ONE_MINUTE": 1, "FIVE_MINUTE": 5, "FIFTEEN_MINUTE": 15,
+    "THIRTY_MINUTE": 30, "ONE_HOUR": 60, "ONE_DAY": 375,
+}
+SESSION_OPEN = 9 * 60 + 15
+SESSION_CLOSE = 15 * 60 + 30
+RATE_LIMIT_RESPONSE = {
+    "status": False, "message": "Access denied because of exceeding access rate",
+    "errorcode": "AB1004", "data": None,
+}
+
+# --- Synthetic candles ---
+def _noise(token, idx, salt):
+    # Cheap deterministic hash noise in [0, 1) so repeated fetches agree bar for bar
+    h = (idx * 2654435761 + token * 40503 + salt * 97) % 4294967296
+    h = (h ^ (h >> 13)) * 1274126177 % 4294967296
+    return h / 4294967296.0
+
+def session_bar_times(from_dt, to_dt, minutes):
+    # NSE bar open times (weekdays, 09:15–15:30) within [from_dt, to_dt]
+    if minutes >= SESSION_CLOSE - SESSION_OPEN:
+        days = pd.date_range(from_dt.date(), to_dt.date(), freq="D")
+        return [d + timedelta(minutes=SESSION_OPEN) for d in days if d.weekday() < 5
+                and from_dt <= d + timedelta(minutes=SESSION_OPEN) <= to_dt]
+    times = []
+    day = datetime(from_dt.year, from_dt.month, from_dt.day)
+    while day <= to_dt:
+        if day.weekday() < 5:
+            for m in range(SESSION_OPEN, SESSION_CLOSE, minutes):
+                t = day + timedelta(minutes=m)
+                if from_dt <= t <= to_dt:
+                    times.append(t)
+        day += timedelta(days=1)
+    return times
+
+def synthetic_candles(token, times, minutes=15):
+    token = int(token) if str(token).isdigit() else sum(map(ord, str(token)))
+    base = 50 + token % 950
+    rows = []
+    for t in times:
+        idx = int(t.timestamp() // (minutes * 60))
+        wave = math.sin(idx / 37.0 + token) * 0.04 + math.sin(idx / 211.0 + token / 7) * 0.08
+        close = base * (1 + wave + (_noise(token, idx, 1) - 0.5) * 0.01)
+        open_ = close * (1 + (_noise(token, idx, 2) - 0.5) * 0.01)
+        high = max(open_, close) * (1 + _noise(token, idx, 3) * 0.004)
+        low = min(open_, close) * (1 - _noise(token, idx, 4) * 0.004)
+        volume = int(20000 + _noise(token, idx, 5) * 1500000)
+        rows.append([t.strftime("%Y-%m-%dT%H:%M:%S+05:30"),
+                     round(open_, 2), round(high, 2), round(low, 2), round(close, 2), volume])
+    return rows
+
+# --- Fake SmartConnect ---
+class FakeSmartConnect:
+    # Credentials SmartWebSocketV2 sends as headers, as a logged-in SmartConnect carries them
+    api_key, userId, access_token, feed_token = "fake-key", "FAKE", "fake-jwt", "fake-feed"
+
+    def __init__(self, latency=0.0, jitter=0.0, rate_per_sec=None, recorded_path=None,
+                 error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_per_sec = rate_per_sec
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.recorded = {}
+        if recorded_path:
+            with open(recorded_path) as f:
+                self.recorded = json.load(f)  # {token: [[ts, o, h, l, c, v], ...]}
+        self.calls = 0
+        self.rate_limited = 0
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.calls += 1
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] >= 1.0:
+                self._recent.popleft()
+            limited = self.rate_per_sec is not None and len(self._recent) >= self.rate_per_sec
+            if limited:
+                self.rate_limited += 1
+            else:
+                self._recent.append(now)
+            failed = self.error_rate and self.random.random() < self.error_rate
+        delay = self.latency + (self.random.random() * self.jitter if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise ConnectionError("Simulated transient network error")
+        return limited
+
+    # --- Session ---
+    def generateSession(self, clientCode, password, totp):
+        self._enter()
+        return {"status": True, "data": {"clientcode": clientCode, "jwtToken": "Bearer fake-jwt",
+                                         "refreshToken": "fake-refresh", "feedToken": "fake-feed"}}
+
+    def getProfile(self, refreshToken):
+        return {"status": True, "data": {"clientcode": "FAKE"}}
+
+    # --- Historical candles ---
+    def getCandleData(self, historicDataParams):
+        if self._enter():
+            return dict(RATE_LIMIT_RESPONSE)
+        p = historicDataParams
+        from_dt = datetime.strptime(p["fromdate"], "%Y-%m-%d %H:%M")
+        to_dt = datetime.strptime(p["todate"], "%Y-%m-%d %H:%M")
+        token = str(p["symboltoken"])
+
+        if token in self.recorded:
+            lo, hi = from_dt.strftime("%Y-%m-%dT%H:%M"), to_dt.strftime("%Y-%m-%dT%H:%M")
+            data = [row for row in self.recorded[token] if lo <= row[0][:16] <= hi]
+        else:
+            minutes = INTERVAL_MINUTES[p["interval"]]
+            data = synthetic_candles(token, session_bar_times(from_dt, to_dt, minutes), minutes)
+        return {"status": True, "message": "SUCCESS", "errorcode": "", "data": data}
+
+    # --- Bulk quotes ---
+    def getMarketData(self, mode, exchangeTokens):
+        # Latest session's synthetic candles summarised per token; ~5% of tokens report no
+        # trades (as suspended scrips do) so pre-screens have something to drop
+        if self._enter():
+            return dict(RATE_LIMIT_RESPONSE)
+        now = datetime.now()
+        fetched = []
+        for exchange, tokens in exchangeTokens.items():
+            for token in tokens:
+                rows = synthetic_candles(token, session_bar_times(now - timedelta(days=7), now, 15))
+                day = [row for row in rows if row[0][:10] == rows[-1][0][:10]] if rows else []
+                previous = [row for row in rows if row[0][:10] < day[0][0][:10]] if day else []
+                if not previous:
+                    continue
+                traded = _noise(int(token), 0, 9) >= 0.05
+                ltp, prev_close = day[-1][4], previous[-1][4]  # SmartAPI's "close" is the previous close
+                fetched.append({
+                    "exchange": exchange, "symbolToken": str(token), "ltp": ltp,
+                    "open": day[0][1], "high": max(r[2] for r in day), "low": min(r[3] for r in day),
+                    "close": prev_close, "netChange": round(ltp - prev_close, 2),
+                    "percentChange": round((ltp - prev_close) / prev_close * 100, 2),
+                    "tradeVolume": sum(r[5] for r in day) if traded else 0,
+                })
+        return {"status": True, "message": "SUCCESS", "errorcode": "",
+                "data": {"fetched": fetched, "unfetched": []}}
+
+# --- Fake Screener + Telegram HTTP endpoints ---
+SCREENER_METRICS = ["ROE", "Stock P/E", "Debt to equity", "Promoter holding",
+                    "Valuation", "Growth", "Red Flags"]
+
+def fake_screener_page(symbol):
+    seed = sum(map(ord, symbol))
+    items = "".join(
+        f'<li><span class="name">{label}</span><span class="number">{(seed * (i + 3)) % 40 + 1}.{i}</span></li>'
+        for i, label in enumerate(SCREENER_METRICS)
+    )
+    return f"<html><body><h1>{symbol}</h1><ul id='top-ratios'>{items}</ul></body></html>"
+
+class FakeHTTPServices:
+    def __init__(self, latency=0.0, telegram_rate_per_sec=None):
+        self.latency = latency
+        self.telegram_rate_per_sec = telegram_rate_per_sec
+        self.messages = []
+        self.requests = {"screener": 0, "telegram": 0, "telegram_429": 0}
+        self._sent = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def _handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, code, body, content_type="application/json", headers=None):
+                payload = body.encode()
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                if services.latency:
+                    time.sleep(services.latency)
+                parts = [p for p in self.path.split("/") if p]
+                if len(parts) >= 2 and parts[0] == "company":
+                    with services._lock:
+                        services.requests["screener"] += 1
+                    page = fake_screener_page(parts[1])
+                    etag = f'"{hash(page) & 0xffffffff:08x}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.end_headers()
+                        return
+                    self._reply(200, page, "text/html", {"ETag": etag})
+                else:
+                    self._reply(404, "not found", "text/plain")
+
+            def do_POST(self):
+                if services.latency:
+                    time.sleep(services.latency)
+                length = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(length).decode()
+                if "json" in self.headers.get("Content-Type", ""):
+                    payload = json.loads(raw or "{}")
+                else:
+                    payload = {k: v[0] for k, v in parse_qs(raw).items()}
+                if not self.path.endswith("/sendMessage"):
+                    self._reply(404, json.dumps({"ok": False}))
+                    return
+                code, body = services._telegram(payload)
+                self._reply(code, json.dumps(body))
+
+        return Handler
+
+    def _telegram(self, payload):
+        chat_id = str(payload.get("chat_id"))
+        with self._lock:
+            self.requests["telegram"] += 1
+            now = time.monotonic()
+            sent = self._sent.setdefault(chat_id, deque())
+            while sent and now - sent[0] >= 1.0:
+                sent.popleft()
+            if self.telegram_rate_per_sec is not None and len(sent) >= self.telegram_rate_per_sec:
+                self.requests["telegram_429"] += 1
+                return 429, {"ok": False, "error_code": 429,
+                             "description": "Too Many Requests: retry after 1",
+                             "parameters": {"retry_after": 1}}
+            sent.append(now)
+            self.messages.append(payload)
+        return 200, {"ok": True, "result": {"message_id": len(self.messages)}}
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def start_fake_http_server(latency=0.0, telegram_rate_per_sec=None):
+    return FakeHTTPServices(latency, telegram_rate_per_sec).start()
+
+# --- Fake SmartAPI tick feed (smart-stream websocket) ---
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+QUOTE_MODE = 2
+# mode, exchange type, token, sequence, exchange ts (ms), LTP, LTQ, avg price, day volume,
+# total buy/sell qty, day open/high/low, previous close; prices in paise, little-endian
+QUOTE_PACKET = struct.Struct("<BB25sqqqqqqddqqqq")
+TICK_OFFSETS = (0.0, 0.25, 0.6, 0.97)  # open, first extreme, second extreme, close within a bar
+
+def replay_session(now=None):
+    # Latest weekday whose 09:15–15:30 session is over (naive market time, as session_bar_times)
+    now = now or datetime.now()
+    day = datetime(now.year, now.month, now.day)
+    if now < day + timedelta(minutes=SESSION_CLOSE):
+        day -= timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+def quote_packet(token, seq, ts_ms, ltp, ltq, avg_price, day_volume, day_open, day_high, day_low, prev_close):
+    paise = lambda price: int(round(price * 100))
+    return QUOTE_PACKET.pack(QUOTE_MODE, 1, str(token).encode(), seq, ts_ms, paise(ltp), ltq, paise(avg_price),
+                             day_volume, 0.0, 0.0, paise(day_open), paise(day_high), paise(day_low), paise(prev_close))
+
+def synthetic_ticks(token, session):
+    # One session's ticks for a token, four per synthetic 15-minute bar so that aggregating
+    # them rebuilds the bar exactly, plus a closing-price tick just after 15:30.
+    # Rows: (ts_ms, token, ltp, ltq, avg_price, day_volume, day_open, day_high, day_low, prev_close)
+    rows = synthetic_candles(token, session_bar_times(session - timedelta(days=7), session + timedelta(days=1), 15))
+    day = [row for row in rows if row[0][:10] == session.strftime("%Y-%m-%d")]
+    previous = [row for row in rows if row[0][:10] < session.strftime("%Y-%m-%d")]
+    if not day:
+        return []
+    prev_close = previous[-1][4] if previous else day[0][1]
+    ticks, day_volume, turnover, high, low = [], 0, 0.0, day[0][1], day[0][1]
+    for stamp, open_, bar_high, bar_low, close, volume in day:
+        start_ms = int(pd.Timestamp(stamp).timestamp() * 1000)
+        path = [open_, bar_low, bar_high, close] if close >= open_ else [open_, bar_high, bar_low, close]
+        parts = [volume // 4] * 3 + [volume - 3 * (volume // 4)]
+        for offset, price, qty in zip(TICK_OFFSETS, path, parts):
+            day_volume += qty
+            turnover += qty * price
+            high, low = max(high, price), min(low, price)
+            ticks.append((start_ms + int(offset * 900000), token, price, qty, turnover / day_volume,
+                          day_volume, day[0][1], high, low, prev_close))
+    close_ms = int(pd.Timestamp(f"{session:%Y-%m-%d}T15:30:05+05:30").timestamp() * 1000)  # FakeTickFeed.session_end
+    ticks.append((close_ms, token, day[-1][4], 0, turnover / day_volume, day_volume, day[0][1], high, low, prev_close))
+    return ticks
+
+def _recv_exact(sock, n):
+    data = b""
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+def _read_ws_frame(sock):
+    # (opcode, payload) of one client frame (always masked), or None when the socket closes
+    header = _recv_exact(sock, 2)
+    if header is None:
+        return None
+    length = header[1] & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", _recv_exact(sock, 2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", _recv_exact(sock, 8))[0]
+    mask = _recv_exact(sock, 4) if header[1] & 0x80 else b"\0\0\0\0"
+    payload = _recv_exact(sock, length) if length else b""
+    if mask is None or payload is None:
+        return None
+    return header[0] & 0x0F, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+def _ws_frame(opcode, payload):
+    if len(payload) < 126:
+        header = struct.pack("!BB", 0x80 | opcode, len(payload))
+    elif len(payload) < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, len(payload))
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, len(payload))
+    return header + payload
+
+class FakeTickFeed:
+    # Local stand-in for SmartAPI's smart-stream websocket: answers subscribe requests by
+    # replaying one session's synthetic ticks for the subscribed tokens, `speed` times
+    # faster than real time, as QUOTE-mode binary packets. Answers pings; ignores the rest.
+    def __init__(self, session=None, speed=60.0):
+        self.session = session or replay_session()
+        self.speed = speed
+        self.session_start = pd.Timestamp(f"{self.session:%Y-%m-%d}T09:15:00+05:30").timestamp()
+        self.session_end = pd.Timestamp(f"{self.session:%Y-%m-%d}T15:30:05+05:30").timestamp()  # closing ticks
+        self.headers = {}
+        self.subscribed = set()
+        self.ticks_sent = 0
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"ws://127.0.0.1:{self.server.server_address[1]}/smart-stream"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def _handler(self):
+        feed = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                sock, send_lock = self.request, threading.Lock()
+                if not feed._handshake(sock):
+                    return
+                while True:
+                    frame = _read_ws_frame(sock)
+                    if frame is None:
+                        return
+                    opcode, payload = frame
+                    if opcode == 0x8:
+                        feed._send(sock, send_lock, 0x8, payload[:2])
+                        return
+                    if opcode == 0x9:
+                        feed._send(sock, send_lock, 0xA, payload)
+                    elif opcode == 0x1 and payload != b"ping":
+                        request = json.loads(payload)
+                        if request.get("action") == 1 and request["params"]["mode"] == QUOTE_MODE:
+                            tokens = [str(t) for entry in request["params"]["tokenList"] for t in entry["tokens"]]
+                            threading.Thread(target=feed._replay, args=(sock, send_lock, tokens), daemon=True).start()
+
+        return Handler
+
+    def _handshake(self, sock):
+        request = b""
+        while b"\r\n\r\n" not in request:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return False
+            request += chunk
+        lines = request.split(b"\r\n\r\n")[0].decode().split("\r\n")
+        self.headers = {k.strip().lower(): v.strip() for k, _, v in (line.partition(":") for line in lines[1:])}
+        key = self.headers.get("sec-websocket-key", "")
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        sock.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        return True
+
+    def _send(self, sock, send_lock, opcode, payload):
+        with send_lock:
+            sock.sendall(_ws_frame(opcode, payload))
+
+    def _replay(self, sock, send_lock, tokens):
+        tokens = [t for t in tokens if t not in self.subscribed]
+        self.subscribed.update(tokens)
+        ticks = sorted((tick for token in tokens for tick in synthetic_ticks(token, self.session)),
+                       key=lambda tick: tick[0])
+        if not ticks:
+            return
+        first_ms, started = ticks[0][0], time.monotonic()
+        try:
+            for seq, tick in enumerate(ticks, start=1):
+                delay = (tick[0] - first_ms) / 1000 / self.speed - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+                self._send(sock, send_lock, 0x2, quote_packet(tick[1], seq, tick[0], *tick[2:]))
+                self.ticks_sent += 1
+        except OSError:
+            pass  # client went away
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def start_fake_tick_feed(session=None, speed=60.0):
+    return FakeTickFeed(session, speed).start()
+
+# --- Synthetic universe files ---
+def write_fake_universe(n_symbols, master_path, losers_path=None, positions_path=None, n_positions=10):
+    symbols = [f"FAKE{i:04d}" for i in range(n_symbols)]
+    pd.DataFrame({
+        "symbol": symbols,
+        "token": np.arange(10001, 10001 + n_symbols),
+        "instrumenttype": "EQ",
+        "exchange": "NSE",
+    }).to_csv(master_path, index=False)
+    if losers_path:
+        pd.DataFrame({"symbol": symbols}).to_csv(losers_path, index=False)
+    if positions_path:
+        pd.DataFrame({"symbol": symbols[:n_positions]}).to_csv(positions_path, index=False)
+    return symbols
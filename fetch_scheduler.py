@@ -0,0 +1,122 @@
+# fetch_scheduler.py
+# ⏱️ Concurrent SmartAPI fetches governed by token-bucket rate limits (replaces fixed sleeps)
+
+import os
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import metrics
+
+try:
+    from SmartApi.smartExceptions import NetworkException, DataException
+except ImportError:
+    NetworkException = DataException = None  # SDK not installed: only the generic network errors apply
+
+logger = logging.getLogger(__name__)
+
+# SmartAPI historical data quotas (getCandleData): 3 req/sec, 180 req/min
+CANDLE_RATE_PER_SEC = float(os.getenv("SMARTAPI_CANDLE_RATE_PER_SEC", "3"))
+CANDLE_RATE_PER_MIN = float(os.getenv("SMARTAPI_CANDLE_RATE_PER_MIN", "180"))
+FETCH_WORKERS = int(os.getenv("SMARTAPI_FETCH_WORKERS", "4"))
+MAX_RETRIES = int(os.getenv("SMARTAPI_MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.getenv("SMARTAPI_BACKOFF_BASE", "1.0"))
+
+RATE_LIMIT_MARKERS = ("access rate", "rate limit", "too many requests", "ab1004")
+
+class RateLimitError(Exception):
+    pass
+
+# Worth retrying: network failures, timeouts and rate limiting. The SDK raises NetworkException
+# for gateway trouble and DataException when a throttled gateway answers with non-JSON.
+# Anything else (auth, bad params, a KeyError/TypeError on the response shape) fails at once.
+TRANSIENT_ERRORS = tuple(e for e in (RateLimitError, ConnectionError, TimeoutError,
+                                     requests.ConnectionError, requests.Timeout,
+                                     NetworkException, DataException) if e is not None)
+
+# --- Token bucket ---
+class TokenBucket:
+    def __init__(self, rate, per_seconds, capacity=None):
+        self.rate = rate / per_seconds
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        # Take one token now (possibly going negative) and return how long to wait for it
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+class RateLimiter:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # Reserve from every bucket atomically so the strictest quota decides the wait
+        with self.lock:
+            wait = max(bucket.reserve() for bucket in self.buckets)
+        if wait > 0:
+            time.sleep(wait)
+
+def candle_rate_limiter(per_sec=CANDLE_RATE_PER_SEC, per_min=CANDLE_RATE_PER_MIN):
+    return RateLimiter([TokenBucket(per_sec, 1), TokenBucket(per_min, 60)])
+
+candle_limiter = candle_rate_limiter()
+
+# --- Retry with exponential backoff ---
+def is_rate_limit_response(response):
+    if not isinstance(response, dict) or response.get("status"):
+        return False
+    text = f"{response.get('message', '')} {response.get('errorcode', '')}".lower()
+    return any(marker in text for marker in RATE_LIMIT_MARKERS)
+
+def call_with_retry(fn, limiter=None, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE):
+    limiter = limiter or candle_limiter
+    for attempt in range(max_retries + 1):
+        with metrics.stage("rate_limit_wait"):
+            limiter.acquire()
+        metrics.incr("api_calls")
+        started = time.perf_counter()
+        try:
+            response = fn()
+            metrics.observe("api_latency_seconds", time.perf_counter() - started)
+            if is_rate_limit_response(response):
+                metrics.incr("api_rate_limited")
+                raise RateLimitError(response.get("message", "rate limited"))
+            return response
+        except Exception as e:
+            metrics.incr("api_errors")
+            if attempt == max_retries or not isinstance(e, TRANSIENT_ERRORS):
+                raise
+            metrics.incr("api_retries")
+            delay = backoff_base * (2 ** attempt) * (1 + random.random())
+            logger.warning(f"Retrying after {type(e).__name__}: {str(e)} (attempt {attempt + 1}, sleeping {delay:.1f}s)")
+            with metrics.stage("retry_backoff"):
+                time.sleep(delay)
+
+# --- Concurrent fetch ---
+def fetch_many(items, fetch_fn, max_workers=FETCH_WORKERS):
+    # Run fetch_fn(item) across a thread pool; results come back in input order.
+    # The rate limiter, not the pool size, sets the overall request rate.
+    items = list(items)
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+        return list(pool.map(fetch_fn, items))
@@ -1,17 +1,15 @@
 import pandas as pd
-import requests
+import telegram_dispatcher
+import alert_store
+import metrics
 
 TELEGRAM_TOKEN = "YOUR TELEGRAM TOKEN"
 CHAT_ID = "TELEGRAM CHAT ID"
+STOCK_ALERT = "stock_alert"  # alert_store type for the per-stock messages
 
 def send_to_telegram(message):
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-    payload = {
-        "chat_id": CHAT_ID,
-        "text": message,
-        "parse_mode": "HTML"
-    }
-    requests.post(url, data=payload)
+    # Queued; the dispatcher packs consecutive alerts into as few messages as fit
+    telegram_dispatcher.send(message, TELEGRAM_TOKEN, CHAT_ID)
 
 def generate_comment(row):
     comments = []
@@ -43,38 +41,49 @@ def generate_comment(row):
     except:
         comments.append("🔻 MACD data missing ❌")
 
+    # Missing fundamentals arrive as None from the pipeline and NaN from the CSV chain
     try:
-        roe = float(row.get("ROE", 0))
-        if roe < 13:
-            comments.append("🔻 ROE below 13 ❌ (Low profitability)")
-            if "✅" in action:
-                action = "⚠️ Watchlist Only – Weak fundamentals"
-        else:
-            comments.append("🔸 ROE is strong ✅")
-    except:
+        roe = float(row.get("ROE"))
+    except (TypeError, ValueError):
+        roe = None
+    if roe is None or pd.isna(roe):
         comments.append("🔻 ROE not available ❌")
+    elif roe < 13:
+        comments.append("🔻 ROE below 13 ❌ (Low profitability)")
+        if "✅" in action:
+            action = "⚠️ Watchlist Only – Weak fundamentals"
+    else:
+        comments.append("🔸 ROE is strong ✅")
 
     comments.append(f"\n📝 Action: <b>{action}</b>")
     return "\n".join(comments), action
 
-# Load data
-df = pd.read_csv("enriched_bullish_signals.csv")
-
-# Generate comments and actions
-comment_texts = []
-for idx, row in df.iterrows():
+def report_row(row):
+    # Comment on one enriched candidate and queue its alert if it qualifies and wasn't
+    # already sent within the candidate cooldown (once per day by default)
     comment, action = generate_comment(row)
-    comment_texts.append(comment)
+    if "✅ Consider for Entry" not in comment:
+        return comment, False
+    store = alert_store.get_store()
+    if not store.filter_new([row["symbol"]], STOCK_ALERT, alert_store.CANDIDATE_COOLDOWN):
+        metrics.incr("alerts_suppressed")
+        print(f"🔕 {row['symbol']}: stock alert already sent recently; not re-sending")
+        return comment, False
+    send_to_telegram(f"<b>📈 Stock Alert: {row['symbol']}</b>\n\n{comment}")
+    store.log_many([(row["symbol"], STOCK_ALERT)])
+    return comment, True
+
+def main():
+    # Load data
+    df = pd.read_csv("enriched_bullish_signals.csv")
 
-df["comments"] = comment_texts
-df.to_csv("final_bullish_signals_with_comments.csv", index=False, encoding='utf-8-sig')
-print("✅ Final file saved with comments.")
+    # Comment every row and send only qualified alerts, in one pass
+    df["comments"] = [report_row(row)[0] for row in df.to_dict("records")]
+    df.to_csv("final_bullish_signals_with_comments.csv", index=False, encoding='utf-8-sig')
+    print("✅ Final file saved with comments.")
 
-# Send only qualified alerts
-for _, row in df.iterrows():
-    if "✅ Consider for Entry" not in row["comments"]:
-        continue
-    message = f"<b>📈 Stock Alert: {row['symbol']}</b>\n\n{row['comments']}"
-    send_to_telegram(message)
+    telegram_dispatcher.flush()
+    print("✅ Alerts sent to Telegram.")
 
-print("✅ Alerts sent to Telegram.")
+if __name__ == "__main__":
+    main()
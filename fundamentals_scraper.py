@@ -1,55 +1,169 @@
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import re
 import time
+import os
+import json
+import threading
+from urllib.parse import quote
+import metrics
+from fetch_scheduler import TokenBucket, RateLimiter, fetch_many
 
-def fetch_fundamentals(stock):
-    url = f"https://www.screener.in/company/{stock}/"
-    headers = {"User-Agent": "Mozilla/5.0"}
+SCREENER_BASE_URL = os.getenv("SCREENER_BASE_URL", "https://www.screener.in")
+CACHE_DIR = os.path.join(os.getenv("MACD_CACHE_DIR", ".cache"), "fundamentals")
+CACHE_TTL_DAYS = float(os.getenv("FUNDAMENTALS_TTL_DAYS", "7"))
+SCREENER_WORKERS = int(os.getenv("SCREENER_WORKERS", "3"))
+SCREENER_MIN_INTERVAL = float(os.getenv("SCREENER_MIN_INTERVAL", "1.5"))  # seconds between requests to the host
+
+# Output column → label searched for on the Screener page
+METRIC_LABELS = {
+    "ROE": "ROE",
+    "P/E": "P/E",
+    "D/E": "Debt to equity",
+    "Promoter Holding": "Promoter holding",
+    "Valuation": "Valuation",
+    "Growth": "Growth",
+    "Red Flags": "Red Flags",
+}
+METRIC_PATTERNS = {key: re.compile(label, re.I) for key, label in METRIC_LABELS.items()}
+
+# One polite limiter and one pooled session shared by every worker
+screener_limiter = RateLimiter([TokenBucket(1, SCREENER_MIN_INTERVAL, capacity=1)])
+_session = None
+_session_lock = threading.Lock()
+
+def _get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(SCREENER_WORKERS, 1))
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _session.headers.update({"User-Agent": "Mozilla/5.0"})
+        return _session
+
+# --- Parsing (single pass over the page's spans) ---
+def parse_fundamentals(html):
+    soup = BeautifulSoup(html, "html.parser")
+    spans = soup.find_all("span")
+    values = dict.fromkeys(METRIC_LABELS)
+    pending = dict(METRIC_PATTERNS)
+
+    # The first span whose text matches a label wins; its value is the next span
+    for i, span in enumerate(spans):
+        if not pending:
+            break
+        text = span.string
+        if text is None:
+            continue
+        for key, pattern in list(pending.items()):
+            if pattern.search(text):
+                del pending[key]
+                if i + 1 < len(spans):
+                    values[key] = spans[i + 1].text.strip().replace('%', '').replace(',', '')
+    return values
+
+# --- On-disk TTL cache ---
+def _cache_path(stock):
+    return os.path.join(CACHE_DIR, f"{quote(str(stock), safe='')}.json")
+
+def _read_cache(stock):
+    try:
+        with open(_cache_path(stock)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_cache(stock, entry):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = _cache_path(stock) + f".{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, _cache_path(stock))
+
+def _is_fresh(entry, ttl_days):
+    return entry is not None and time.time() - entry.get("fetched_at", 0) < ttl_days * 86400
+
+# --- Fetch ---
+def fetch_fundamentals(stock, ttl_days=None):
+    ttl_days = CACHE_TTL_DAYS if ttl_days is None else ttl_days
+    cached = _read_cache(stock)
+    if _is_fresh(cached, ttl_days):
+        metrics.incr("fundamentals_cache_hit")
+        return cached["data"]
+
+    url = f"{SCREENER_BASE_URL}/company/{stock}/"
+    headers = {}
+    if cached:
+        # Expired entry: let the server answer 304 if the page hasn't changed
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
 
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        screener_limiter.acquire()
+        started = time.perf_counter()
+        with metrics.stage("fundamentals_fetch"):
+            response = _get_session().get(url, headers=headers, timeout=10)
+        metrics.observe("fundamentals_latency_seconds", time.perf_counter() - started)
+        if response.status_code == 304 and cached:
+            metrics.incr("fundamentals_not_modified")
+            cached["fetched_at"] = time.time()
+            _write_cache(stock, cached)
+            return cached["data"]
         if response.status_code != 200:
+            metrics.incr(f"screener_http_{response.status_code}")
             return None
     except:
+        metrics.incr("screener_errors")
         return None
 
-    soup = BeautifulSoup(response.text, "html.parser")
+    metrics.incr("fundamentals_cache_miss")
+    with metrics.stage("fundamentals_parse"):
+        data = parse_fundamentals(response.text)
+    _write_cache(stock, {
+        "fetched_at": time.time(),
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "data": data,
+    })
+    return data
 
-    def get_metric(label):
-        try:
-            span = soup.find("span", string=re.compile(label, re.I))
-            if span:
-                return span.find_next("span").text.strip().replace('%', '').replace(',', '')
-        except:
-            return None
-        return None
+def fetch_many_fundamentals(symbols, max_workers=SCREENER_WORKERS):
+    # Bounded concurrency; the shared limiter keeps the host request rate polite
+    def fetch(symbol):
+        print(f"Fetching: {symbol}")
+        return fetch_fundamentals(symbol)
+
+    symbols = list(symbols)
+    return dict(zip(symbols, fetch_many(symbols, fetch, max_workers=max_workers)))
+
+def enrich(df):
+    # Merge fundamentals onto a candidates DataFrame with a 'symbol' column
+    enriched_data = []
+    for symbol, data in fetch_many_fundamentals(df["symbol"]).items():
+        if data:
+            enriched_data.append({**{"symbol": symbol}, **data})
+        else:
+            metrics.skip(symbol, "no_fundamentals")
+
+    fund_df = pd.DataFrame(enriched_data, columns=["symbol", *METRIC_LABELS])
+    return df.merge(fund_df, on="symbol", how="left")
+
+def main():
+    # Load MACD candidates
+    df = pd.read_csv("potential_bullish_crossover.csv")
+
+    # Fetch fundamentals (cached, concurrent) and merge
+    final_df = enrich(df)
+    final_df.to_csv("enriched_bullish_signals.csv", index=False, encoding='utf-8-sig')
+    print("✅ Enriched file saved: enriched_bullish_signals.csv")
 
-    return {
-        "ROE": get_metric("ROE"),
-        "P/E": get_metric("P/E"),
-        "D/E": get_metric("Debt to equity"),
-        "Promoter Holding": get_metric("Promoter holding"),
-        "Valuation": get_metric("Valuation"),
-        "Growth": get_metric("Growth"),
-        "Red Flags": get_metric("Red Flags")
-    }
-
-# Load MACD candidates
-df = pd.read_csv("potential_bullish_crossover.csv")
-
-# Fetch fundamentals
-enriched_data = []
-for symbol in df["symbol"]:
-    print(f"Fetching: {symbol}")
-    data = fetch_fundamentals(symbol)
-    if data:
-        enriched_data.append({**{"symbol": symbol}, **data})
-    time.sleep(1.5)  # to avoid Screener blocking you
-
-# Merge and save
-fund_df = pd.DataFrame(enriched_data)
-final_df = df.merge(fund_df, on="symbol", how="left")
-final_df.to_csv("enriched_bullish_signals.csv", index=False, encoding='utf-8-sig')
-print("✅ Enriched file saved: enriched_bullish_signals.csv")
+if __name__ == "__main__":
+    with metrics.profiled("fundamentals"):
+        main()
+    metrics.write_summary("fundamentals")
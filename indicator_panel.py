@@ -0,0 +1,151 @@
+# indicator_panel.py
+# 🧮 Batched indicators over a symbols × bars panel (NumPy 2D, one pass for the whole universe)
+#
+# Series are right-aligned (the last column is every symbol's latest bar) and
+# NaN-padded on the left. Results match add_technical_indicators (pandas_ta) and
+# the EMA_50/EMA_200 columns from get_stock_data. When the frames already carry
+# EMA_50/EMA_200 (get_stock_data computes them over the whole fetch, before the scan
+# cuts it to its 7-day window), those are kept instead of being recomputed on the window.
+
+import numpy as np
+import pandas as pd
+
+from candle_store import frame_to_columns, columns_to_frame, Candles
+
+PANEL_COLUMNS = ["open", "high", "low", "close", "volume"]
+INDICATOR_COLUMNS = ["EMA_5", "EMA_13", "EMA_21", "EMA_50", "EMA_200",
+                     "RSI_14", "MACD", "MACD_signal", "MACD_hist"]
+TREND_COLUMNS = ["EMA_50", "EMA_200"]  # may arrive precomputed over a longer history
+
+# --- Build ---
+def trend_columns(df):
+    # EMA_50/EMA_200 a frame or Candles already carries
+    source = df.indicators if isinstance(df, Candles) else df
+    return {name: np.asarray(source[name], dtype=np.float64) for name in TREND_COLUMNS if name in source}
+
+def build_panel(frames, min_bars=0):
+    # frames: {symbol: OHLCV DataFrame or Candles}. Symbols with fewer than min_bars rows are left out.
+    return build_panel_from_columns(
+        {symbol: {**frame_to_columns(df), **trend_columns(df)} for symbol, df in frames.items() if len(df)},
+        min_bars,
+    )
+
+def carried_columns(series):
+    # Trend columns every series carries (all or none, so a panel never mixes the two)
+    series = list(series)
+    return [name for name in TREND_COLUMNS if series and all(name in cols for cols in series)]
+
+def build_panel_from_columns(series, min_bars=0):
+    # series: {symbol: {"ts", "open", ..., "volume"} arrays}, e.g. straight from candle_store
+    items = [(symbol, cols) for symbol, cols in series.items()
+             if len(cols["ts"]) and len(cols["ts"]) >= min_bars]
+    n_bars = max((len(cols["ts"]) for _, cols in items), default=0)
+    n_sym = len(items)
+
+    panel = {
+        "symbols": [symbol for symbol, _ in items],
+        "start": np.zeros(n_sym, dtype=np.int64),
+        "ts": np.zeros((n_sym, n_bars), dtype=np.int64),
+    }
+    names = PANEL_COLUMNS + carried_columns(cols for _, cols in items)
+    for name in names:
+        panel[name] = np.full((n_sym, n_bars), np.nan)
+
+    for row, (_, cols) in enumerate(items):
+        start = n_bars - len(cols["ts"])
+        panel["start"][row] = start
+        panel["ts"][row, start:] = cols["ts"]
+        for name in names:
+            panel[name][row, start:] = cols[name]
+    return panel
+
+def panel_frame(panel, symbol):
+    # One symbol's rows as a DataFrame, for code that still wants the per-symbol shape
+    row = panel["symbols"].index(symbol)
+    start = panel["start"][row]
+    columns = {"ts": panel["ts"][row, start:]}
+    for name in PANEL_COLUMNS:
+        columns[name] = panel[name][row, start:]
+    df = columns_to_frame(columns)
+    df["volume"] = df["volume"].astype(np.int64)
+    for name in INDICATOR_COLUMNS:
+        if name in panel:
+            df[name] = panel[name][row, start:]
+    return df
+
+# --- Recursive kernels (loop over bars, vectorized across symbols) ---
+def ema(values, start, length, sma_seed=True):
+    # sma_seed=True mirrors pandas_ta.ema (SMA of the first `length` values as the seed);
+    # sma_seed=False mirrors Series.ewm(span=length, adjust=False).mean()
+    n_sym, n_bars = values.shape
+    out = np.full((n_sym, n_bars), np.nan)
+    if n_sym == 0 or n_bars == 0:
+        return out
+    alpha = 2.0 / (length + 1)
+    rows = np.arange(n_sym)
+
+    if sma_seed:
+        seed_col = start + length - 1
+        window = np.clip(start[:, None] + np.arange(length), 0, n_bars - 1)
+        seed = values[rows[:, None], window].mean(axis=1)
+    else:
+        seed_col = start.copy()
+        seed = values[rows, np.clip(start, 0, n_bars - 1)]
+
+    prev = np.full(n_sym, np.nan)
+    for t in range(n_bars):
+        step = ((1 - alpha) * prev + alpha * values[:, t]) / ((1 - alpha) + alpha)
+        cur = np.where(t > seed_col, step, np.where(t == seed_col, seed, np.nan))
+        out[:, t] = cur
+        prev = cur
+    return out
+
+def rma(values, first_obs, length):
+    # Series.ewm(alpha=1/length, min_periods=length).mean() (adjust=True), as pandas_ta.rma
+    n_sym, n_bars = values.shape
+    out = np.full((n_sym, n_bars), np.nan)
+    decay = 1.0 - 1.0 / length
+    weighted = np.full(n_sym, np.nan)
+    old_wt = np.ones(n_sym)
+    for t in range(n_bars):
+        cur = values[:, t]
+        first = t == first_obs
+        later = t > first_obs
+        old_wt = np.where(later, old_wt * decay, old_wt)
+        updated = (old_wt * weighted + cur) / (old_wt + 1.0)
+        weighted = np.where(first, cur, np.where(later, updated, weighted))
+        old_wt = np.where(first, 1.0, np.where(later, old_wt + 1.0, old_wt))
+        out[:, t] = np.where(t >= first_obs + length - 1, weighted, np.nan)
+    return out
+
+def rsi(close, start, length=14):
+    diff = np.full_like(close, np.nan)
+    diff[:, 1:] = close[:, 1:] - close[:, :-1]
+    positive = np.where(diff > 0, diff, np.where(np.isnan(diff), np.nan, 0.0))
+    negative = np.where(diff < 0, diff, np.where(np.isnan(diff), np.nan, 0.0))
+    positive_avg = rma(positive, start + 1, length)
+    negative_avg = rma(negative, start + 1, length)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return 100 * positive_avg / (positive_avg + np.abs(negative_avg))
+
+def macd(close, start, fast=12, slow=26, signal=9):
+    line = ema(close, start, fast) - ema(close, start, slow)
+    signal_line = ema(line, start + slow - 1, signal)
+    return line, signal_line, line - signal_line
+
+# --- Public entry point ---
+def add_panel_indicators(panel):
+    close, start = panel["close"], panel["start"]
+    panel["EMA_5"] = ema(close, start, 5)
+    panel["EMA_13"] = ema(close, start, 13)
+    panel["EMA_21"] = ema(close, start, 21)
+    for length in (50, 200):
+        if f"EMA_{length}" not in panel:  # else carried in from the full fetch
+            panel[f"EMA_{length}"] = ema(close, start, length, sma_seed=False)
+    panel["RSI_14"] = rsi(close, start, 14)
+    panel["MACD"], panel["MACD_signal"], panel["MACD_hist"] = macd(close, start)
+    return panel
+
+def latest(panel, name):
+    # Last-bar values of one panel column, indexed by symbol
+    return pd.Series(panel[name][:, -1] if panel[name].size else [], index=panel["symbols"], name=name)
@@ -2,7 +2,12 @@ import pandas as pd
 import numpy as np
 import pandas_ta as ta
 
+from candle_store import Candles, as_frame
+
+# These take a DataFrame or candle_store.Candles; Candles are widened to a frame first
+# (add_technical_indicators returns that frame), except where only the last bars are read.
 def add_technical_indicators(df):
+    df = as_frame(df)
     df['EMA_5'] = ta.ema(df['close'], length=5)
     df['EMA_13'] = ta.ema(df['close'], length=13)
     df['EMA_21'] = ta.ema(df['close'], length=21)
@@ -16,6 +21,8 @@ def add_technical_indicators(df):
 def get_engulfing_alerts(df):
     if len(df) < 2:
         return []
+    if isinstance(df, Candles):
+        df = df.slice(-2).to_frame()
     last = df.iloc[-1]
     prev = df.iloc[-2]
     alerts = []
@@ -58,6 +65,7 @@ def calculate_trend_strength(df):
     return (strength >= 0.66), round(strength, 2)
 
 def analyze_candle_strength(df):
+    df = as_frame(df)
     last = df.iloc[-1]
     body = abs(last['close'] - last['open'])
     range_ = last['high'] - last['low']
@@ -0,0 +1,131 @@
+# instrument_index.py
+# 🔎 Prebuilt scrip master index for O(1) symbol → token lookups (with fuzzy fallback)
+
+import os
+import re
+import pickle
+import logging
+from difflib import get_close_matches
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SCRIP_MASTER_PATH = os.getenv("SCRIP_MASTER_PATH", "MACD_EQ_Segment_ScripMaster.csv")
+CACHE_DIR = os.getenv("MACD_CACHE_DIR", ".cache")
+INDEX_CACHE_FILE = os.path.join(CACHE_DIR, "instrument_index.pkl")
+INDEX_VERSION = 1
+
+_index = None
+
+# --- Normalization (same rules the per-call lookup used) ---
+def normalize_master_symbol(symbol):
+    symbol = re.sub(r'[-.].*$', '', str(symbol))
+    return re.sub(r'[^A-Z0-9]', '', symbol).upper()
+
+def normalize_query_symbol(symbol):
+    return re.sub(r'[^A-Z0-9]', '', str(symbol).upper())
+
+# Padded bigrams: any pair with a difflib ratio >= 0.75 always shares one,
+# so the fuzzy fallback only has to score candidates from the index.
+def _bigrams(word):
+    padded = f"^{word}$"
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+def _source_key(path):
+    stat = os.stat(path)
+    return (INDEX_VERSION, os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+# --- Build ---
+def build_instrument_index(path=SCRIP_MASTER_PATH):
+    df = pd.read_csv(path)
+    symbols = df['symbol'].astype(str)
+    tokens = df['token'].astype(str)
+    types = df['instrumenttype'].astype(str).str.upper()
+    exchanges = df['exchange'].astype(str).str.upper()
+    normalized = (
+        symbols
+        .str.replace(r'[-.].*$', '', regex=True)
+        .str.replace(r'[^A-Z0-9]', '', regex=True)
+        .str.upper()
+    )
+
+    exact, first_any, ngrams = {}, {}, {}
+    for sym, norm, token, itype, exch in zip(symbols, normalized, tokens, types, exchanges):
+        if itype == "EQ" and exch == "NSE":
+            exact.setdefault(norm, token)
+        if norm not in first_any:
+            first_any[norm] = (sym, token)
+            for gram in _bigrams(norm):
+                ngrams.setdefault(gram, []).append(norm)
+
+    return {
+        "key": _source_key(path),
+        "exact": exact,
+        "first_any": first_any,
+        "ngrams": ngrams,
+    }
+
+def load_instrument_index(path=SCRIP_MASTER_PATH, use_cache=True):
+    key = _source_key(path)
+    if use_cache and os.path.exists(INDEX_CACHE_FILE):
+        try:
+            with open(INDEX_CACHE_FILE, "rb") as f:
+                cached = pickle.load(f)
+            if cached.get("key") == key:
+                return cached
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable instrument index cache: {str(e)}")
+
+    index = build_instrument_index(path)
+    if use_cache:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp_path = INDEX_CACHE_FILE + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, INDEX_CACHE_FILE)
+        except Exception as e:
+            logger.warning(f"Could not write instrument index cache: {str(e)}")
+    return index
+
+def get_instrument_index():
+    global _index
+    if _index is None:
+        _index = load_instrument_index()
+    return _index
+
+# --- Lookup ---
+def fuzzy_candidates(index, symbol_upper):
+    seen = set()
+    for gram in _bigrams(symbol_upper):
+        seen.update(index["ngrams"].get(gram, ()))
+    return seen
+
+def resolve_symbol(symbol, index=None, fuzzy=True):
+    index = index or get_instrument_index()
+    symbol_upper = normalize_query_symbol(symbol)
+
+    token = index["exact"].get(symbol_upper)
+    if token is not None:
+        return token
+
+    if fuzzy:
+        matches = get_close_matches(symbol_upper, fuzzy_candidates(index, symbol_upper), n=1, cutoff=0.75)
+        if matches:
+            fuzzy_match = matches[0]
+            print(f"ℹ️ Fuzzy matched '{symbol}' → '{fuzzy_match}'")
+            master_symbol, token = index["first_any"][fuzzy_match]
+            print(f"✅ Using token for {symbol} → {master_symbol}")
+            return token
+
+    logger.warning(f"⚠️ Token not found for {symbol}")
+    return None
+
+def resolve_many(symbols, index=None, fuzzy=True):
+    index = index or get_instrument_index()
+    resolved = {}
+    for symbol in symbols:
+        if symbol not in resolved:
+            resolved[symbol] = resolve_symbol(symbol, index=index, fuzzy=fuzzy)
+    return resolved
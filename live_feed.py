@@ -0,0 +1,343 @@
+# live_feed.py
+# 📡 Event-driven live scan: SmartAPI websocket ticks → 15-minute bars → incremental indicators
+#
+# Subscribes the universe in QUOTE mode on SmartWebSocketV2 and aggregates ticks into
+# 09:15-anchored 15-minute bars in memory (bar volume from the day's cumulative volume).
+# A bar closes as soon as any tick (or, live, the wall clock) passes its end; only the
+# symbols whose bar just closed have their IndicatorState advanced and are re-scored
+# (evaluate_bullish_candidate's rules, as panel_scoring applies them to many symbols in
+# one pass over the states' recent bars), so candidates are alerted moments after the
+# close instead of at the next cron run. States are warmed from stored/fetched candles
+# on start; a symbol whose first live bar was only partly seen is caught up over REST.
+# SMARTAPI_FEED_URL points the socket elsewhere, e.g. at fake_services' tick feed.
+# Usage: python live_feed.py [--replay [--speed 60]]   (or: python top_losers_macd_bot.py --live)
+
+import os
+import time
+import queue
+import signal
+import logging
+import argparse
+import threading
+
+import numpy as np
+from SmartApi.smartWebSocketV2 import SmartWebSocketV2
+
+from smart_login import get_smartapi_client
+from utils import get_stock_data
+from streaming_indicators import IndicatorState, BAR_FIELDS, INDICATOR_FIELDS
+from panel_scoring import score_panel, grade_scores, RESULT_COLUMNS
+from fetch_scheduler import fetch_many
+from top_losers_macd_bot import alert_candidates, get_top_losers, resolve_universe
+from resample import CONTEXT_DAYS
+from universe_builder import build_universe
+import metrics
+import telegram_dispatcher
+
+logger = logging.getLogger(__name__)
+
+FEED_URL = os.getenv("SMARTAPI_FEED_URL")                 # overrides SmartWebSocketV2.ROOT_URI when set
+CLOSE_GRACE = float(os.getenv("LIVE_CLOSE_GRACE", "2"))   # seconds past a bar's end before the wall clock closes it
+BAR_SECONDS = 15 * 60
+SESSION_OPEN, SESSION_CLOSE = (9 * 60 + 15) * 60, (15 * 60 + 30) * 60  # seconds into the market day
+IST_OFFSET = 19800     # seconds; bars are anchored to 09:15 Asia/Kolkata
+WARM_DAYS = 7          # same window the scanner scores on
+MIN_BARS = 35          # same minimum the scanner requires
+PARTIAL_TOLERANCE = 5  # seconds: a symbol's first bar is complete only if its first tick came this soon after the open
+QUOTE_MODE = 2
+SUBSCRIBE_BATCH = 1000  # tokens per subscribe request
+FEED_RETRIES = int(os.getenv("LIVE_FEED_RETRIES", "5"))  # websocket reconnect attempts
+
+def bar_start(ts):
+    # Epoch second the 15-minute bar containing `ts` opened at, or None outside 09:15–15:30
+    local = int(ts) + IST_OFFSET
+    into_day = local % 86400
+    if not SESSION_OPEN <= into_day < SESSION_CLOSE:
+        return None
+    return local - into_day + SESSION_OPEN + (into_day - SESSION_OPEN) // BAR_SECONDS * BAR_SECONDS - IST_OFFSET
+
+def _until(candles, last_start):
+    # Bars that opened at or before epoch second last_start (a view)
+    return candles.slice(stop=int(np.searchsorted(candles.ts, last_start // 60, side="right")))
+
+def states_panel(symbols, states):
+    # The states' recent bars and indicators as a score_panel panel (states need >= WINDOW bars)
+    recent = np.array([list(states[s].recent) for s in symbols], dtype=np.float64)  # None → NaN
+    panel = {"symbols": list(symbols), "start": np.zeros(len(symbols), dtype=np.int64)}
+    for i, name in enumerate(BAR_FIELDS + INDICATOR_FIELDS):
+        panel[name] = recent[:, :, i]
+    return panel
+
+def score_states(symbols, states):
+    # score_panel over the states; their recent window may start after the session's open,
+    # so each state's own opening-bar volume stands in for the panel's
+    early_volume = np.array([states[s].early_volume for s in symbols], dtype=np.int64)
+    return score_panel(states_panel(symbols, states), early_volume=early_volume)
+
+# --- Ticks → bars ---
+class BarAggregator:
+    # The forming bar per symbol, as [start, open, high, low, close, volume, partial].
+    # Bars close when the feed's clock (latest exchange timestamp across all symbols)
+    # reaches their end, so a quiet symbol's bar still closes on time.
+    def __init__(self):
+        self.bars = {}
+        self.last_closed = {}
+        self.day_volume = {}   # symbol → (market day, cumulative volume at its last tick)
+        self.clock = 0
+        self.next_close = float("inf")
+        self._lock = threading.Lock()
+
+    def add_tick(self, symbol, ts, price, day_volume):
+        # Returns the bars this tick's time closed, [(symbol, bar), ...]
+        with self._lock:
+            self.clock = max(self.clock, ts)
+            closed = self._close_until(self.clock)
+            start = bar_start(ts)
+            if start is None or start <= self.last_closed.get(symbol, -1):
+                return closed  # outside the session, or late for a bar already closed
+
+            day = (start + IST_OFFSET) // 86400
+            seen_day, seen_volume = self.day_volume.get(symbol, (None, 0))
+            if seen_day != day:
+                # First tick of the day: volume before it is only known to be 0 at the open
+                opening = (start + IST_OFFSET) % 86400 == SESSION_OPEN
+                seen_volume = 0 if opening else day_volume
+            self.day_volume[symbol] = (day, day_volume)
+            volume = max(0, day_volume - seen_volume)
+
+            bar = self.bars.get(symbol)
+            if bar is None or start > bar[0]:
+                first = symbol not in self.last_closed and bar is None
+                self.bars[symbol] = [start, price, price, price, price, volume,
+                                     first and ts - start > PARTIAL_TOLERANCE]
+                self.next_close = min(self.next_close, start + BAR_SECONDS)
+            elif start == bar[0]:
+                bar[2], bar[3], bar[4] = max(bar[2], price), min(bar[3], price), price
+                bar[5] += volume
+            return closed
+
+    def close_until(self, now):
+        with self._lock:
+            return self._close_until(now)
+
+    def _close_until(self, now):
+        if now < self.next_close:
+            return []
+        closed = [(s, bar) for s, bar in self.bars.items() if bar[0] + BAR_SECONDS <= now]
+        for symbol, bar in closed:
+            del self.bars[symbol]
+            self.last_closed[symbol] = bar[0]
+        self.next_close = min((bar[0] + BAR_SECONDS for bar in self.bars.values()), default=float("inf"))
+        return closed
+
+# --- Bars → scores ---
+class LiveScanner:
+    # Feed thread: ticks into the aggregator. Evaluator thread: closed bars into
+    # IndicatorState, then one scoring pass over just those symbols.
+    def __init__(self, client, tokens, states, alert=True):
+        self.client = client
+        self.tokens = tokens
+        self.states = states
+        self.alert = alert
+        self.symbol_by_token = {str(tokens[s]): s for s in states}
+        self.aggregator = BarAggregator()
+        self.latencies = []
+        self.candidates = []
+        self._closed = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._worker.start()
+        return self
+
+    def stop(self):
+        # Finish every bar already handed over, then stop the evaluator
+        self._closed.put(None)
+        self._worker.join()
+
+    def on_tick(self, tick):
+        symbol = self.symbol_by_token.get(tick.get("token"))
+        if symbol is None or "volume_trade_for_the_day" not in tick:
+            return
+        closed = self.aggregator.add_tick(symbol, tick["exchange_timestamp"] / 1000,
+                                          tick["last_traded_price"] / 100, tick["volume_trade_for_the_day"])
+        if closed:
+            self._closed.put((closed, time.perf_counter()))
+
+    def on_clock(self, now):
+        closed = self.aggregator.close_until(now - CLOSE_GRACE)
+        if closed:
+            self._closed.put((closed, time.perf_counter()))
+
+    def _run(self):
+        while True:
+            item = self._closed.get()
+            if item is None:
+                return
+            try:
+                self.evaluate_closed(*item)
+            except Exception as e:
+                logger.error(f"Live evaluation failed: {str(e)}")
+
+    def catch_up(self, closed):
+        # Partly seen bars come from getCandleData instead; the partial bar stands in if it isn't out yet
+        symbols = [symbol for symbol, _ in closed]
+        now = time.time()
+        with metrics.stage("live_catch_up"):
+            frames = fetch_many(symbols, lambda symbol: get_stock_data(
+                symbol, interval="15min", smart_api=self.client, token=self.tokens[symbol], as_candles=True,
+                days=max(1.0, (now - (self.states[symbol].last_ts or now)) / 86400 + 0.5)))
+        for (symbol, bar), candles in zip(closed, frames):
+            state = self.states[symbol]
+            state.update_frame(_until(candles, bar[0]))
+            if state.last_ts != bar[0]:
+                logger.warning(f"{symbol}: bar at {bar[0]} not published yet; using the partially seen bar")
+                state.update(*bar[:6])
+
+    def evaluate_closed(self, closed, closed_at):
+        partial = [(symbol, bar) for symbol, bar in closed if bar[6]]
+        if partial:
+            self.catch_up(partial)
+
+        ready = []
+        with metrics.stage("live_indicators"):
+            for symbol, bar in closed:
+                state = self.states[symbol]
+                if not bar[6]:
+                    state.update(*bar[:6])
+                if state.bars >= MIN_BARS and state.last_ts == bar[0]:
+                    ready.append(symbol)
+        with metrics.stage("live_scoring"):
+            graded = grade_scores(score_states(ready, self.states))
+        strong, moderate, watchlist = (
+            graded[graded["grade"] == grade][RESULT_COLUMNS].to_dict("records")
+            for grade in ["strong", "moderate", "watchlist"]
+        )
+
+        latency = time.perf_counter() - closed_at
+        self.latencies.append(latency)
+        metrics.observe("live_bar_to_score_seconds", latency)
+        metrics.incr("live_bars_closed", len(closed))
+        found = strong + moderate + watchlist
+        self.candidates.extend(found)
+        bar_time = time.strftime("%d %b %H:%M", time.gmtime(closed[0][1][0] + IST_OFFSET))
+        print(f"🕒 {bar_time} bar closed for {len(closed)} symbols → {len(ready)} scored in {latency * 1000:.0f} ms, "
+              f"{len(found)} candidates" + (f": {', '.join(p['symbol'] for p in found)}" if found else ""))
+        if self.alert and found:
+            alert_candidates(strong, moderate, watchlist)
+
+# --- Warm-up + feed ---
+def warm_states(client, symbols, tokens, until=None):
+    # IndicatorState per symbol over the WARM_DAYS of closed bars before `until` (default: now),
+    # with EMA_50/EMA_200 warmed over CONTEXT_DAYS as the scanner computes them
+    until = time.time() if until is None else until
+    days = CONTEXT_DAYS + max(0.0, time.time() - until) / 86400 + 1  # a day's margin; the window is cut below
+    with metrics.stage("fetch"):
+        frames = fetch_many(symbols, lambda symbol: get_stock_data(
+            symbol, interval="15min", days=days, smart_api=client, token=tokens[symbol], as_candles=True))
+    states = {}
+    with metrics.stage("indicators"):
+        for symbol, candles in zip(symbols, frames):
+            history = _until(candles.since(until - CONTEXT_DAYS * 86400), until - BAR_SECONDS)
+            candles = history.since(until - WARM_DAYS * 86400)
+            if candles.empty:
+                metrics.skip(symbol, "no_data")
+                continue
+            states[symbol] = IndicatorState.from_history(candles, history.slice(stop=len(history) - len(candles)))
+    return states
+
+class TickFeed(SmartWebSocketV2):
+    # Works around smartapi-python 1.5.5: websocket-client calls on_close(ws, status, reason)
+    # but SmartWebSocketV2._on_close takes only ws, and the TypeError turns every clean
+    # close into a reconnect. Drop this override once the SDK accepts the extra arguments.
+    def _on_close(self, wsapp, *args):
+        self.on_close(wsapp)
+
+def open_feed(client, tokens, on_tick, url=FEED_URL):
+    # TickFeed connected on a daemon thread, subscribing `tokens` in QUOTE mode once open
+    sws = TickFeed(client.access_token, client.api_key, client.userId, client.feed_token,
+                   max_retry_attempt=FEED_RETRIES, retry_strategy=1, retry_delay=2)
+    if url:
+        sws.ROOT_URI = url
+
+    def on_open(wsapp):
+        for i in range(0, len(tokens), SUBSCRIBE_BATCH):
+            sws.subscribe("macdlive", QUOTE_MODE, [{"exchangeType": 1, "tokens": tokens[i:i + SUBSCRIBE_BATCH]}])
+        print(f"📡 Subscribed {len(tokens)} tokens")
+
+    sws.on_open = on_open
+    sws.on_data = lambda wsapp, tick: on_tick(tick)
+    sws.on_error = lambda *args: logger.error(f"Tick feed error: {args}")
+    sws.on_close = lambda *args: print("🔌 Tick feed closed")
+    threading.Thread(target=sws.connect, daemon=True).start()
+    return sws
+
+def run_live(client, symbols, tokens, url=FEED_URL, warm_until=None, until=None, alert=True, stop=None):
+    # Streams until `stop` is set (or SIGINT/SIGTERM), or the feed's clock reaches `until`.
+    # warm_until: a replay's start, so warm-up uses only bars before it and bars close on
+    # the feed's clock alone.
+    stop = stop or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+
+    states = warm_states(client, symbols, tokens, warm_until)
+    print(f"🔥 Warmed indicator state for {len(states)}/{len(symbols)} symbols")
+    scanner = LiveScanner(client, tokens, states, alert).start()
+    if hasattr(client, "ensure_session"):
+        client.ensure_session()
+    feed = open_feed(client, [str(tokens[s]) for s in states], scanner.on_tick, url)
+    while not stop.wait(0.2):
+        if warm_until is None:
+            scanner.on_clock(time.time())
+        if until is not None and scanner.aggregator.clock >= until:
+            break
+    feed.close_connection()
+    scanner.stop()
+    return scanner
+
+def main(replay=False, speed=60.0, auto_universe=False):
+    print("📡 Starting live tick scan")
+    if replay:
+        from fake_services import FakeSmartConnect, start_fake_tick_feed
+        import fetch_scheduler
+        fetch_scheduler.candle_limiter = fetch_scheduler.candle_rate_limiter(1000, 60000)  # the fake has no quota
+        client, tick_feed = FakeSmartConnect(), start_fake_tick_feed(speed=speed)
+        print(f"🧪 Replaying {tick_feed.session:%a %d %b} at {speed:g}x from {tick_feed.url}")
+    else:
+        client, tick_feed = get_smartapi_client(), None
+        if not client:
+            print("❌ SmartAPI login failed")
+            return
+    if auto_universe:
+        build_universe(client if not replay else None, source="quotes" if not replay else "candles")
+    symbols, tokens = resolve_universe(get_top_losers(top_n=9999))
+    if not symbols:
+        print("😐 No symbols to stream.")
+        return
+
+    if tick_feed:
+        # Bars close on the replay's clock; it ends with the closing-price ticks after 15:30
+        scanner = run_live(client, symbols, tokens, tick_feed.url, warm_until=tick_feed.session_start,
+                           until=tick_feed.session_end, alert=False)
+        tick_feed.stop()
+    else:
+        scanner = run_live(client, symbols, tokens)
+    if scanner.latencies:
+        print(f"⏱️ {len(scanner.latencies)} bar closes, bar-close → scores p50 "
+              f"{np.median(scanner.latencies) * 1000:.0f} ms, max {max(scanner.latencies) * 1000:.0f} ms; "
+              f"{len(scanner.candidates)} candidates")
+    print("👋 Live scan stopped.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream ticks, build 15-minute bars and score them as they close")
+    parser.add_argument("--replay", action="store_true",
+                        help="offline: replay the last session from a local fake feed (no alerts sent)")
+    parser.add_argument("--speed", type=float, default=60.0, help="replay speed multiplier")
+    parser.add_argument("--auto-universe", action="store_true", help="rebuild top_losers.csv before subscribing")
+    args = parser.parse_args()
+
+    with metrics.profiled("live"):
+        main(args.replay, args.speed, args.auto_universe)
+    telegram_dispatcher.flush()
+    metrics.write_summary("live")
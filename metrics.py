@@ -0,0 +1,179 @@
+# metrics.py
+# 📈 Run instrumentation: stage timers, latency histograms, counters and skip reasons
+#
+# Everything is collected in-process and written once per run as a JSON summary
+# and/or a Prometheus text file (MACD_METRICS_FORMAT=json|prom|both, default both)
+# under MACD_METRICS_DIR. MACD_PROFILE=cprofile|sample turns on a profiler for the
+# run; when unset, profiling costs nothing.
+
+import os
+import sys
+import json
+import time
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+METRICS_DIR = os.getenv("MACD_METRICS_DIR", "metrics")
+METRICS_FORMAT = os.getenv("MACD_METRICS_FORMAT", "both").lower()
+PROFILE_MODE = os.getenv("MACD_PROFILE", "").lower()
+SAMPLE_INTERVAL = float(os.getenv("MACD_PROFILE_INTERVAL", "0.005"))
+HISTOGRAM_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+_lock = threading.Lock()
+_stages = defaultdict(lambda: {"seconds": 0.0, "count": 0})
+_samples = defaultdict(list)
+_counters = Counter()
+_skips = Counter()
+_skipped_symbols = defaultdict(list)
+
+# --- Collection ---
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            _stages[name]["seconds"] += elapsed
+            _stages[name]["count"] += 1
+
+def observe(name, seconds):
+    with _lock:
+        _samples[name].append(seconds)
+
+def incr(name, n=1):
+    with _lock:
+        _counters[name] += n
+
+def skip(symbol, reason):
+    with _lock:
+        _skips[reason] += 1
+        _skipped_symbols[reason].append(symbol)
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _samples.clear()
+        _counters.clear()
+        _skips.clear()
+        _skipped_symbols.clear()
+
+# --- Export ---
+def summary(run_name):
+    with _lock:
+        histograms = {}
+        for name, values in _samples.items():
+            arr = np.array(values)
+            histograms[name] = {
+                "count": len(arr),
+                "sum": round(float(arr.sum()), 4),
+                "p50": round(float(np.percentile(arr, 50)), 4),
+                "p99": round(float(np.percentile(arr, 99)), 4),
+                "max": round(float(arr.max()), 4),
+                "buckets": {str(b): int((arr <= b).sum()) for b in HISTOGRAM_BUCKETS},
+            }
+        return {
+            "run": run_name,
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "stages": {name: {"seconds": round(v["seconds"], 4), "count": v["count"]}
+                       for name, v in _stages.items()},
+            "histograms": histograms,
+            "counters": dict(_counters),
+            "skipped": dict(_skips),
+            "skipped_symbols": {reason: list(symbols) for reason, symbols in _skipped_symbols.items()},
+        }
+
+def to_prometheus(data):
+    run = data["run"]
+    lines = [
+        "# TYPE macd_stage_seconds_total counter",
+        *(f'macd_stage_seconds_total{{run="{run}",stage="{name}"}} {v["seconds"]}'
+          for name, v in data["stages"].items()),
+        "# TYPE macd_stage_calls_total counter",
+        *(f'macd_stage_calls_total{{run="{run}",stage="{name}"}} {v["count"]}'
+          for name, v in data["stages"].items()),
+        "# TYPE macd_events_total counter",
+        *(f'macd_events_total{{run="{run}",event="{name}"}} {value}'
+          for name, value in data["counters"].items()),
+        "# TYPE macd_skipped_symbols_total counter",
+        *(f'macd_skipped_symbols_total{{run="{run}",reason="{reason}"}} {value}'
+          for reason, value in data["skipped"].items()),
+    ]
+    for name, h in data["histograms"].items():
+        metric = f"macd_{name}"
+        lines.append(f"# TYPE {metric} histogram")
+        for bucket, count in h["buckets"].items():
+            lines.append(f'{metric}_bucket{{run="{run}",le="{bucket}"}} {count}')
+        lines.append(f'{metric}_bucket{{run="{run}",le="+Inf"}} {h["count"]}')
+        lines.append(f'{metric}_sum{{run="{run}"}} {h["sum"]}')
+        lines.append(f'{metric}_count{{run="{run}"}} {h["count"]}')
+    return "\n".join(lines) + "\n"
+
+def write_summary(run_name, metrics_dir=None, fmt=None):
+    metrics_dir = metrics_dir or METRICS_DIR
+    fmt = fmt or METRICS_FORMAT
+    data = summary(run_name)
+    os.makedirs(metrics_dir, exist_ok=True)
+    paths = []
+    if fmt in ("json", "both"):
+        paths.append(os.path.join(metrics_dir, f"{run_name}_summary.json"))
+        with open(paths[-1], "w") as f:
+            json.dump(data, f, indent=2)
+    if fmt in ("prom", "both"):
+        paths.append(os.path.join(metrics_dir, f"{run_name}.prom"))
+        with open(paths[-1], "w") as f:
+            f.write(to_prometheus(data))
+    print(f"📈 Run metrics saved: {', '.join(paths)}")
+    return data
+
+# --- Optional profiling ---
+def _sampling_profiler(stop, counts, target_thread):
+    while not stop.wait(SAMPLE_INTERVAL):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == target_thread:
+                continue
+            code = frame.f_code
+            counts[f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"] += 1
+
+@contextmanager
+def profiled(run_name, mode=None, metrics_dir=None):
+    mode = PROFILE_MODE if mode is None else mode
+    if not mode:
+        yield
+        return
+
+    metrics_dir = metrics_dir or METRICS_DIR
+    os.makedirs(metrics_dir, exist_ok=True)
+    if mode == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            path = os.path.join(metrics_dir, f"{run_name}.pstats")
+            profiler.dump_stats(path)
+            print(f"🔬 cProfile stats saved: {path}")
+    elif mode == "sample":
+        counts, stop = Counter(), threading.Event()
+        sampler = threading.Thread(target=lambda: _sampling_profiler(stop, counts, sampler.ident), daemon=True)
+        sampler.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            sampler.join()
+            path = os.path.join(metrics_dir, f"{run_name}_samples.txt")
+            with open(path, "w") as f:
+                for location, count in counts.most_common():
+                    f.write(f"{count}\t{location}\n")
+            print(f"🔬 Sampling profile saved: {path}")
+    else:
+        print(f"⚠️ Unknown MACD_PROFILE mode '{mode}', profiling disabled")
+        yield
@@ -0,0 +1,109 @@
+# panel_scoring.py
+# 🎯 Whole-universe confluence scoring straight from the indicator panel
+#
+# Same rules as evaluate_bullish_candidate / get_engulfing_alerts /
+# analyze_candle_strength, evaluated for every symbol at once on the last bar.
+
+import numpy as np
+import pandas as pd
+
+GRADES = {5: "strong", 4: "moderate", 3: "watchlist"}
+HIGH_EARLY_VOLUME = 900000  # session-opening 15-minute bar volume behind "9L+ at 9:15"
+IST_OFFSET = 19800          # seconds; session dates are Asia/Kolkata dates
+RESULT_COLUMNS = ["symbol", "confluence", "closeness_score", "actual_diff", "rsi", "volume",
+                  "volume_avg", "volume_surge", "engulfing", "above_ema200", "early_volume",
+                  "high_early_volume", "momentum"]
+
+def _last(panel, name, back=1):
+    return panel[name][:, -back]
+
+def _rolling_mean_last(values, window):
+    # Mean of the last `window` bars; NaN when a symbol has fewer bars (as rolling().mean())
+    return values[:, -window:].mean(axis=1) if values.shape[1] >= window else np.full(len(values), np.nan)
+
+def session_open_volume(panel):
+    # Volume of each bar's session-opening candle, per bar (the early volume every path uses)
+    n_sym, n_bars = panel["ts"].shape
+    days = (panel["ts"] + IST_OFFSET) // 86400
+    cols = np.broadcast_to(np.arange(n_bars), (n_sym, n_bars))
+    new_day = np.ones((n_sym, n_bars), dtype=bool)
+    new_day[:, 1:] = days[:, 1:] != days[:, :-1]
+    first = np.maximum.accumulate(np.where(new_day, cols, 0), axis=1)
+    return np.take_along_axis(panel["volume"], first, axis=1)
+
+# --- Candle patterns ---
+def engulfing_flags(panel):
+    o1, c1 = _last(panel, "open"), _last(panel, "close")
+    o2, c2 = _last(panel, "open", 2), _last(panel, "close", 2)
+    bullish = (c1 > o1) & (c2 < o2) & (o1 < c2) & (c1 > o2)
+    bearish = (c1 < o1) & (c2 > o2) & (o1 > c2) & (c1 < o2)
+    return bullish, bearish
+
+def candle_strength(panel):
+    o, h, l, c, v = (_last(panel, name) for name in ["open", "high", "low", "close", "volume"])
+    range_ = h - l
+    has_range = range_ > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        body_ratio = np.where(has_range, np.abs(c - o) / range_, 0.0)
+        close_position = np.where(has_range, (h - c) / range_, 1.0)
+        volume_ratio = v / _rolling_mean_last(panel["volume"], 10)
+    return pd.DataFrame({
+        "body_ratio": np.round(body_ratio, 2),
+        "close_position": np.round(close_position, 2),
+        "volume_ratio": np.round(volume_ratio, 2),
+    }, index=pd.Index(panel["symbols"], name="symbol"))
+
+# --- Confluence scoring ---
+def score_panel(panel, early_volume=None):
+    # early_volume: per-symbol opening-bar volume when the panel doesn't reach back to the
+    # session's open (live states keep only their recent bars)
+    symbols = panel["symbols"]
+    if not symbols:
+        return pd.DataFrame(columns=RESULT_COLUMNS + ["rsi_ok"])
+
+    macd_diff = _last(panel, "MACD") - _last(panel, "MACD_signal")
+    rsi = _last(panel, "RSI_14")
+    price = _last(panel, "close")
+    ema200 = _last(panel, "EMA_200")
+
+    volume = _last(panel, "volume")
+    vol_avg = _rolling_mean_last(panel["volume"], 20)
+    volume_surge = volume >= 1.5 * vol_avg
+
+    engulf, _ = engulfing_flags(panel)
+
+    if early_volume is None:
+        early_volume = session_open_volume(panel)[:, -1]
+    high_early_volume = early_volume >= HIGH_EARLY_VOLUME
+
+    green_candles = (panel["close"][:, -3:] > panel["open"][:, -3:]).sum(axis=1)
+    strong_momentum = green_candles >= 2
+
+    rsi_ok = rsi > 40
+    above_ema200 = price > ema200
+    macd_close = (macd_diff < 0) & (np.abs(macd_diff) <= 0.3)
+    confluence = (macd_close.astype(int) + rsi_ok + volume_surge + above_ema200 + engulf)
+
+    scores = pd.DataFrame({
+        "symbol": symbols,
+        "confluence": confluence.astype(int),
+        "closeness_score": np.nan_to_num(np.trunc(np.clip(macd_diff / 0.03, -10, 10))).astype(int),
+        "actual_diff": np.round(macd_diff, 3),
+        "rsi": np.round(rsi, 1),
+        "volume": volume.astype(np.int64),
+        "volume_avg": np.nan_to_num(vol_avg).astype(np.int64),
+        "volume_surge": volume_surge,
+        "engulfing": engulf,
+        "above_ema200": above_ema200,
+        "early_volume": early_volume.astype(np.int64),
+        "high_early_volume": high_early_volume,
+        "momentum": strong_momentum,
+        "rsi_ok": rsi_ok,
+    })
+    return scores[RESULT_COLUMNS + ["rsi_ok"]]
+
+def grade_scores(scores):
+    # Strong/moderate/watchlist in one pass: keep confluence >= 3 and label by score
+    graded = scores[scores["confluence"].isin(list(GRADES))].copy()
+    graded["grade"] = graded["confluence"].map(GRADES)
+    return graded
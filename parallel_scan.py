@@ -0,0 +1,136 @@
+# parallel_scan.py
+# 🧵 Indicator + confluence scoring sharded across CPU cores
+#
+# The batch's candles are packed once into a shared-memory block (columns × symbols
+# × bars), so workers read their rows in place instead of receiving pickled
+# DataFrames. Symbols are dealt to shards by bar count (largest first onto the
+# lightest shard) and laid out contiguously per shard; each worker scores its slice
+# with the same panel code and the results are put back in input order, so the
+# output is identical to a single-process run.
+# Enable with SCAN_WORKERS=<n> or SCAN_WORKERS=auto; the scanner raises its batch size
+# to min_batch_size() so each batch gives every worker at least MIN_SHARD_SYMBOLS symbols.
+
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from candle_store import frame_to_columns
+from indicator_panel import PANEL_COLUMNS, build_panel, add_panel_indicators, trend_columns, carried_columns
+from panel_scoring import score_panel, RESULT_COLUMNS
+import metrics
+
+def _worker_count(value):
+    return (os.cpu_count() or 1) if value == "auto" else max(1, int(value))
+
+SCAN_WORKERS = _worker_count(os.getenv("SCAN_WORKERS", "1"))
+MIN_SHARD_SYMBOLS = int(os.getenv("SCAN_MIN_SHARD_SYMBOLS", "25"))  # below this, process overhead outweighs the work
+
+def min_batch_size(workers=None):
+    # Smallest batch that still shards across every worker
+    return (SCAN_WORKERS if workers is None else workers) * MIN_SHARD_SYMBOLS
+
+# --- Sharding ---
+def shard_rows(lengths, n_shards):
+    # Row indices per shard with roughly equal total bars (longest-first onto the lightest shard)
+    loads = [0] * n_shards
+    shards = [[] for _ in range(n_shards)]
+    for row in sorted(range(len(lengths)), key=lambda r: (-lengths[r], r)):
+        target = min(range(n_shards), key=lambda s: (loads[s], s))
+        shards[target].append(row)
+        loads[target] += lengths[row]
+    return [sorted(rows) for rows in shards if rows]
+
+def _pack(block, names, order, columns, n_bars):
+    # Right-align each symbol's candles into its row of the shared block (NaN-padded on the left)
+    starts = np.zeros(len(order), dtype=np.int64)
+    block[:] = np.nan
+    for row, symbol in enumerate(order):
+        cols = columns[symbol]
+        start = n_bars - len(cols["close"])
+        starts[row] = start
+        for i, name in enumerate(names):
+            block[i, row, start:] = cols[name]
+    return starts
+
+# --- Worker side ---
+def _score_shard(shm_name, shape, names, lo, hi, symbols, starts):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        trim = int(starts.min())  # drop padding columns no symbol in this shard uses
+        panel = {"symbols": symbols, "start": starts - trim}
+        for i, name in enumerate(names):
+            panel[name] = block[i, lo:hi, trim:]
+        panel["ts"] = np.nan_to_num(panel["ts"]).astype(np.int64)  # float64 holds epoch seconds exactly
+        scores = score_panel(add_panel_indicators(panel))
+        del panel, block  # release views on the buffer before closing it
+        return scores
+    finally:
+        shm.close()
+
+# --- Pool ---
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+def _get_pool(workers):
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size < workers:
+            if _pool is not None:
+                _pool.shutdown()
+            # forkserver/spawn: never fork a process that already runs fetch/Telegram threads
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _pool, _pool_size = ProcessPoolExecutor(max_workers=workers, mp_context=context), workers
+            atexit.register(_pool.shutdown)
+        return _pool
+
+# --- Public entry point ---
+def score_frames(frames, workers=None):
+    # Confluence scores for {symbol: OHLCV DataFrame}, in `frames` order (same as score_panel(build_panel(...)))
+    workers = SCAN_WORKERS if workers is None else workers
+    n_shards = min(workers, len(frames) // MIN_SHARD_SYMBOLS)
+    if n_shards <= 1:
+        with metrics.stage("indicators"):
+            panel = add_panel_indicators(build_panel(frames))
+        with metrics.stage("scoring"):
+            return score_panel(panel)
+
+    with metrics.stage("sharded_scoring"):
+        symbols = [symbol for symbol, df in frames.items() if len(df)]
+        columns = {symbol: {**frame_to_columns(frames[symbol]), **trend_columns(frames[symbol])} for symbol in symbols}
+        # ts for the session-opening volume; EMA_50/EMA_200 carried from the full fetch
+        names = ["ts"] + PANEL_COLUMNS + carried_columns(columns.values())
+        lengths = [len(columns[symbol]["close"]) for symbol in symbols]
+        shards = shard_rows(lengths, n_shards)
+        order = [symbols[row] for rows in shards for row in rows]
+        n_bars = max(lengths)
+
+        shape = (len(names), len(order), n_bars)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 8))
+        try:
+            block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+            starts = _pack(block, names, order, columns, n_bars)
+            del block
+
+            pool, futures, lo = _get_pool(n_shards), [], 0
+            for rows in shards:
+                hi = lo + len(rows)
+                futures.append(pool.submit(_score_shard, shm.name, shape, names, lo, hi, order[lo:hi], starts[lo:hi]))
+                lo = hi
+            scores = pd.concat([f.result() for f in futures], ignore_index=True)
+        finally:
+            shm.close()
+            shm.unlink()
+
+        # Deterministic merge: back to the input order regardless of shard layout
+        position = {symbol: i for i, symbol in enumerate(symbols)}
+        scores = scores.sort_values("symbol", key=lambda s: s.map(position), kind="stable")
+        return scores.reset_index(drop=True)[RESULT_COLUMNS + ["rsi_ok"]]
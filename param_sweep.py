@@ -0,0 +1,144 @@
+# param_sweep.py
+# 🎛️ Parallel grid search over the confluence / weakness thresholds on stored candles
+#
+# Indicators and every threshold-independent array (MACD gap, RSI, volume vs its
+# 20-bar average, EMA_200 and engulfing flags, the session's opening-bar volume) are
+# computed once. Each worker process receives them once and then only re-applies
+# thresholds and replays trades per parameter set. Results are ranked by hit rate and
+# forward return.
+# Usage: python param_sweep.py [--grid macd_gap=0.2,0.3 rsi_min=35,40 ...] [--workers 4] [--out sweep_results.csv]
+
+import os
+import sys
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from backtest import (DEFAULT_PARAMS, WARMUP_BARS, load_history_panel, _valid_bars, signal_inputs,
+                      confluence_scores, weakness_signals, simulate_trades, summarize)
+from panel_scoring import session_open_volume, HIGH_EARLY_VOLUME
+
+DEFAULT_GRID = {
+    "min_confluence": [3, 4, 5],
+    "macd_gap": [0.2, 0.3, 0.5],
+    "rsi_min": [35, 40, 45],
+    "volume_mult": [1.2, 1.5, 2.0],
+    "early_volume_min": [0, HIGH_EARLY_VOLUME],   # opening 15-minute bar volume (the "9L+ at 9:15" cutoff)
+    "weak_gap": [0.05, 0.1, 0.2],
+}
+FORWARD_BARS = int(os.getenv("SWEEP_FORWARD_BARS", "8"))  # forward-return horizon after each entry signal
+MIN_TRADES = 10
+
+# --- Threshold-independent arrays (computed once) ---
+def precompute(panel):
+    o, c = panel["open"], panel["close"]
+    pre = {
+        **signal_inputs(panel),
+        "valid": _valid_bars(panel, WARMUP_BARS),
+        "early_volume": session_open_volume(panel),
+    }
+    # Return from the next bar's open to the close FORWARD_BARS later (NaN past the end)
+    forward = np.full(c.shape, np.nan)
+    if c.shape[1] > FORWARD_BARS:
+        entry = o[:, 1:c.shape[1] - FORWARD_BARS + 1]
+        forward[:, :c.shape[1] - FORWARD_BARS] = 100 * (c[:, FORWARD_BARS:] - entry) / entry
+    pre["forward_return"] = forward
+    return pre
+
+# --- Per parameter set ---
+def signals(pre, params):
+    # The backtest's own checks, over the arrays precompute() shares across parameter sets
+    confluence = confluence_scores(None, params["macd_gap"], params["rsi_min"], params["volume_mult"], inputs=pre)
+    entries = pre["valid"] & (confluence >= params["min_confluence"])
+    if params.get("early_volume_min"):
+        entries &= pre["early_volume"] >= params["early_volume_min"]
+    exits = pre["valid"] & weakness_signals(None, params["weak_gap"], inputs=pre)
+    return entries, exits
+
+def evaluate(panel, pre, params):
+    entries, exits = signals(pre, params)
+    trades = simulate_trades(panel, entries, exits)
+    forward = pre["forward_return"][entries]
+    forward = forward[~np.isnan(forward)]
+    return {
+        **params, **summarize(trades), "signals": int(entries.sum()),
+        f"fwd_return_{FORWARD_BARS}bars_pct": round(float(forward.mean()), 3) if len(forward) else 0.0,
+        f"fwd_hit_rate_{FORWARD_BARS}bars": round(float(100 * (forward > 0).mean()), 2) if len(forward) else 0.0,
+    }
+
+# --- Worker processes: panel + precomputed arrays arrive once per worker ---
+_shared = {}
+
+def _init_worker(panel, pre):
+    _shared["panel"], _shared["pre"] = panel, pre
+
+def _evaluate_many(param_sets):
+    return [evaluate(_shared["panel"], _shared["pre"], params) for params in param_sets]
+
+def expand_grid(grid):
+    keys = list(grid)
+    return [{**DEFAULT_PARAMS, **dict(zip(keys, values))} for values in itertools.product(*grid.values())]
+
+def rank(results, min_trades=MIN_TRADES):
+    table = pd.DataFrame(results)
+    fwd = f"fwd_return_{FORWARD_BARS}bars_pct"
+    table["enough_trades"] = table["trades"] >= min_trades
+    table = table.sort_values(["enough_trades", "hit_rate", fwd, "avg_return_pct"], ascending=False, kind="stable")
+    return table.drop(columns="enough_trades").reset_index(drop=True)
+
+def run_sweep(panel, grid=None, workers=None, min_trades=MIN_TRADES):
+    param_sets = expand_grid(grid or DEFAULT_GRID)
+    pre = precompute(panel)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(param_sets)))
+    if workers == 1:
+        return rank([evaluate(panel, pre, params) for params in param_sets], min_trades)
+
+    # Contiguous chunks, so results come back in grid order and ties rank the same as a serial run
+    size = -(-len(param_sets) // (workers * 4))
+    chunks = [param_sets[i:i + size] for i in range(0, len(param_sets), size)]
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(panel, pre)) as pool:
+        results = [row for rows in pool.map(_evaluate_many, chunks) for row in rows]
+    return rank(results, min_trades)
+
+def parse_grid(items):
+    # ["macd_gap=0.2,0.3", ...] → {"macd_gap": [0.2, 0.3]} on top of DEFAULT_GRID
+    grid = dict(DEFAULT_GRID)
+    for item in items or []:
+        key, _, values = item.partition("=")
+        if key not in DEFAULT_GRID:
+            raise ValueError(f"Unknown sweep parameter: {key} (choose from {', '.join(DEFAULT_GRID)})")
+        grid[key] = [type(DEFAULT_GRID[key][0])(float(v)) for v in values.split(",") if v]
+    return grid
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grid-search confluence entry / weakness exit thresholds")
+    parser.add_argument("--symbols", nargs="*", help="symbols to replay (default: everything in the candle store)")
+    parser.add_argument("--interval", default="15min")
+    parser.add_argument("--grid", nargs="*", metavar="PARAM=V1,V2", help="override grid values for a parameter")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--min-trades", type=int, default=MIN_TRADES, help="rank sets with fewer trades last")
+    parser.add_argument("--out", default="sweep_results.csv")
+    args = parser.parse_args(argv)
+
+    panel = load_history_panel(args.symbols, args.interval)
+    if not panel["symbols"]:
+        print("😐 No stored candle history to sweep.")
+        return
+    grid = parse_grid(args.grid)
+    n_sets = int(np.prod([len(v) for v in grid.values()]))
+    print(f"🎛️ Sweeping {n_sets} parameter sets over {len(panel['symbols'])} symbols × {panel['close'].shape[1]} bars")
+
+    table = run_sweep(panel, grid, args.workers, args.min_trades)
+    table.to_csv(args.out, index=False)
+    print(table.head(10).to_string(index=False))
+    print(f"💾 Saved {args.out}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
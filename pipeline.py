@@ -0,0 +1,161 @@
+# pipeline.py
+# 🚰 One-process scan → enrich → report flow (no CSV hand-offs between the three scripts)
+#
+# The scanner works through the universe in chunks and hands each chunk's graded
+# candidates straight to a pool of fundamentals workers (strong setups first), which
+# comment on them and queue qualifying Telegram alerts as soon as they are enriched.
+# The CSVs the standalone scripts exchange are only written with --write-csv.
+# Usage: python pipeline.py [--chunk-size 50] [--write-csv] [--no-prescreen]
+
+import os
+import sys
+import time
+import queue
+import argparse
+import itertools
+import threading
+
+import pandas as pd
+
+from smart_login import get_smartapi_client
+from utils import send_telegram_message
+import top_losers_macd_bot as scanner
+import fundamentals_scraper
+import scan_history
+import prescreen
+import final_report_sender
+from resample import CONTEXT_COLUMNS
+import metrics
+import telegram_dispatcher
+
+CHUNK_SIZE = int(os.getenv("PIPELINE_CHUNK_SIZE", "50"))
+GRADE_PRIORITY = {"strong": 0, "moderate": 1, "watchlist": 2}
+_DONE = (len(GRADE_PRIORITY), 0, None)  # sorts after every real candidate
+
+class Pipeline:
+    def __init__(self, client, tokens, enrich_workers=fundamentals_scraper.SCREENER_WORKERS):
+        self.client = client
+        self.tokens = tokens
+        self.enrich_workers = max(1, enrich_workers)
+        self.candidates = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.graded = {grade: [] for grade in GRADE_PRIORITY}
+        self.skipped = []
+        self.scored = []
+        self.reported = []
+        self.started = None
+        self.first_alert = None
+
+    # --- Stage 1: scan in chunks, emit graded candidates ---
+    def scan(self, symbols, chunk_size=CHUNK_SIZE):
+        chunks = [symbols[i:i + chunk_size] for i in range(0, len(symbols), chunk_size)]
+        for n, chunk in enumerate(chunks):
+            print(f"📦 Scanning chunk {n + 1}/{len(chunks)} ({len(chunk)} stocks)")
+            strong, moderate, watchlist, skipped = scanner.run_batch(chunk, self.client, self.tokens, scored=self.scored)
+            self.skipped += skipped
+            for grade, items in zip(GRADE_PRIORITY, [strong, moderate, watchlist]):
+                self.graded[grade] += items
+                for candidate in items:
+                    self.candidates.put((GRADE_PRIORITY[grade], next(self.sequence), dict(candidate, grade=grade)))
+
+    # --- Stages 2+3: enrich with fundamentals, comment and alert ---
+    def _enrich_worker(self):
+        while True:
+            _, _, candidate = self.candidates.get()
+            if candidate is None:
+                return
+            try:
+                data = fundamentals_scraper.fetch_fundamentals(candidate["symbol"])
+                if data is None:
+                    metrics.skip(candidate["symbol"], "no_fundamentals")
+                row = {**candidate, **dict.fromkeys(fundamentals_scraper.METRIC_LABELS), **(data or {})}
+                with metrics.stage("report"):
+                    comment, sent = final_report_sender.report_row(row)
+            except Exception as e:
+                print(f"❌ Failed to enrich {candidate['symbol']}: {e}")
+                continue
+            with self.lock:
+                self.reported.append({**row, "comments": comment})
+                if sent and self.first_alert is None:
+                    self.first_alert = time.perf_counter() - self.started
+                    metrics.observe("time_to_first_alert_seconds", self.first_alert)
+                    print(f"📨 First actionable alert queued after {self.first_alert:.1f}s ({row['symbol']})")
+
+    def run(self, symbols, chunk_size=CHUNK_SIZE):
+        self.started = time.perf_counter()
+        workers = [threading.Thread(target=self._enrich_worker, name=f"enrich-{i}", daemon=True)
+                   for i in range(self.enrich_workers)]
+        for worker in workers:
+            worker.start()
+        try:
+            with metrics.stage("scan"):
+                self.scan(symbols, chunk_size)
+        finally:
+            for _ in workers:
+                self.candidates.put(_DONE)
+            with metrics.stage("enrich_drain"):
+                for worker in workers:
+                    worker.join()
+
+        strong, moderate, watchlist = (self.graded[grade] for grade in GRADE_PRIORITY)
+        if strong or moderate or watchlist:
+            scanner.alert_candidates(strong, moderate, watchlist)
+        else:
+            print("😐 No bullish setups found.")
+            send_telegram_message("😐 No bullish setups found from Top Losers.")
+        return self
+
+    # --- Optional artifacts (same files the standalone scripts write) ---
+    def write_csv(self):
+        candidates = self.graded["strong"] + self.graded["moderate"] + self.graded["watchlist"]
+        pd.DataFrame(candidates, columns=scanner.RESULT_COLUMNS + CONTEXT_COLUMNS).to_csv(
+            "potential_bullish_crossover.csv", index=False)
+
+        order = {c["symbol"]: i for i, c in enumerate(candidates)}
+        reported = sorted(self.reported, key=lambda row: order[row["symbol"]])
+        columns = scanner.RESULT_COLUMNS + CONTEXT_COLUMNS + list(fundamentals_scraper.METRIC_LABELS)
+        enriched = pd.DataFrame(reported, columns=columns + ["comments"])
+        enriched[columns].to_csv("enriched_bullish_signals.csv", index=False, encoding='utf-8-sig')
+        enriched.to_csv("final_bullish_signals_with_comments.csv", index=False, encoding='utf-8-sig')
+        if self.skipped:
+            pd.DataFrame(self.skipped, columns=["symbol"]).to_csv("skipped_stocks.csv", index=False)
+        print("💾 Saved potential_bullish_crossover.csv, enriched_bullish_signals.csv, "
+              "final_bullish_signals_with_comments.csv")
+
+def run_pipeline(client, symbols, tokens, chunk_size=CHUNK_SIZE, write_csv=False):
+    pipeline = Pipeline(client, tokens).run(symbols, chunk_size)
+    if pipeline.scored:
+        with metrics.stage("history"):
+            scan_history.record_scan(pd.concat(pipeline.scored, ignore_index=True), source="pipeline")
+    if write_csv:
+        with metrics.stage("write_csv"):
+            pipeline.write_csv()
+    alerts = sum("✅ Consider for Entry" in row["comments"] for row in pipeline.reported)
+    print(f"✅ Pipeline done: {len(pipeline.reported)} candidates enriched, {alerts} alerts, "
+          f"{len(pipeline.skipped)} skipped")
+    return pipeline
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan, enrich and report in one process")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help="symbols scanned before their candidates are handed to enrichment")
+    parser.add_argument("--write-csv", action="store_true", help="also write the intermediate CSV artifacts")
+    parser.add_argument("--no-prescreen", action="store_true", help="skip the quote/cached-candle pre-screen")
+    args = parser.parse_args(argv)
+
+    print("🚀 Starting scan → enrich → report pipeline")
+    client = get_smartapi_client()
+    if not client:
+        print("❌ SmartAPI login failed")
+        return
+    symbols, tokens = scanner.resolve_universe(scanner.get_top_losers(top_n=9999))
+    if scanner.PRESCREEN and not args.no_prescreen and symbols:
+        symbols, _ = prescreen.run_funnel(client, symbols, tokens)
+    return run_pipeline(client, symbols, tokens, args.chunk_size, args.write_csv)
+
+if __name__ == "__main__":
+    with metrics.profiled("pipeline"):
+        main(sys.argv[1:])
+    telegram_dispatcher.flush()
+    metrics.write_summary("pipeline")
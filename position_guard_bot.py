@@ -1,10 +1,41 @@
 # position_guard_bot.py
 # 🛡️ Monitors held positions for early MACD weakening signs (exit signal)
+#
+# One-shot by default (cron-friendly). With --daemon it stays logged in, keeps every
+# position's indicator state in memory, wakes at each 15-minute bar close during NSE
+# hours, fetches only the newest bar(s) and reloads my_positions.csv when it changes.
+# Metrics are reset at each cycle, so the summary it writes covers the latest bar. A
+# weekday on which no position gets a candle for GUARD_HOLIDAY_AFTER_BARS bar closes is
+# taken as an exchange holiday and the rest of it is skipped.
+
+import os
+import time
+import signal
+import argparse
+import threading
 
 import pandas as pd
 from smart_login import get_smartapi_client
-from utils import get_stock_data, send_telegram_message
-from indicators_correct import add_technical_indicators
+from utils import get_stock_data, send_telegram_message, log_alert
+from streaming_indicators import sync_state, advance_state, closed_bars, save_state
+from instrument_index import resolve_many
+from fetch_scheduler import fetch_many
+from candle_store import MARKET_TZ
+import alert_store
+import metrics
+import telegram_dispatcher
+
+POSITIONS_PATH = os.getenv("POSITIONS_PATH", "my_positions.csv")
+BAR_MINUTES = 15
+WARM_DAYS = 5
+SESSION_OPEN = pd.Timedelta(hours=9, minutes=15)
+SESSION_CLOSE = pd.Timedelta(hours=15, minutes=30)
+CLOSE_GRACE = float(os.getenv("GUARD_CLOSE_GRACE", "2"))          # seconds after bar close before fetching
+BAR_WAIT_SECONDS = float(os.getenv("GUARD_BAR_WAIT", "45"))        # keep retrying symbols whose bar isn't out yet
+BAR_RETRY_SECONDS = float(os.getenv("GUARD_BAR_RETRY", "3"))
+POSITIONS_POLL_SECONDS = float(os.getenv("GUARD_POSITIONS_POLL", "10"))
+ALERT_COOLDOWN = float(os.getenv("GUARD_ALERT_COOLDOWN_MINUTES", "60"))  # don't repeat a symbol's warning sooner
+HOLIDAY_AFTER_BARS = int(os.getenv("GUARD_HOLIDAY_AFTER_BARS", "2"))     # empty bar closes before a day counts as closed
 
 def check_macd_weakness(df):
     macd_now = df['MACD'].iloc[-1]
@@ -20,6 +51,43 @@ def check_macd_weakness(df):
         return True, round(gap_now, 3)
     return False, round(gap_now, 3)
 
+# --- Shared by one-shot and daemon runs ---
+def load_positions(path=POSITIONS_PATH):
+    df_pos = pd.read_csv(path)
+    return df_pos['symbol'].dropna().tolist()
+
+def resolve_positions(held_symbols):
+    with metrics.stage("token_lookup"):
+        tokens = resolve_many(held_symbols)
+    for s in held_symbols:
+        if not tokens[s]:
+            metrics.skip(s, "no_token")
+    return [s for s in held_symbols if tokens[s]], tokens
+
+def evaluate_position(symbol, state):
+    if state.bars < 35:
+        metrics.skip(symbol, "insufficient_data")
+        return False
+
+    flag, gap = check_macd_weakness(state.frame())
+
+    if flag and alert_store.get_store().in_cooldown(symbol, "macd_weakness", ALERT_COOLDOWN):
+        metrics.incr("alerts_suppressed")
+        print(f"🔕 {symbol}: weakness already alerted in the last {ALERT_COOLDOWN:g} min")
+        return False
+
+    if flag:
+        msg = (
+            f"⚠️ <b>MACD Weakening Alert</b>\n"
+            f"Symbol: <b>{symbol}</b>\n"
+            f"Gap: {gap} (shrinking)\n"
+            f"🔍 MACD bullish trend weakening. Monitor position closely."
+        )
+        send_telegram_message(msg)
+        log_alert(symbol, "macd_weakness")
+        print(f"⚠️ Exit warning sent for {symbol}")
+    return flag
+
 def main():
     print("🛡️ Position Guard Bot - Checking for MACD Weakness")
     client = get_smartapi_client()
@@ -28,32 +96,180 @@ def main():
         return
 
     try:
-        df_pos = pd.read_csv("my_positions.csv")
-        held_symbols = df_pos['symbol'].dropna().tolist()
+        held_symbols = load_positions()
         print(f"📦 Watching positions: {held_symbols}")
     except Exception as e:
         print(f"❌ Failed to read my_positions.csv: {e}")
         return
 
-    for symbol in held_symbols:
-        df = get_stock_data(symbol, interval="15min", days=5, smart_api=client)
-        if df.empty or len(df) < 35:
+    watched, tokens = resolve_positions(held_symbols)
+
+    with metrics.stage("fetch"):
+        frames = fetch_many(
+            watched,
+            lambda symbol: get_stock_data(symbol, interval="15min", days=WARM_DAYS, smart_api=client, token=tokens[symbol])
+        )
+
+    for symbol, df in zip(watched, frames):
+        if df.empty:
+            metrics.skip(symbol, "no_data")
             continue
 
-        df = add_technical_indicators(df)
-        flag, gap = check_macd_weakness(df)
+        # Advance the saved indicator state by the new closed bars only
+        with metrics.stage("indicators"):
+            state = sync_state(symbol, df)
+        evaluate_position(symbol, state)
+
+    print("✅ Position check complete.")
+
+# --- Daemon mode ---
+def next_bar_close(now, closed_days=()):
+    # First 15-minute bar close strictly after `now` (tz-aware, market time), weekdays 09:30–15:30,
+    # skipping dates in closed_days
+    day = now.normalize()
+    while True:
+        if day.weekday() < 5 and day.date() not in closed_days and now < day + SESSION_CLOSE:
+            first_close = day + SESSION_OPEN + pd.Timedelta(minutes=BAR_MINUTES)
+            if now < first_close:
+                return first_close
+            bars_done = (now - day - SESSION_OPEN) // pd.Timedelta(minutes=BAR_MINUTES)
+            return day + SESSION_OPEN + (bars_done + 1) * pd.Timedelta(minutes=BAR_MINUTES)
+        day += pd.Timedelta(days=1)
+
+def _lookback_days(state, now):
+    # Just enough history to reach the state's last bar, so only the newest bars are new
+    if state is None or state.last_ts is None:
+        return WARM_DAYS
+    return max(1.0, (now.timestamp() - state.last_ts) / 86400 + 0.5)
+
+def reload_positions(client, watch, path=POSITIONS_PATH):
+    # Re-read the positions file when its mtime changes; warm-start states for new symbols
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError as e:
+        if watch["mtime"] is not False:
+            print(f"❌ Failed to read {path}: {e}")
+            watch["mtime"] = False
+        return False
+    if mtime == watch["mtime"]:
+        return False
+    try:
+        held_symbols = load_positions(path)
+    except Exception as e:
+        print(f"❌ Failed to read {path}: {e}")  # possibly mid-write; retried on the next poll
+        return False
+    watch["mtime"] = mtime
+
+    watched, tokens = resolve_positions(held_symbols)
+    for symbol in set(watch["states"]) - set(watched):
+        del watch["states"][symbol]
+    new_symbols = [s for s in watched if s not in watch["states"]]
+    watch["tokens"] = tokens
+
+    with metrics.stage("fetch"):
+        frames = fetch_many(
+            new_symbols,
+            lambda symbol: get_stock_data(symbol, interval="15min", days=WARM_DAYS, smart_api=client, token=tokens[symbol])
+        )
+    for symbol, df in zip(new_symbols, frames):
+        with metrics.stage("indicators"):
+            watch["states"][symbol] = sync_state(symbol, df)
+    print(f"📦 Watching positions: {watched}")
+    return True
 
-        if flag:
-            msg = (
-                f"⚠️ <b>MACD Weakening Alert</b>\n"
-                f"Symbol: <b>{symbol}</b>\n"
-                f"Gap: {gap} (shrinking)\n"
-                f"🔍 MACD bullish trend weakening. Monitor position closely."
+def guard_cycle(client, watch, bar_close, stop=None):
+    # Fetch the bar that just closed for every position and evaluate it. Symbols whose
+    # bar isn't published yet are retried for a short while, then skipped until next bar.
+    stop = stop or threading.Event()
+    metrics.reset()  # the daemon writes one summary per cycle; don't let counters and skip lists grow
+    expected_ts = int((bar_close - pd.Timedelta(minutes=BAR_MINUTES)).timestamp())
+    tokens, states = watch["tokens"], watch["states"]
+    pending = list(states)
+    deadline = time.monotonic() + BAR_WAIT_SECONDS
+    alerts = 0
+
+    while pending:
+        now = pd.Timestamp.now(tz=MARKET_TZ)
+        with metrics.stage("fetch"):
+            frames = fetch_many(
+                pending,
+                lambda symbol: get_stock_data(symbol, interval="15min", days=_lookback_days(states[symbol], now),
+                                              smart_api=client, token=tokens[symbol])
             )
-            send_telegram_message(msg)
-            print(f"⚠️ Exit warning sent for {symbol}")
+        late = []
+        for symbol, df in zip(pending, frames):
+            with metrics.stage("indicators"):
+                state = states[symbol] = advance_state(states[symbol], closed_bars(df, BAR_MINUTES))
+            if state.last_ts is None or state.last_ts < expected_ts:
+                late.append(symbol)
+                continue
+            save_state(symbol, state)
+            alerts += evaluate_position(symbol, state)
 
-    print("✅ Position check complete.")
+        if not late or time.monotonic() >= deadline or stop.wait(BAR_RETRY_SECONDS):
+            for symbol in late:
+                metrics.skip(symbol, "bar_not_ready")
+            break
+        pending = late
+
+    print(f"✅ {bar_close:%H:%M} bar checked for {len(states)} positions ({alerts} alerts)")
+    note_session(watch, bar_close)
+    return alerts
+
+def note_session(watch, bar_close):
+    # Count bar closes without a single candle from today's session; after HOLIDAY_AFTER_BARS
+    # of them the market is taken to be closed today (an exchange holiday)
+    session_start = int((bar_close.normalize() + SESSION_OPEN).timestamp())
+    day = bar_close.date()
+    if not watch["states"] or any((s.last_ts or 0) >= session_start for s in watch["states"].values()):
+        watch["empty_bars"].pop(day, None)
+        return
+    watch["empty_bars"] = {day: watch["empty_bars"].get(day, 0) + 1}  # only today's count is kept
+    if watch["empty_bars"][day] >= HOLIDAY_AFTER_BARS:
+        watch["closed_days"] = {d for d in watch["closed_days"] if d > day} | {day}
+        print(f"🏖️ No candles for {day:%a %d %b} after {HOLIDAY_AFTER_BARS} bar closes; treating the market as closed today")
+
+def run_daemon(stop=None, positions_path=POSITIONS_PATH):
+    print("🛡️ Position Guard Bot - daemon mode")
+    stop = stop or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+
+    client = get_smartapi_client()
+    if not client:
+        print("❌ Login failed")
+        return
+
+    watch = {"mtime": None, "tokens": {}, "states": {}, "empty_bars": {}, "closed_days": set()}
+    reload_positions(client, watch, positions_path)
+    while not stop.is_set():
+        bar_close = next_bar_close(pd.Timestamp.now(tz=MARKET_TZ), watch["closed_days"])
+        print(f"⏳ Next check at {bar_close:%a %d %b %H:%M}")
+        while not stop.is_set():
+            wait = (bar_close - pd.Timestamp.now(tz=MARKET_TZ)).total_seconds() + CLOSE_GRACE
+            if wait <= 0:
+                break
+            stop.wait(min(wait, POSITIONS_POLL_SECONDS))
+            reload_positions(client, watch, positions_path)
+        if stop.is_set():
+            break
+        guard_cycle(client, watch, bar_close, stop)
+        metrics.write_summary("position_guard")
+
+    telegram_dispatcher.flush()
+    print("👋 Position Guard daemon stopped.")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Watch held positions for MACD weakness")
+    parser.add_argument("--daemon", action="store_true",
+                        help="stay running and check every 15-minute bar close during market hours")
+    args = parser.parse_args()
+
+    if args.daemon:
+        run_daemon()
+    else:
+        with metrics.profiled("position_guard"):
+            main()
+        telegram_dispatcher.flush()
+        metrics.write_summary("position_guard")
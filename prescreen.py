@@ -0,0 +1,186 @@
+# prescreen.py
+# 🪣 Cheap pre-screen funnel: bulk quotes + cached candles before any full candle fetch
+#
+# Stage 1 pulls LTP/day volume for the whole universe with batched getMarketData calls
+# (50 tokens per request) and drops symbols that have not traded today. Stage 2 only
+# runs for symbols whose cached candles are at most one bar behind: the cached last bar
+# (possibly saved mid-bar) and at most one later bar are unseen. It replays the
+# scanner's own indicators with those bars' closes at every corner of a price band and
+# drops a symbol only if no close in the band can make price > EMA_200, RSI > 40 or
+# the MACD gap fall within [-0.3, 0) enough to reach watchlist confluence. Volume surge
+# and engulfing are always assumed possible.
+#
+# Guaranteed: the band is the quote's day low/high (and LTP), widened by
+# PRESCREEN_PRICE_TOLERANCE; within it the bounds are exact (EMA and MACD are linear in
+# the closes and RSI is linear-fractional on each piece, so extremes sit at the corners
+# tried). Not guaranteed: a price outside the band by the time the full fetch runs, or
+# the scan's 7-day window starting a bar later than the cache's. Symbols with no quote,
+# no day range or an older cache pass through. Only the survivors get the full fetch.
+
+import os
+import time
+import logging
+
+import numpy as np
+
+import candle_store
+from indicator_panel import PANEL_COLUMNS, build_panel_from_columns, add_panel_indicators, ema
+from resample import CONTEXT_DAYS
+from panel_scoring import GRADES
+from fetch_scheduler import call_with_retry, RateLimiter, TokenBucket
+import metrics
+
+logger = logging.getLogger(__name__)
+
+QUOTE_BATCH = 50  # getMarketData accepts up to 50 tokens per request
+QUOTE_RATE_PER_SEC = float(os.getenv("SMARTAPI_QUOTE_RATE_PER_SEC", "10"))
+MIN_DAY_VOLUME = int(os.getenv("PRESCREEN_MIN_VOLUME", "1"))
+STATE_DAYS = 7            # same window the scanner scores on
+STATE_MIN_BARS = 35       # same minimum the scanner requires
+PRICE_TOLERANCE = float(os.getenv("PRESCREEN_PRICE_TOLERANCE", "0.02"))  # band beyond the day's range, as a fraction
+MIN_CONFLUENCE = min(GRADES)
+BAR_SECONDS = 15 * 60
+SESSION_OPEN, SESSION_CLOSE = (9 * 60 + 15) * 60, (15 * 60 + 30) * 60  # seconds into the market day
+IST_OFFSET = 19800
+
+quote_limiter = RateLimiter([TokenBucket(QUOTE_RATE_PER_SEC, 1)])
+
+# --- Stage 1: bulk quotes ---
+def fetch_quotes(client, tokens, exchange="NSE"):
+    # {token: quote dict} for every token SmartAPI returned a quote for
+    tokens = list(dict.fromkeys(str(t) for t in tokens))
+    quotes = {}
+    for i in range(0, len(tokens), QUOTE_BATCH):
+        batch = tokens[i:i + QUOTE_BATCH]
+        try:
+            response = call_with_retry(lambda: client.getMarketData("FULL", {exchange: batch}), limiter=quote_limiter)
+        except Exception as e:
+            logger.error(f"Quote fetch failed for {len(batch)} tokens: {str(e)}")
+            continue
+        if not response or not response.get("status"):
+            logger.error(f"SmartAPI quote error: {(response or {}).get('message', 'No message')}")
+            continue
+        for quote in (response.get("data") or {}).get("fetched") or []:
+            quotes[str(quote.get("symbolToken"))] = quote
+    return quotes
+
+# --- Stage 2: reachability from cached candles ---
+def session_bars_after(ts, now):
+    # How many 09:15-anchored 15-minute bars open in (ts, now] on weekdays
+    count = 0
+    day = (int(ts) + IST_OFFSET) // 86400 * 86400 - IST_OFFSET  # market-day midnight, epoch seconds
+    while day <= now:
+        if ((day + IST_OFFSET) // 86400 + 3) % 7 < 5:  # 1970-01-01 was a Thursday
+            opens = day + SESSION_OPEN + BAR_SECONDS * np.arange((SESSION_CLOSE - SESSION_OPEN) // BAR_SECONDS)
+            count += int(((opens > ts) & (opens <= now)).sum())
+        day += 86400
+    return count
+
+def close_paths(last_close, low, high, n_unseen):
+    # Closes for the unseen bars covering every vertex of the band (incl. where a bar's
+    # change flips sign, where RSI's pieces meet)
+    kink = min(max(last_close, low), high)
+    if n_unseen == 1:
+        return [[low], [high], [kink]]
+    return [[c1, c2] for c1 in (low, high, kink) for c2 in (low, high, c1)]
+
+def reachable_flags(bands, now=None):
+    # {symbol: (EMA_200, RSI, MACD gap) each reachable?} for symbols whose cache is at most
+    # one bar behind; bands: {symbol: (low, high)} for the unseen closes
+    now = now or time.time()
+    history_series, window_bars, owners = {}, [], []
+    for symbol, (low, high) in bands.items():
+        candles = candle_store.load_candles(symbol, "15min")
+        history = candles.since(now - CONTEXT_DAYS * 86400) if candles is not None else None
+        if history is None or len(history.since(now - STATE_DAYS * 86400)) <= STATE_MIN_BARS:
+            continue
+        last_start = int(history.ts[-1]) * 60
+        n_unseen = 1 + session_bars_after(last_start, now)
+        if n_unseen > 2:
+            continue
+        n_window = len(history.since(now - STATE_DAYS * 86400)) - 1
+        seen = history.slice(stop=-1).columns()  # the cached last bar may have been saved mid-bar
+        for path in close_paths(float(seen["close"][-1]), low, high, n_unseen):
+            cols = {name: np.append(values, [values[-1]] * len(path)) for name, values in seen.items()}
+            cols["ts"] = np.append(seen["ts"], last_start + BAR_SECONDS * np.arange(len(path)))
+            for name in ["open", "high", "low", "close"]:
+                cols[name][-len(path):] = path
+            history_series[f"{symbol}#{len(owners)}"] = cols
+            window_bars.append(n_window + len(path))
+            owners.append(symbol)
+    if not history_series:
+        return {}
+
+    # EMA_50/EMA_200 over the CONTEXT_DAYS history, the rest over the STATE_DAYS window, as the scanner does
+    history = build_panel_from_columns(history_series)
+    trend = {f"EMA_{n}": ema(history["close"], history["start"], n, sma_seed=False) for n in (50, 200)}
+    series = {}
+    for row, key in enumerate(history["symbols"]):
+        n = window_bars[row]
+        series[key] = {name: history_series[key][name][-n:] for name in ["ts"] + PANEL_COLUMNS}
+        series[key].update({name: values[row, -n:] for name, values in trend.items()})
+    panel = add_panel_indicators(build_panel_from_columns(series))
+    close, ema200, rsi = panel["close"][:, -1], panel["EMA_200"][:, -1], panel["RSI_14"][:, -1]
+    gap = panel["MACD"][:, -1] - panel["MACD_signal"][:, -1]
+    owners = np.array(owners)
+    flags = {}
+    for symbol in dict.fromkeys(owners):
+        rows = owners == symbol
+        if np.isnan(ema200[rows]).any() or np.isnan(rsi[rows]).any() or np.isnan(gap[rows]).any():
+            continue
+        flags[symbol] = (bool((close[rows] > ema200[rows]).any()), bool((rsi[rows] > 40).any()),
+                         bool(gap[rows].max() >= -0.3 and gap[rows].min() < 0))
+    return flags
+
+def confluence_ceiling(flags):
+    # Highest confluence still reachable: volume surge and engulfing are always possible
+    return 2 + sum(flags)
+
+# --- Funnel ---
+def before_open(now=None):
+    # A weekday before 09:15 IST: today's quotes carry no trades yet
+    now = now or time.time()
+    day, seconds = divmod(int(now) + IST_OFFSET, 86400)
+    return (day + 3) % 7 < 5 and seconds < SESSION_OPEN
+
+def run_funnel(client, symbols, tokens, now=None):
+    # Returns (survivors in input order, {symbol: elimination reason})
+    eliminated = {}
+
+    with metrics.stage("prescreen_quotes"):
+        quotes = fetch_quotes(client, [tokens[s] for s in symbols])
+
+    # Pre-open (or an early run where nothing has traded yet), zero volume says nothing
+    # about the symbol, so the volume stage only runs once the session has trades
+    check_volume = not before_open(now) and any((q.get("tradeVolume") or 0) > 0 for q in quotes.values())
+    if quotes and not check_volume:
+        print("🪣 Pre-screen: no trades yet this session; skipping the volume stage")
+    bands = {}
+    for symbol in symbols:
+        quote = quotes.get(str(tokens[symbol]))
+        if quote is None:
+            continue  # no quote: let the full fetch decide
+        if check_volume and (quote.get("tradeVolume") or 0) < MIN_DAY_VOLUME:
+            eliminated[symbol] = "prescreen_volume"
+        elif quote.get("ltp") and quote.get("low") and quote.get("high"):
+            ltp = float(quote["ltp"])
+            bands[symbol] = (min(float(quote["low"]), ltp) * (1 - PRICE_TOLERANCE),
+                             max(float(quote["high"]), ltp) * (1 + PRICE_TOLERANCE))
+    after_quotes = len(symbols) - len(eliminated)
+
+    with metrics.stage("prescreen_cached_state"):
+        states = reachable_flags(bands)
+    for symbol, flags in states.items():
+        if confluence_ceiling(flags) < MIN_CONFLUENCE:
+            eliminated[symbol] = "prescreen_indicators"
+
+    for symbol, reason in eliminated.items():
+        metrics.skip(symbol, reason)
+    survivors = [s for s in symbols if s not in eliminated]
+    by_volume = len(symbols) - after_quotes
+    by_state = after_quotes - len(survivors)
+    metrics.incr("prescreen_eliminated_volume", by_volume)
+    metrics.incr("prescreen_eliminated_indicators", by_state)
+    print(f"🪣 Pre-screen: {len(symbols)} symbols → {len(quotes)} quoted, {by_volume} untraded/low volume dropped"
+          f" → {len(states)} with current cached candles, {by_state} out of reach dropped → {len(survivors)} to fetch")
+    return survivors, eliminated
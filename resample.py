@@ -0,0 +1,91 @@
+# resample.py
+# 🕰️ NSE-session-aware resampling: hourly/daily bars from one 15-minute fetch
+#
+# Bars are anchored at the 09:15 open of each session (09:15, 10:15, … 15:15 for
+# hourly; one bar per trading day for daily) and never span the overnight gap, so
+# higher timeframes come from the candles already fetched instead of extra API calls.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from candle_store import frame_to_columns, Candles
+
+SESSION_OPEN = pd.Timedelta(hours=9, minutes=15)
+SESSION_MINUTES = 375  # 09:15–15:30
+INTERVAL_MINUTES = {"1min": 1, "5min": 5, "15min": 15, "30min": 30, "60min": 60, "1day": SESSION_MINUTES}
+OHLCV = ["open", "high", "low", "close", "volume"]
+
+CONTEXT_DAYS = int(os.getenv("MTF_HISTORY_DAYS", "60"))  # fetched once per symbol; EMA_50/EMA_200 and hourly/daily bars use all of it
+
+# Higher-timeframe trend flags added to scanner candidates
+CONTEXT_COLUMNS = ["above_ema200_60min", "above_ema20_1day"]
+
+# --- Resampling ---
+def session_bins(index, minutes):
+    # Start of the session-anchored bin each timestamp falls in
+    day = index.normalize()
+    if minutes >= SESSION_MINUTES:
+        return day + SESSION_OPEN
+    step = pd.Timedelta(minutes=minutes)
+    return day + SESSION_OPEN + ((index - day - SESSION_OPEN) // step) * step
+
+def resample_bars(df, minutes):
+    # OHLCV bars of `minutes` (or daily) from finer, time-sorted bars; empty bins are never created
+    if df.empty:
+        return df[OHLCV].copy()
+    bins = session_bins(df.index, minutes)
+    keys = bins.asi8
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+
+    columns = frame_to_columns(df)
+    out = pd.DataFrame({
+        "open": columns["open"][starts],
+        "high": np.maximum.reduceat(columns["high"], starts),
+        "low": np.minimum.reduceat(columns["low"], starts),
+        "close": columns["close"][ends],
+        "volume": np.add.reduceat(columns["volume"], starts),
+    }, index=bins[starts])
+    out.index.name = df.index.name
+    return out
+
+def add_trend_columns(df):
+    # Same EMA_50 / EMA_200 columns get_stock_data adds to fetched candles
+    df['EMA_50'] = df['close'].ewm(span=50, adjust=False).mean()
+    df['EMA_200'] = df['close'].ewm(span=200, adjust=False).mean()
+    return df
+
+def multi_timeframe(df, base="15min", intervals=("15min", "60min", "1day")):
+    # {interval: frame with EMA_50/EMA_200} from one base-interval frame (or Candles).
+    # Resampling runs on pandas, so Candles are widened to a frame once here and the
+    # results are frames either way.
+    if isinstance(df, Candles):
+        df = df.to_frame()
+    frames = {}
+    for interval in intervals:
+        if INTERVAL_MINUTES[interval] < INTERVAL_MINUTES[base]:
+            raise ValueError(f"Cannot build {interval} bars from {base} candles")
+        bars = df[OHLCV].copy() if interval == base else resample_bars(df, INTERVAL_MINUTES[interval])
+        frames[interval] = add_trend_columns(bars)
+    return frames
+
+def last_days(df, days, now=None):
+    # The trailing `days` window of a longer history (what get_stock_data(days=days) returns)
+    now = pd.Timestamp.now(tz="UTC") if now is None else now
+    if isinstance(df, Candles):
+        return df.last_days(days, now.timestamp())
+    return df[df.index >= now - pd.Timedelta(days=days)]
+
+# --- Context for scoring ---
+def timeframe_context(frames):
+    hourly, daily = frames.get("60min"), frames.get("1day")
+    context = dict.fromkeys(CONTEXT_COLUMNS)
+    # Only report a trend once the EMA has seen as many bars as its span
+    if hourly is not None and len(hourly) >= 200:
+        context["above_ema200_60min"] = bool(hourly["close"].iloc[-1] > hourly["EMA_200"].iloc[-1])
+    if daily is not None and len(daily) >= 20:
+        ema20 = daily["close"].ewm(span=20, adjust=False).mean()
+        context["above_ema20_1day"] = bool(daily["close"].iloc[-1] > ema20.iloc[-1])
+    return context
@@ -0,0 +1,132 @@
+# scan_history.py
+# 🗂️ Date-partitioned Parquet history of every scan's scored universe
+#
+# Each run appends one file per trading day under scan_history/date=YYYY-MM-DD/,
+# with typed columns for every scored symbol (graded or not). Queries filter on the
+# date partition and symbol, so pyarrow only opens the partitions a question needs.
+# Usage: python scan_history.py [--runs 3] [--min-rise 1]
+
+import os
+import argparse
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = ds = None  # history is skipped without pyarrow; scans are unaffected
+
+HISTORY_DIR = os.getenv("SCAN_HISTORY_DIR", "scan_history")
+
+FIELDS = [
+    ("run_ts", "timestamp"), ("source", "string"), ("symbol", "string"), ("grade", "string"),
+    ("confluence", "int8"), ("closeness_score", "int8"), ("actual_diff", "float32"), ("rsi", "float32"),
+    ("volume", "int64"), ("volume_avg", "int64"), ("early_volume", "int64"),
+    ("volume_surge", "bool"), ("engulfing", "bool"), ("above_ema200", "bool"), ("rsi_ok", "bool"),
+    ("high_early_volume", "bool"), ("momentum", "bool"),
+    ("above_ema200_60min", "bool"), ("above_ema20_1day", "bool"),  # only known for graded rows
+]
+
+def _schema():
+    types = {"timestamp": pa.timestamp("s"), "string": pa.string(), "int8": pa.int8(), "int64": pa.int64(),
+             "float32": pa.float32(), "bool": pa.bool_()}
+    return pa.schema([(name, types[kind]) for name, kind in FIELDS])
+
+def _partitioning():
+    return ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+def _dataset(history_dir):
+    if not os.path.isdir(history_dir):
+        return None
+    return ds.dataset(history_dir, format="parquet", partitioning=_partitioning(), schema=_schema().append(
+        pa.field("date", pa.string())))
+
+# --- Write ---
+def record_scan(scores, source="scanner", when=None, history_dir=None):
+    # scores: scored rows for the whole universe (panel_scoring columns, optional grade/context)
+    if pa is None or scores is None or len(scores) == 0:
+        return 0
+    when = when or datetime.now()
+    history_dir = history_dir or HISTORY_DIR
+    df = pd.DataFrame(scores).reindex(columns=[name for name, _ in FIELDS])
+    df["run_ts"], df["source"] = when.replace(microsecond=0), source
+    df["date"] = when.strftime("%Y-%m-%d")
+    table = pa.Table.from_pandas(df, schema=_schema().append(pa.field("date", pa.string())), preserve_index=False)
+    ds.write_dataset(table, history_dir, format="parquet", partitioning=_partitioning(),
+                     basename_template=f"{source}-{when.strftime('%H%M%S')}-{os.getpid()}-{{i}}.parquet",
+                     existing_data_behavior="overwrite_or_ignore")
+    return len(df)
+
+# --- Query ---
+def _dates(history_dir):
+    # Partition dates on disk, newest first (directory names only; no files are read)
+    if not os.path.isdir(history_dir):
+        return []
+    return sorted((d.split("=", 1)[1] for d in os.listdir(history_dir) if d.startswith("date=")), reverse=True)
+
+def _read(condition, columns, history_dir):
+    dataset = _dataset(history_dir or HISTORY_DIR) if pa is not None else None
+    if dataset is None:
+        return pd.DataFrame(columns=columns or [name for name, _ in FIELDS])
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+def load_history(since=None, symbols=None, source=None, columns=None, history_dir=None):
+    # Rows on or after `since` (date or "YYYY-MM-DD"), optionally for some symbols / one source only
+    conditions = []
+    if since is not None:
+        conditions.append(ds.field("date") >= pd.Timestamp(since).strftime("%Y-%m-%d"))
+    if symbols is not None:
+        conditions.append(ds.field("symbol").isin(list(symbols)))
+    if source is not None:
+        conditions.append(ds.field("source") == source)
+    condition = None
+    for c in conditions:
+        condition = c if condition is None else condition & c
+    return _read(condition, columns, history_dir)
+
+def recent_runs(n_runs, source="scanner", history_dir=None):
+    # Timestamps of the last n runs, reading run_ts from the newest partitions only
+    runs = []
+    for date in _dates(history_dir or HISTORY_DIR):
+        if len(runs) >= n_runs:
+            break
+        day = _read((ds.field("date") == date) & (ds.field("source") == source), ["run_ts"], history_dir)
+        runs += sorted(day["run_ts"].unique(), reverse=True)
+    return sorted(runs[:n_runs])
+
+def confluence_risers(n_runs=3, min_rise=1, source="scanner", history_dir=None):
+    # Symbols scored in each of the last n runs whose confluence never fell and rose by >= min_rise
+    runs = recent_runs(n_runs, source, history_dir)
+    if len(runs) < 2:
+        return pd.DataFrame(columns=["symbol", "first", "last", "rise"])
+    history = load_history(since=runs[0], source=source, columns=["run_ts", "symbol", "confluence"],
+                           history_dir=history_dir)
+    history = history[history["run_ts"].isin(runs)]
+    by_run = history.pivot_table(index="symbol", columns="run_ts", values="confluence", aggfunc="last")
+    by_run = by_run.dropna()
+    values = by_run.to_numpy()
+    steady = (values[:, 1:] >= values[:, :-1]).all(axis=1)
+    rise = values[:, -1] - values[:, 0]
+    risers = pd.DataFrame({"symbol": by_run.index, "first": values[:, 0].astype(int),
+                           "last": values[:, -1].astype(int), "rise": rise.astype(int)})
+    risers = risers[steady & (rise >= min_rise)]
+    return risers.sort_values(["rise", "last"], ascending=False).reset_index(drop=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Symbols whose confluence rose over recent scans")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--min-rise", type=int, default=1)
+    parser.add_argument("--source", default="scanner", choices=["scanner", "pipeline"])
+    args = parser.parse_args()
+
+    if pa is None:
+        print("❌ pyarrow is not installed; no scan history available")
+    else:
+        risers = confluence_risers(args.runs, args.min_rise, args.source)
+        if risers.empty:
+            print(f"😐 No symbols rose in confluence over the last {args.runs} runs")
+        else:
+            print(f"📈 Confluence rising over the last {args.runs} runs:")
+            print(risers.to_string(index=False))
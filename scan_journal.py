@@ -0,0 +1,106 @@
+# scan_journal.py
+# 📒 SQLite checkpoint journal for scanner runs: per-symbol results and skip reasons
+#
+# Every scanned batch is committed as it finishes, so a crashed or interrupted run
+# can be resumed (top_losers_macd_bot.py --resume) without rescanning finished symbols.
+
+import os
+import json
+import sqlite3
+from datetime import datetime
+
+JOURNAL_PATH = os.getenv("SCAN_JOURNAL_PATH",
+                         os.path.join(os.getenv("MACD_CACHE_DIR", ".cache"), "scan_journal.sqlite"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at  TEXT NOT NULL,
+    finished_at TEXT,
+    universe    TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id     INTEGER NOT NULL,
+    symbol     TEXT NOT NULL,
+    seq        INTEGER NOT NULL,
+    status     TEXT NOT NULL,   -- scored | skipped
+    grade      TEXT,            -- strong / moderate / watchlist, NULL below watchlist
+    reason     TEXT,            -- skip reason
+    attempts   INTEGER NOT NULL DEFAULT 1,
+    payload    TEXT,            -- candidate row (JSON) for graded symbols
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (run_id, symbol)
+);
+"""
+
+def _json_default(value):
+    # numpy scalars (bool_, int64, float64) in candidate rows
+    return value.item() if hasattr(value, "item") else str(value)
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+class ScanJournal:
+    def __init__(self, path=JOURNAL_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    # --- Runs ---
+    def start_run(self, universe):
+        with self.conn:
+            cur = self.conn.execute("INSERT INTO runs (started_at, universe) VALUES (?, ?)",
+                                    (_now(), json.dumps(list(universe))))
+        return cur.lastrowid
+
+    def unfinished_run(self):
+        row = self.conn.execute(
+            "SELECT run_id, universe FROM runs WHERE finished_at IS NULL ORDER BY run_id DESC LIMIT 1"
+        ).fetchone()
+        return (row[0], json.loads(row[1])) if row else (None, None)
+
+    def finish_run(self, run_id):
+        with self.conn:
+            self.conn.execute("UPDATE runs SET finished_at = ? WHERE run_id = ?", (_now(), run_id))
+
+    # --- Per-symbol checkpoints ---
+    def record(self, run_id, positions, symbols, graded=None, skip_reasons=None):
+        # One transaction per batch. graded: symbol -> (grade, row); skip_reasons: symbol -> reason;
+        # every other symbol in `symbols` was scored below watchlist.
+        graded, skip_reasons = graded or {}, skip_reasons or {}
+        rows = []
+        for symbol in symbols:
+            grade, payload = graded.get(symbol, (None, None))
+            reason = skip_reasons.get(symbol)
+            rows.append((run_id, symbol, positions[symbol], "skipped" if reason else "scored", grade, reason,
+                         json.dumps(payload, default=_json_default) if payload is not None else None, _now()))
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO results (run_id, symbol, seq, status, grade, reason, payload, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (run_id, symbol) DO UPDATE SET
+                    status = excluded.status, grade = excluded.grade, reason = excluded.reason,
+                    payload = excluded.payload, updated_at = excluded.updated_at,
+                    attempts = results.attempts + 1
+            """, rows)
+
+    def done_symbols(self, run_id):
+        return {row[0] for row in self.conn.execute("SELECT symbol FROM results WHERE run_id = ?", (run_id,))}
+
+    def skipped(self, run_id):
+        return self.conn.execute(
+            "SELECT symbol, reason, attempts FROM results WHERE run_id = ? AND status = 'skipped' ORDER BY seq",
+            (run_id,)
+        ).fetchall()
+
+    def graded(self, run_id):
+        # grade -> candidate rows, in universe order (as the scanner accumulates them)
+        results = {"strong": [], "moderate": [], "watchlist": []}
+        for grade, payload in self.conn.execute(
+            "SELECT grade, payload FROM results WHERE run_id = ? AND grade IS NOT NULL ORDER BY seq", (run_id,)
+        ):
+            results[grade].append(json.loads(payload))
+        return results
+
+    def close(self):
+        self.conn.close()
@@ -1,12 +1,178 @@
 # smart_login.py
+# 🔐 SmartAPI client with a shared on-disk session (log in once, reuse across runs and bots)
+#
+# The JWT/refresh/feed tokens are cached in a 0600 file. Processes take a file lock
+# before logging in, so bots starting together share one login. Tokens are refreshed
+# with the refresh token shortly before they expire, and any data call that fails
+# with an auth error re-establishes the session and is retried once.
 
 from SmartApi.smartConnect import SmartConnect
+from SmartApi.smartExceptions import TokenException
 import pyotp
 import os
+import json
+import time
+import base64
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
+import metrics
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # no cross-process lock (Windows): concurrent first runs may each log in
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+SESSION_PATH = os.getenv("SMARTAPI_SESSION_PATH",
+                         os.path.join(os.getenv("MACD_CACHE_DIR", ".cache"), "smartapi_session.json"))
+REFRESH_MARGIN = float(os.getenv("SMARTAPI_REFRESH_MARGIN", "1800"))  # seconds before expiry to refresh
+
+# Invalid/expired/missing token, invalid/expired refresh token, session expired, not logged in
+AUTH_ERROR_CODES = {"AG8001", "AG8002", "AG8003", "AB8050", "AB8051", "AB1010", "AB1011"}
+# Whole messages for the same failures when a response carries no code ("Invalid symboltoken" is a data error)
+AUTH_ERROR_MESSAGES = {"invalid token", "token expired", "invalid refresh token", "invalid session",
+                       "session expired", "user not logged in"}
+SESSION_ROUTES = {"api.login", "api.logout", "api.token", "api.refresh", "api.user.profile"}  # generateSession calls getProfile
+
+# --- Session file ---
+def _token_expiry(jwt_token):
+    # Read `exp` from the JWT payload; SmartAPI sessions otherwise end at midnight
+    try:
+        payload = jwt_token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        midnight = (datetime.now() + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return midnight.timestamp()
+
+@contextmanager
+def _session_lock(path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), mode=0o700, exist_ok=True)
+    with open(path + ".lock", "a") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def _load_session(path, client_id):
+    try:
+        with open(path) as f:
+            session = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return session if session.get("client_id") == client_id else None
+
+def _save_session(path, session):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(session, f)
+    os.replace(tmp_path, path)
+
+def is_auth_error(response):
+    if not isinstance(response, dict) or response.get("status", True):
+        return False
+    return (str(response.get("errorcode", "")).upper() in AUTH_ERROR_CODES
+            or str(response.get("message", "")).strip().rstrip(".").lower() in AUTH_ERROR_MESSAGES)
+
+# --- Client ---
+class ManagedSmartConnect(SmartConnect):
+    def __init__(self, api_key, client_id, password, totp_secret, session_path=SESSION_PATH, **kwargs):
+        super().__init__(api_key=api_key, **kwargs)
+        self.client_id = client_id
+        self.password = password
+        self.totp_secret = totp_secret
+        self.session_path = session_path
+        self.expires_at = 0.0
+        self._renew_lock = threading.Lock()
+
+    def _apply(self, session):
+        self.setAccessToken(session["jwt_token"])
+        self.setRefreshToken(session["refresh_token"])
+        self.setFeedToken(session["feed_token"])
+        self.setUserId(session.get("user_id") or self.client_id)
+        self.expires_at = session["expires_at"]
+
+    def _session(self):
+        return {
+            "client_id": self.client_id, "user_id": getattr(self, "userId", None),
+            "jwt_token": self.access_token, "refresh_token": self.refresh_token,
+            "feed_token": self.feed_token, "expires_at": _token_expiry(self.access_token),
+            "saved_at": time.time(),
+        }
+
+    def _login(self):
+        totp = pyotp.TOTP(self.totp_secret).now()
+        auth_data = self.generateSession(self.client_id, self.password, totp)
+        if not auth_data or not auth_data.get("status", True) or "data" not in auth_data:
+            raise ConnectionError("Login failed – check credentials or TOTP")
+        metrics.incr("smartapi_login")
+
+    def _refresh(self):
+        # generateToken raises (KeyError/TypeError) when the refresh token is refused
+        self.generateToken(self.refresh_token)
+        if str(self.access_token).startswith("Bearer "):
+            self.setAccessToken(self.access_token[len("Bearer "):])
+        metrics.incr("smartapi_token_refresh")
+
+    def ensure_session(self, stale_token=None):
+        # Adopt the shared cached session, refresh it, or log in — one process at a time
+        with _session_lock(self.session_path):
+            cached = _load_session(self.session_path, self.client_id)
+            if cached and cached["expires_at"] - time.time() > REFRESH_MARGIN and cached["jwt_token"] != stale_token:
+                self._apply(cached)
+                metrics.incr("smartapi_session_reused")
+                return "reused"
+
+            how = "login"
+            if cached and cached.get("refresh_token"):
+                self._apply(cached)
+                try:
+                    self._refresh()
+                    how = "refreshed"
+                except Exception as e:
+                    logger.warning(f"SmartAPI token refresh failed ({str(e)}); logging in again")
+            if how == "login":
+                self._login()
+            _save_session(self.session_path, self._session())
+            self.expires_at = _token_expiry(self.access_token)
+            return how
+
+    def _renew(self, failed_token):
+        with self._renew_lock:
+            if self.access_token != failed_token:
+                return  # another thread already renewed the session
+            self.ensure_session(stale_token=failed_token)
+
+    def _request(self, route, method, parameters=None):
+        if route in SESSION_ROUTES:
+            return super()._request(route, method, parameters)
+        if time.time() > self.expires_at - REFRESH_MARGIN:
+            self._renew(self.access_token)
+
+        token = self.access_token
+        try:
+            response = super()._request(route, method, parameters)
+        except TokenException as e:
+            response = {"status": False, "message": str(e), "errorcode": "AG8001"}
+        if not is_auth_error(response):
+            return response
+
+        # Session died mid-run (expired, revoked, or replaced by a login elsewhere)
+        metrics.incr("smartapi_auth_errors")
+        logger.warning(f"SmartAPI auth error on {route}: {response.get('message')}; re-establishing session")
+        self._renew(token)
+        return super()._request(route, method, parameters)
+
 def get_smartapi_client():
     try:
         api_key = os.getenv("SMARTAPI_KEY")
@@ -17,15 +183,10 @@ def get_smartapi_client():
         if not all([api_key, client_id, password, totp_secret]):
             raise ValueError("Missing SmartAPI environment variables.")
 
-        client = SmartConnect(api_key=api_key)
-        totp = pyotp.TOTP(totp_secret).now()
-
-        auth_data = client.generateSession(client_id, password, totp)
-
-        if not auth_data or "data" not in auth_data:
-            raise ConnectionError("Login failed – check credentials or TOTP")
+        client = ManagedSmartConnect(api_key, client_id, password, totp_secret)
+        how = client.ensure_session()
 
-        print("✅ SmartAPI login successful")
+        print("✅ SmartAPI login successful" if how == "login" else f"✅ SmartAPI session {how}")
         return client
 
     except Exception as e:
@@ -0,0 +1,221 @@
+# streaming_indicators.py
+# 🔁 Incremental per-symbol indicator state: O(1) work per new candle, saved between runs
+#
+# Produces the same EMA/RSI/MACD values as add_technical_indicators would over the
+# same candle history, but only ever touches the newest bar.
+
+import os
+import json
+import logging
+from collections import deque
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from candle_store import frame_to_columns, columns_to_frame
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.getenv("INDICATOR_STATE_DIR", "indicator_state")
+STATE_VERSION = 1
+WINDOW = 20  # recent bars kept for rolling volume, candle patterns and MACD gap checks
+IST_OFFSET = 19800  # seconds; sessions are Asia/Kolkata dates
+
+BAR_FIELDS = ["ts", "open", "high", "low", "close", "volume"]
+INDICATOR_FIELDS = ["EMA_5", "EMA_13", "EMA_21", "EMA_50", "EMA_200",
+                    "RSI_14", "MACD", "MACD_signal", "MACD_hist"]
+
+# --- Recursive building blocks ---
+def _ema_state(length, sma_seed=True):
+    return {"length": length, "sma_seed": sma_seed, "count": 0, "seed_sum": 0.0, "value": None}
+
+def _ema_update(state, x):
+    # pandas_ta.ema when sma_seed, else Series.ewm(span=length, adjust=False)
+    if x is None or np.isnan(x):
+        return state["value"]
+    alpha = 2.0 / (state["length"] + 1)
+    state["count"] += 1
+    if state["sma_seed"] and state["count"] < state["length"]:
+        state["seed_sum"] += x
+        return None
+    if state["sma_seed"] and state["count"] == state["length"]:
+        state["value"] = (state["seed_sum"] + x) / state["length"]
+    elif state["value"] is None:
+        state["value"] = x
+    else:
+        state["value"] = ((1 - alpha) * state["value"] + alpha * x) / ((1 - alpha) + alpha)
+    return state["value"]
+
+def _rma_state(length):
+    return {"length": length, "nobs": 0, "weighted": None, "old_wt": 1.0}
+
+def _rma_update(state, x):
+    # Series.ewm(alpha=1/length, min_periods=length).mean(), as pandas_ta.rma
+    if state["weighted"] is None:
+        state["weighted"] = x
+        state["old_wt"] = 1.0
+    else:
+        state["old_wt"] *= 1.0 - 1.0 / state["length"]
+        state["weighted"] = (state["old_wt"] * state["weighted"] + x) / (state["old_wt"] + 1.0)
+        state["old_wt"] += 1.0
+    state["nobs"] += 1
+    return state["weighted"] if state["nobs"] >= state["length"] else None
+
+# --- Per-symbol state ---
+class IndicatorState:
+    def __init__(self):
+        self.ema = {
+            "EMA_5": _ema_state(5), "EMA_13": _ema_state(13), "EMA_21": _ema_state(21),
+            "EMA_50": _ema_state(50, sma_seed=False), "EMA_200": _ema_state(200, sma_seed=False),
+        }
+        self.macd_fast = _ema_state(12)
+        self.macd_slow = _ema_state(26)
+        self.macd_signal = _ema_state(9)
+        self.rsi_gain = _rma_state(14)
+        self.rsi_loss = _rma_state(14)
+        self.prev_close = None
+        self.bars = 0
+        self.last_ts = None
+        self.early_volume = None
+        self.recent = deque(maxlen=WINDOW)
+
+    # --- Updates ---
+    def update(self, ts, open_, high, low, close, volume):
+        # Feed one closed candle; bars at or before last_ts are ignored
+        ts = int(ts)
+        if self.last_ts is not None and ts <= self.last_ts:
+            return False
+
+        values = {name: _ema_update(state, close) for name, state in self.ema.items()}
+
+        fast = _ema_update(self.macd_fast, close)
+        slow = _ema_update(self.macd_slow, close)
+        macd = fast - slow if fast is not None and slow is not None else None
+        signal = _ema_update(self.macd_signal, macd) if macd is not None else None
+        values["MACD"] = macd
+        values["MACD_signal"] = signal
+        values["MACD_hist"] = macd - signal if signal is not None else None
+
+        rsi = None
+        if self.prev_close is not None:
+            diff = close - self.prev_close
+            gain = _rma_update(self.rsi_gain, max(diff, 0.0))
+            loss = _rma_update(self.rsi_loss, min(diff, 0.0))
+            if gain is not None and loss is not None and gain + abs(loss) != 0:
+                rsi = 100 * gain / (gain + abs(loss))
+        values["RSI_14"] = rsi
+        self.prev_close = close
+
+        # Volume of the session's opening bar: reset on the first bar of each IST date
+        if self.last_ts is None or (ts + IST_OFFSET) // 86400 != (self.last_ts + IST_OFFSET) // 86400:
+            self.early_volume = volume
+        self.bars += 1
+        self.last_ts = ts
+        self.recent.append([ts, open_, high, low, close, volume] +
+                           [values[name] for name in INDICATOR_FIELDS])
+        return True
+
+    def update_frame(self, df):
+        # Feed every row of an OHLCV DataFrame newer than last_ts; returns how many were applied
+        if df.empty:
+            return 0
+        columns = frame_to_columns(df)
+        applied = 0
+        for i in range(len(columns["ts"])):
+            applied += self.update(*(columns[name][i].item() for name in BAR_FIELDS))
+        return applied
+
+    @classmethod
+    def from_history(cls, df, trend_history=None):
+        # trend_history: older bars that only warm EMA_50/EMA_200, which the scanner
+        # computes over its whole fetch rather than the scored window
+        state = cls()
+        if trend_history is not None and len(trend_history):
+            for close in frame_to_columns(trend_history)["close"]:
+                for name in ["EMA_50", "EMA_200"]:
+                    _ema_update(state.ema[name], float(close))
+        state.update_frame(df)
+        return state
+
+    # --- Views ---
+    def frame(self):
+        # Recent bars with indicators, in the shape add_technical_indicators returns
+        rows = list(self.recent)
+        columns = {name: np.array([row[i] for row in rows]) for i, name in enumerate(BAR_FIELDS)}
+        df = columns_to_frame(columns)
+        df["volume"] = df["volume"].astype(np.int64)
+        for i, name in enumerate(INDICATOR_FIELDS, start=len(BAR_FIELDS)):
+            df[name] = np.array([np.nan if row[i] is None else row[i] for row in rows], dtype=float)
+        return df
+
+    # --- Persistence ---
+    def to_dict(self):
+        return {
+            "version": STATE_VERSION,
+            "ema": self.ema,
+            "macd_fast": self.macd_fast, "macd_slow": self.macd_slow, "macd_signal": self.macd_signal,
+            "rsi_gain": self.rsi_gain, "rsi_loss": self.rsi_loss,
+            "prev_close": self.prev_close, "bars": self.bars, "last_ts": self.last_ts,
+            "early_volume": self.early_volume, "recent": list(self.recent),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != STATE_VERSION:
+            raise ValueError(f"Unsupported indicator state version: {data.get('version')}")
+        state = cls()
+        for key in ["ema", "macd_fast", "macd_slow", "macd_signal", "rsi_gain", "rsi_loss",
+                    "prev_close", "bars", "last_ts", "early_volume"]:
+            setattr(state, key, data[key])
+        state.recent.extend(data["recent"])
+        return state
+
+# --- Disk helpers ---
+def _state_path(symbol, interval, state_dir=None):
+    return os.path.join(state_dir or STATE_DIR, interval, f"{quote(str(symbol), safe='')}.json")
+
+def load_state(symbol, interval="15min", state_dir=None):
+    path = _state_path(symbol, interval, state_dir)
+    try:
+        with open(path) as f:
+            return IndicatorState.from_dict(json.load(f))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Discarding indicator state for {symbol}: {str(e)}")
+        return None
+
+def save_state(symbol, state, interval="15min", state_dir=None):
+    path = _state_path(symbol, interval, state_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state.to_dict(), f)
+    os.replace(tmp_path, path)
+
+def closed_bars(df, interval_minutes=15, now=None):
+    # Drop the still-forming candle so state is only ever advanced by final bars
+    if df.empty:
+        return df
+    now = pd.Timestamp.now(tz=df.index.tz) if now is None else now
+    return df[df.index + pd.Timedelta(minutes=interval_minutes) <= now]
+
+def advance_state(state, bars):
+    # Advance state with new closed bars, or warm-start it from them.
+    # A state whose last bar predates bars entirely has a gap and is rebuilt.
+    if state is not None and len(bars):
+        first_ts = frame_to_columns(bars.iloc[:1])["ts"][0]
+        if state.last_ts is None or state.last_ts < first_ts:
+            state = None
+    if state is None:
+        return IndicatorState.from_history(bars)
+    state.update_frame(bars)
+    return state
+
+def sync_state(symbol, df, interval="15min", interval_minutes=15, state_dir=None, now=None):
+    # Advance the saved state with df's new closed bars, or warm-start it from df
+    bars = closed_bars(df, interval_minutes, now)
+    state = advance_state(load_state(symbol, interval, state_dir), bars)
+    save_state(symbol, state, interval, state_dir)
+    return state
@@ -0,0 +1,326 @@
+# telegram_dispatcher.py
+# 📬 Background Telegram sender: pooled session, rate limits, message packing, no lost alerts
+#
+# send() only queues the text and returns. A worker thread packs alerts queued for
+# the same chat into as few messages as fit under Telegram's 4096-char limit, paces
+# them under the per-chat and global quotas, honours 429 retry_after and retries
+# transient failures. Whatever is still unsent when the process exits (after a
+# bounded flush) is spooled to disk and re-sent by the next run.
+
+import os
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from fetch_scheduler import TokenBucket, RateLimiter
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_CHARS = int(os.getenv("TELEGRAM_MAX_CHARS", "4096"))
+# Telegram asks for ≤1 msg/sec per chat, ≤20 msg/min per group and ≤30 msg/sec overall
+CHAT_RATE_PER_SEC = float(os.getenv("TELEGRAM_CHAT_RATE_PER_SEC", "1"))
+CHAT_RATE_PER_MIN = float(os.getenv("TELEGRAM_CHAT_RATE_PER_MIN", "20"))
+GLOBAL_RATE_PER_SEC = float(os.getenv("TELEGRAM_GLOBAL_RATE_PER_SEC", "30"))
+BATCH_WINDOW = float(os.getenv("TELEGRAM_BATCH_WINDOW", "0.5"))  # seconds to collect alerts before packing
+FLUSH_TIMEOUT = float(os.getenv("TELEGRAM_FLUSH_TIMEOUT", "30"))
+MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "5"))
+SPOOL_PATH = os.getenv("TELEGRAM_SPOOL_PATH",
+                       os.path.join(os.getenv("MACD_CACHE_DIR", ".cache"), "telegram_spool.jsonl"))
+SEPARATOR = "\n\n"
+
+# --- Packing ---
+def message_length(text):
+    # Telegram counts UTF-16 code units, so emoji outside the BMP count twice
+    return len(text.encode("utf-16-le")) // 2
+
+def _hard_split(text, max_chars):
+    parts, current, length = [], [], 0
+    for ch in text:
+        width = 2 if ord(ch) > 0xFFFF else 1
+        if length + width > max_chars:
+            parts.append("".join(current))
+            current, length = [], 0
+        current.append(ch)
+        length += width
+    parts.append("".join(current))
+    return parts
+
+def split_message(text, max_chars=MAX_MESSAGE_CHARS, separators=(SEPARATOR, "\n")):
+    # Break an over-long message on blank lines, then lines, then characters
+    if message_length(text) <= max_chars:
+        return [text]
+    if not separators:
+        return _hard_split(text, max_chars)
+    pieces = []
+    for piece in text.split(separators[0]):
+        pieces.extend(split_message(piece, max_chars, separators[1:]))
+    return pack_messages(pieces, max_chars, separators[0])
+
+def pack_messages(texts, max_chars=MAX_MESSAGE_CHARS, separator=SEPARATOR):
+    # Greedily join texts (each already ≤ max_chars) into as few messages as fit
+    sep_length = message_length(separator)
+    messages, current, length = [], None, 0
+    for text in texts:
+        text_length = message_length(text)
+        if current is not None and length + sep_length + text_length <= max_chars:
+            current += separator + text
+            length += sep_length + text_length
+            continue
+        if current is not None:
+            messages.append(current)
+        current, length = text, text_length
+    if current is not None:
+        messages.append(current)
+    return messages
+
+def pack_alerts(texts, max_chars=MAX_MESSAGE_CHARS):
+    pieces = [piece for text in texts for piece in split_message(text, max_chars)]
+    return [m for m in pack_messages(pieces, max_chars) if m.strip()]
+
+# --- Dispatcher ---
+class TelegramDispatcher:
+    def __init__(self, api_url=None, spool_path=SPOOL_PATH, max_chars=MAX_MESSAGE_CHARS,
+                 batch_window=BATCH_WINDOW):
+        self.api_url = api_url or os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+        self.spool_path = os.path.abspath(spool_path)
+        self.max_chars = max_chars
+        self.batch_window = batch_window
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.global_limiter = RateLimiter([TokenBucket(GLOBAL_RATE_PER_SEC, 1)])
+        self.chat_limiters = {}
+
+        self.queue = queue.Queue()
+        self.inflight = []      # items/messages the worker holds but hasn't delivered yet
+        self.outstanding = 0    # alerts accepted by send() and not yet delivered or spooled
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.spool_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.closed = False
+
+        self.thread = threading.Thread(target=self._run, name="telegram-dispatcher", daemon=True)
+        self.thread.start()
+        self._replay_spool()
+
+    # --- Public API ---
+    def send(self, text, bot_token, chat_id, parse_mode="HTML"):
+        if not text or not text.strip():
+            return
+        if not bot_token or not chat_id:
+            metrics.incr("telegram_failed")
+            print("❌ Telegram bot token / chat id not configured; message not sent")
+            return
+        item = {"bot_token": bot_token, "chat_id": str(chat_id), "text": text, "parse_mode": parse_mode}
+        with self.lock:
+            if self.closed:
+                self._spool([item])
+                return
+            self.outstanding += 1
+        metrics.incr("telegram_queued")
+        self.queue.put(item)
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        # Wait (bounded) until everything queued so far is delivered or spooled
+        deadline = time.monotonic() + timeout
+        with self.idle:
+            while self.outstanding:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.idle.wait(remaining)
+        return True
+
+    def close(self, timeout=FLUSH_TIMEOUT):
+        self.flush(timeout)
+        self.stopping.set()
+        with self.lock:
+            self.closed = True
+            leftovers = list(self.inflight)
+            self.inflight.clear()
+        while True:
+            try:
+                leftovers.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        # A message mid-POST may be both delivered and spooled: a duplicate beats a lost alert
+        if leftovers:
+            self._spool(leftovers)
+            print(f"📥 Spooled {len(leftovers)} unsent Telegram message(s) to {self.spool_path}")
+
+    # --- Worker ---
+    def _run(self):
+        while not self.stopping.is_set():
+            try:
+                first = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            batch = self._collect(first)
+            self._deliver(batch)
+
+    def _collect(self, first):
+        # Hold the first alert briefly so alerts sent in a loop go out packed together
+        batch = [first]
+        with self.lock:
+            self.inflight.append(first)
+        deadline = time.monotonic() + self.batch_window
+        while not self.stopping.is_set():
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            with self.lock:
+                self.inflight.append(item)
+        return batch
+
+    def _deliver(self, batch):
+        groups = {}
+        for item in batch:
+            groups.setdefault((item["bot_token"], item["chat_id"], item["parse_mode"]), []).append(item["text"])
+        outgoing = [{"bot_token": bot_token, "chat_id": chat_id, "text": text, "parse_mode": parse_mode}
+                    for (bot_token, chat_id, parse_mode), texts in groups.items()
+                    for text in pack_alerts(texts, self.max_chars)]
+        metrics.incr("telegram_alerts_packed", len(batch))
+
+        with self.lock:
+            if self.stopping.is_set():
+                return
+            for item in batch:
+                self.inflight.remove(item)
+            self.inflight.extend(outgoing)
+
+        for message in outgoing:
+            delivered = self._send_one(message)
+            if self.stopping.is_set():
+                return  # close() spools what is still in flight
+            if not delivered:
+                self._spool([message])
+                print(f"📥 Telegram message spooled for the next run ({self.spool_path})")
+            with self.lock:
+                self.inflight.remove(message)
+
+        with self.idle:
+            self.outstanding -= len(batch)
+            if not self.outstanding:
+                self.idle.notify_all()
+
+    def _chat_limiter(self, chat_id):
+        limiter = self.chat_limiters.get(chat_id)
+        if limiter is None:
+            limiter = self.chat_limiters[chat_id] = RateLimiter([
+                TokenBucket(CHAT_RATE_PER_SEC, 1, capacity=1),
+                TokenBucket(CHAT_RATE_PER_MIN, 60),
+            ])
+        return limiter
+
+    def _send_one(self, message):
+        # True once delivered (or permanently rejected); False if it should be retried later
+        url = f"{self.api_url}/bot{message['bot_token']}/sendMessage"
+        payload = {"chat_id": message["chat_id"], "text": message["text"]}
+        if message["parse_mode"]:
+            payload["parse_mode"] = message["parse_mode"]
+        limiter = self._chat_limiter(message["chat_id"])
+
+        attempt = 0
+        while not self.stopping.is_set():
+            limiter.acquire()
+            self.global_limiter.acquire()
+            try:
+                with metrics.stage("telegram"):
+                    response = self.session.post(url, json=payload, timeout=10)
+            except requests.RequestException as e:
+                error = str(e)
+            else:
+                if response.ok:
+                    metrics.incr("telegram_sent")
+                    return True
+                try:
+                    body = response.json()
+                except ValueError:
+                    body = {}
+                error = body.get("description", response.text)
+
+                if response.status_code == 429:
+                    # Flood control: wait exactly as long as Telegram asks; not a failed attempt
+                    metrics.incr("telegram_rate_limited")
+                    retry_after = (body.get("parameters") or {}).get("retry_after", 1)
+                    self.stopping.wait(float(retry_after))
+                    continue
+                if response.status_code == 400 and "parse" in error.lower() and "parse_mode" in payload:
+                    # A split cut through an HTML tag; plain text still gets the alert out
+                    payload.pop("parse_mode")
+                    continue
+                if response.status_code < 500:
+                    metrics.incr("telegram_failed")
+                    print(f"❌ Telegram rejected message: {response.status_code} - {error}")
+                    return True
+
+            attempt += 1
+            metrics.incr("telegram_retries")
+            if attempt > MAX_RETRIES:
+                metrics.incr("telegram_failed")
+                logger.error(f"Giving up on Telegram message after {attempt} attempts: {error}")
+                return False
+            delay = min(30, 2 ** attempt) * (0.5 + random.random() / 2)
+            logger.warning(f"Telegram send failed ({error}); retrying in {delay:.1f}s")
+            self.stopping.wait(delay)
+        return False
+
+    # --- Spool (messages that could not be delivered this run) ---
+    def _spool(self, items):
+        with self.spool_lock:
+            os.makedirs(os.path.dirname(self.spool_path), exist_ok=True)
+            fd = os.open(self.spool_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+            with os.fdopen(fd, "a", encoding="utf-8") as f:
+                for item in items:
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        metrics.incr("telegram_spooled", len(items))
+
+    def _replay_spool(self):
+        with self.spool_lock:
+            try:
+                with open(self.spool_path, encoding="utf-8") as f:
+                    lines = f.read().splitlines()
+                os.remove(self.spool_path)
+            except OSError:
+                return
+        items = []
+        for line in lines:
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                continue
+        if items:
+            print(f"📤 Re-sending {len(items)} spooled Telegram message(s)")
+        for item in items:
+            self.send(item["text"], item["bot_token"], item["chat_id"], item.get("parse_mode", "HTML"))
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = TelegramDispatcher()
+            atexit.register(_dispatcher.close)
+        return _dispatcher
+
+def send(text, bot_token, chat_id, parse_mode="HTML"):
+    get_dispatcher().send(text, bot_token, chat_id, parse_mode)
+
+def flush(timeout=FLUSH_TIMEOUT):
+    return _dispatcher.flush(timeout) if _dispatcher is not None else True
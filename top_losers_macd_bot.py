@@ -1,10 +1,33 @@
 # top_losers_macd_bot.py (Enhanced for Batch Processing, Logging & Validation)
 
-import pandas as pd
+import os
 import time
+import argparse
+import pandas as pd
 from smart_login import get_smartapi_client
-from utils import get_stock_data, send_telegram_message, log_alert
-from indicators_correct import add_technical_indicators, get_engulfing_alerts
+from utils import get_stock_data, send_telegram_message, log_alerts
+from indicators_correct import get_engulfing_alerts
+from candle_store import as_frame
+from panel_scoring import grade_scores, RESULT_COLUMNS, HIGH_EARLY_VOLUME
+from parallel_scan import score_frames, min_batch_size
+from instrument_index import resolve_many
+from fetch_scheduler import fetch_many
+from scan_journal import ScanJournal
+from resample import multi_timeframe, timeframe_context, last_days, CONTEXT_COLUMNS, CONTEXT_DAYS
+import scan_history
+from prescreen import run_funnel
+from universe_builder import build_universe
+import alert_store
+import metrics
+import telegram_dispatcher
+
+# Symbols per checkpointed batch; never fewer than SCAN_WORKERS can shard
+BATCH_SIZE = max(int(os.getenv("SCAN_BATCH_SIZE", "50")), min_batch_size())
+RETRY_PASSES = int(os.getenv("SCAN_RETRY_PASSES", "1"))   # follow-up passes over skipped symbols
+RETRY_REASONS = {"no_data", "insufficient_data"}
+SCAN_DAYS = 7                                                 # window the confluence score is computed on
+PRESCREEN = os.getenv("SCAN_PRESCREEN", "1") == "1"          # quote/cached-candle funnel before full fetches
+ALERT_COOLDOWN = alert_store.CANDIDATE_COOLDOWN             # same-grade re-alert cooldown (SCANNER_ALERT_COOLDOWN_MINUTES)
 
 def get_top_losers(top_n=300):
     try:
@@ -16,7 +39,8 @@ def get_top_losers(top_n=300):
         print(f"❌ Failed to read top_losers.csv: {e}")
         return []
 
-def evaluate_bullish_candidate(df):
+def evaluate_bullish_candidate(df, early_volume=None, context=None):
+    df = as_frame(df)  # Candles need add_indicators() first; they're widened to a frame here
     macd = df['MACD'].iloc[-1]
     signal = df['MACD_signal'].iloc[-1]
     rsi = df['RSI_14'].iloc[-1]
@@ -33,8 +57,11 @@ def evaluate_bullish_candidate(df):
 
     engulf = "Bullish Engulfing" in get_engulfing_alerts(df)
 
-    early_volume = df['volume'].iloc[0] if not df.empty else 0
-    high_early_volume = early_volume >= 900000
+    # Volume of the latest session's opening bar (callers running off IndicatorState pass theirs)
+    if early_volume is None:
+        session = df.index.normalize() == df.index[-1].normalize() if not df.empty else []
+        early_volume = df['volume'][session].iloc[0] if not df.empty else 0
+    high_early_volume = early_volume >= HIGH_EARLY_VOLUME
 
     green_candles = sum(df['close'].iloc[-i] > df['open'].iloc[-i] for i in range(1, 4))
     strong_momentum = green_candles >= 2
@@ -51,7 +78,7 @@ def evaluate_bullish_candidate(df):
     if engulf:
         confluence += 1
 
-    return {
+    result = {
         "closeness_score": closeness_score,
         "actual_diff": actual_diff,
         "engulfing": engulf,
@@ -66,47 +93,60 @@ def evaluate_bullish_candidate(df):
         "high_early_volume": high_early_volume,
         "momentum": strong_momentum
     }
+    # Higher-timeframe flags from resample.timeframe_context, when the caller has them
+    if context:
+        result.update(context)
+    return result
 
-def run_batch(symbols_to_scan, client):
-    strong, moderate, watchlist = [], [], []
+def run_batch(symbols_to_scan, client, tokens=None, skip_reasons=None, scored=None):
     skipped = []
+    skip_reasons = {} if skip_reasons is None else skip_reasons
 
-    for i, symbol in enumerate(symbols_to_scan):
+    def fetch(item):
+        i, symbol = item
         print(f"🔄 Scanning {symbol} ({i+1}/{len(symbols_to_scan)})...")
-        df = get_stock_data(symbol, interval="15min", days=7, smart_api=client)
+        token = tokens.get(symbol) if tokens else None
+        started = time.perf_counter()
+        df = get_stock_data(symbol, interval="15min", days=CONTEXT_DAYS, smart_api=client, token=token, as_candles=True)
+        metrics.observe("symbol_fetch_seconds", time.perf_counter() - started)
+        return df
 
+    with metrics.stage("fetch"):
+        frames = fetch_many(enumerate(symbols_to_scan), fetch)
+
+    # EMA_50/EMA_200 come with the CONTEXT_DAYS fetch and stay on the SCAN_DAYS slice;
+    # the other indicators are computed on the slice
+    ready, history = {}, {}
+    for symbol, df in zip(symbols_to_scan, frames):
+        history[symbol] = df
+        df = last_days(df, SCAN_DAYS) if not df.empty else df
         if df.empty or len(df) < 35:
             print(f"⚠️ Skipped {symbol}: insufficient data")
+            skip_reasons[symbol] = "no_data" if df.empty else "insufficient_data"
+            metrics.skip(symbol, skip_reasons[symbol])
             skipped.append(symbol)
             continue
+        ready[symbol] = df
+
+    # Indicators and scores for the whole batch in one pass (sharded across processes with SCAN_WORKERS)
+    scores = score_frames(ready)
+    graded = grade_scores(scores)
+
+    strong, moderate, watchlist = (
+        graded[graded["grade"] == grade][RESULT_COLUMNS].to_dict("records")
+        for grade in ["strong", "moderate", "watchlist"]
+    )
 
-        df = add_technical_indicators(df)
-        result = evaluate_bullish_candidate(df)
-
-        data = {
-            "symbol": symbol,
-            "confluence": result['confluence'],
-            "closeness_score": result['closeness_score'],
-            "actual_diff": result['actual_diff'],
-            "rsi": result['rsi'],
-            "volume": result['volume'],
-            "volume_avg": result['volume_avg'],
-            "volume_surge": result['volume_surge'],
-            "engulfing": result['engulfing'],
-            "above_ema200": result['above_ema200'],
-            "early_volume": result['early_volume'],
-            "high_early_volume": result['high_early_volume'],
-            "momentum": result['momentum']
-        }
-
-        if result['confluence'] == 5:
-            strong.append(data)
-        elif result['confluence'] == 4:
-            moderate.append(data)
-        elif result['confluence'] == 3:
-            watchlist.append(data)
-
-        time.sleep(0.3)  # rate limit buffer
+    # Hourly/daily context for the candidates, resampled from the candles already fetched
+    with metrics.stage("context"):
+        for p in strong + moderate + watchlist:
+            p.update(timeframe_context(multi_timeframe(history[p["symbol"]])))
+
+    # Every scored symbol, graded or not, for scan_history
+    if scored is not None:
+        context = pd.DataFrame(strong + moderate + watchlist, columns=["symbol"] + CONTEXT_COLUMNS)
+        scored.append(scores.merge(graded[["symbol", "grade"]], on="symbol", how="left")
+                            .merge(context, on="symbol", how="left"))
 
     return strong, moderate, watchlist, skipped
 
@@ -118,52 +158,126 @@ def report_remarks(p):
         remarks.append("Sustained buying momentum")
     if p['confluence'] >= 4 and p['volume_surge']:
         remarks.append("MACD gap closing with strong volume")
+    if p.get('above_ema200_60min') and p.get('above_ema20_1day'):
+        remarks.append("Hourly and daily trend up")
     return "\n" + "\n".join("• " + line for line in remarks) if remarks else ""
 
-def main():
+def resolve_universe(all_symbols):
+    # Exact master matches only: a fuzzy match would scan and alert a different instrument
+    with metrics.stage("token_lookup"):
+        tokens = resolve_many(all_symbols, fuzzy=False)
+    for s in all_symbols:
+        if not tokens[s]:
+            metrics.skip(s, "no_token")
+    return [s for s in all_symbols if tokens[s]], tokens
+
+def candidates_message(all_strong, all_moderate, all_watchlist):
+    msg = "📈 <b>Bullish Candidates (Graded by Confluence)</b>\n"
+
+    for label, items, icon, action in [
+        ("Strong (5/5)", all_strong, "🟢", "✅ High Confidence"),
+        ("Moderate (4/5)", all_moderate, "🟡", "⚠️ Partial Watchlist"),
+        ("Watchlist (3/5)", all_watchlist, "🟠", "🔎 Observe Only")
+    ]:
+        if items:
+            msg += f"\n{icon} <b>{label}</b>\n"
+            for p in items:
+                msg += (
+                    f"\n<b>{p['symbol']}</b>\n"
+                    f"• MACD Closeness: {p['closeness_score']} 🔄 (actual diff: {p['actual_diff']})\n"
+                    f"• RSI: {p['rsi']}\n"
+                    f"• Action: {action}\n"
+                    f"{report_remarks(p)}\n"
+                )
+    return msg
+
+def scan_batches(symbols_to_scan, client, tokens, journal, run_id, positions, label="batch", scored=None):
+    # Scan in batches, checkpointing each batch's results and skip reasons as it completes
+    total_batches = -(-len(symbols_to_scan) // BATCH_SIZE)
+    for b in range(total_batches):
+        batch = symbols_to_scan[b * BATCH_SIZE : (b + 1) * BATCH_SIZE]
+        print(f"📦 Processing {label} {b+1}/{total_batches} ({len(batch)} stocks)")
+        skip_reasons = {}
+        strong, moderate, watchlist, _ = run_batch(batch, client, tokens, skip_reasons, scored)
+        graded = {p["symbol"]: (grade, p) for grade, items in
+                  [("strong", strong), ("moderate", moderate), ("watchlist", watchlist)] for p in items}
+        with metrics.stage("checkpoint"):
+            journal.record(run_id, positions, batch, graded, skip_reasons)
+
+def alert_candidates(all_strong, all_moderate, all_watchlist):
+    # Send candidates not already alerted at the same grade within the cooldown, then log them
+    store = alert_store.get_store()
+    fresh = []
+    for grade, items in [("strong", all_strong), ("moderate", all_moderate), ("watchlist", all_watchlist)]:
+        new = set(store.filter_new([p["symbol"] for p in items], f"bullish_{grade}", ALERT_COOLDOWN))
+        fresh.append([p for p in items if p["symbol"] in new])
+
+    suppressed = len(all_strong) + len(all_moderate) + len(all_watchlist) - sum(map(len, fresh))
+    if suppressed:
+        metrics.incr("alerts_suppressed", suppressed)
+        print(f"🔕 {suppressed} candidates already alerted recently; not re-sending")
+    if not any(fresh):
+        return 0
+
+    send_telegram_message(candidates_message(*fresh))
+    log_alerts([(p["symbol"], f"bullish_{grade}")
+                for grade, items in zip(["strong", "moderate", "watchlist"], fresh) for p in items])
+    return sum(map(len, fresh))
+
+def main(resume=False, prescreen=PRESCREEN, auto_universe=False):
     print("🚀 Starting Top Losers MACD Bot (Batched)")
     client = get_smartapi_client()
     if not client:
         print("❌ SmartAPI login failed")
         return
 
-    all_symbols = get_top_losers(top_n=9999)
-    df_master = pd.read_csv("MACD_EQ_Segment_ScripMaster.csv")
-    symbols_to_scan = [s for s in all_symbols if s in df_master['symbol'].values]
+    journal = ScanJournal()
+    run_id, all_symbols = journal.unfinished_run() if resume else (None, None)
+    if run_id is not None:
+        done = journal.done_symbols(run_id)
+        print(f"⏩ Resuming scan #{run_id}: {len(done)}/{len(all_symbols)} symbols already done")
+    else:
+        if resume:
+            print("ℹ️ No unfinished scan to resume; starting a new one")
+        if auto_universe:
+            build_universe(client)
+        all_symbols = get_top_losers(top_n=9999)
+        run_id, done = journal.start_run(all_symbols), set()
+    positions = {s: i for i, s in enumerate(all_symbols)}
+
+    remaining = [s for s in all_symbols if s not in done]
+    symbols_to_scan, tokens = resolve_universe(remaining)
+    journal.record(run_id, positions, [s for s in remaining if not tokens[s]],
+                   skip_reasons={s: "no_token" for s in remaining if not tokens[s]})
+    if prescreen and symbols_to_scan:
+        symbols_to_scan, eliminated = run_funnel(client, symbols_to_scan, tokens)
+        journal.record(run_id, positions, list(eliminated), skip_reasons=eliminated)
+    scored = []
+    scan_batches(symbols_to_scan, client, tokens, journal, run_id, positions, scored=scored)
 
-    total_batches = (len(symbols_to_scan) // 300) + 1
-    all_strong, all_moderate, all_watchlist, all_skipped = [], [], [], []
+    # Follow-up pass(es) over symbols skipped for missing/short data (this run or before a resume)
+    for _ in range(RETRY_PASSES):
+        retry = [s for s, reason, attempts in journal.skipped(run_id)
+                 if reason in RETRY_REASONS and attempts <= RETRY_PASSES]
+        if not retry:
+            break
+        print(f"🔁 Retrying {len(retry)} skipped symbols")
+        tokens.update(resolve_many(retry))
+        scan_batches(retry, client, tokens, journal, run_id, positions, label="retry batch", scored=scored)
 
-    for b in range(total_batches):
-        batch = symbols_to_scan[b * 300 : (b + 1) * 300]
-        print(f"📦 Processing batch {b+1}/{total_batches} ({len(batch)} stocks)")
-        strong, moderate, watchlist, skipped = run_batch(batch, client)
-        all_strong += strong
-        all_moderate += moderate
-        all_watchlist += watchlist
-        all_skipped += skipped
+    # Symbols finished before a --resume were scored by the earlier process and aren't in `scored`
+    if scored:
+        with metrics.stage("history"):
+            scan_history.record_scan(pd.concat(scored, ignore_index=True), source="scanner")
+
+    graded = journal.graded(run_id)
+    all_strong, all_moderate, all_watchlist = graded["strong"], graded["moderate"], graded["watchlist"]
+    all_skipped = [s for s, reason, _ in journal.skipped(run_id) if reason in RETRY_REASONS]
 
     if all_strong or all_moderate or all_watchlist:
-        msg = "📈 <b>Bullish Candidates (Graded by Confluence)</b>\n"
-
-        for label, items, icon, action in [
-            ("Strong (5/5)", all_strong, "🟢", "✅ High Confidence"),
-            ("Moderate (4/5)", all_moderate, "🟡", "⚠️ Partial Watchlist"),
-            ("Watchlist (3/5)", all_watchlist, "🟠", "🔎 Observe Only")
-        ]:
-            if items:
-                msg += f"\n{icon} <b>{label}</b>\n"
-                for p in items:
-                    msg += (
-                        f"\n<b>{p['symbol']}</b>\n"
-                        f"• MACD Closeness: {p['closeness_score']} 🔄 (actual diff: {p['actual_diff']})\n"
-                        f"• RSI: {p['rsi']}\n"
-                        f"• Action: {action}\n"
-                        f"{report_remarks(p)}\n"
-                    )
-
-        send_telegram_message(msg)
-        pd.DataFrame(all_strong + all_moderate + all_watchlist).to_csv("potential_bullish_crossover.csv", index=False)
+        alert_candidates(all_strong, all_moderate, all_watchlist)
+        with metrics.stage("write_csv"):
+            pd.DataFrame(all_strong + all_moderate + all_watchlist).to_csv("potential_bullish_crossover.csv", index=False)
         print("💾 Saved potential_bullish_crossover.csv")
     else:
         print("😐 No bullish setups found.")
@@ -173,5 +287,27 @@ def main():
         pd.DataFrame(all_skipped, columns=["symbol"]).to_csv("skipped_stocks.csv", index=False)
         print(f"⚠️ Skipped {len(all_skipped)} symbols. Saved to skipped_stocks.csv")
 
+    journal.finish_run(run_id)
+    journal.close()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scan Top Losers for bullish MACD setups")
+    parser.add_argument("--no-prescreen", action="store_true",
+                        help="fetch full history for every symbol instead of pre-screening on quotes first")
+    parser.add_argument("--auto-universe", action="store_true",
+                        help="rebuild top_losers.csv from live quotes before scanning")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the last unfinished scan instead of starting over")
+    parser.add_argument("--live", action="store_true",
+                        help="stream ticks and score each symbol as its 15-minute bar closes (see live_feed.py)")
+    args = parser.parse_args()
+
+    run_name = "live" if args.live else "scanner"
+    with metrics.profiled(run_name):
+        if args.live:
+            import live_feed  # imports this module, so only when streaming
+            live_feed.main(auto_universe=args.auto_universe)
+        else:
+            main(resume=args.resume, prescreen=PRESCREEN and not args.no_prescreen, auto_universe=args.auto_universe)
+    telegram_dispatcher.flush()
+    metrics.write_summary(run_name)
@@ -0,0 +1,150 @@
+# universe_builder.py
+# 📉 Builds top_losers.csv from the scrip master: % change for every NSE EQ instrument, top-N losers
+#
+# % change comes from batched getMarketData quotes (50 tokens per call). Symbols without
+# a quote fall back to the last two sessions in candle_store, but only when the stored
+# last bar is from the current session (with --source candles, offline, the store is
+# all there is and any age is used). Only decliners are ranked; the N worst are picked
+# with a bounded heap (O(n log N)) and written in the format get_top_losers reads. --watch rebuilds the list after every
+# 15-minute bar close and, with --scan, re-runs the scanner on it.
+# Usage: python universe_builder.py [--top-n 300] [--source quotes|candles] [--watch [--scan]]
+
+import os
+import time
+import heapq
+import signal
+import argparse
+import threading
+
+import pandas as pd
+
+import candle_store
+from candle_store import MARKET_TZ
+from instrument_index import get_instrument_index
+from prescreen import fetch_quotes
+from smart_login import get_smartapi_client
+import metrics
+import telegram_dispatcher
+
+UNIVERSE_PATH = "top_losers.csv"
+TOP_N = int(os.getenv("UNIVERSE_TOP_N", "300"))
+CLOSE_GRACE = float(os.getenv("UNIVERSE_CLOSE_GRACE", "20"))  # seconds after a bar close before re-ranking
+
+# --- % change sources ---
+def eq_instruments(index=None):
+    # {symbol: token} for every NSE EQ instrument in the scrip master
+    return dict((index or get_instrument_index())["exact"])
+
+def changes_from_quotes(client, instruments):
+    # {symbol: (% change, ltp)} vs the previous close, from batched quotes
+    quotes = fetch_quotes(client, instruments.values())
+    changes = {}
+    for symbol, token in instruments.items():
+        quote = quotes.get(str(token))
+        if not quote or not quote.get("ltp"):
+            continue
+        ltp, prev_close = float(quote["ltp"]), float(quote.get("close") or 0)
+        if quote.get("percentChange") is not None:
+            changes[symbol] = (float(quote["percentChange"]), ltp)
+        elif prev_close:
+            changes[symbol] = ((ltp - prev_close) / prev_close * 100, ltp)
+    return changes
+
+def current_session(now=None):
+    # Market date of the latest session that has opened (weekdays; exchange holidays aren't known here)
+    now = pd.Timestamp(now or time.time(), unit="s", tz="UTC").tz_convert(MARKET_TZ)
+    day = now.normalize()
+    if now < day + pd.Timedelta(hours=9, minutes=15):
+        day -= pd.Timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= pd.Timedelta(days=1)
+    return day.date()
+
+def changes_from_store(symbols, now=None, fresh_only=False):
+    # {symbol: (% change, last close)}: latest stored close vs the previous session's last close.
+    # fresh_only: skip symbols whose last stored bar isn't from the current session
+    now = now or time.time()
+    session = current_session(now)
+    changes = {}
+    for symbol in symbols:
+        df = candle_store.read_window(symbol, "15min", now - 7 * 86400)
+        if df.empty:
+            continue
+        dates = df.index.tz_convert(MARKET_TZ).date
+        if fresh_only and dates[-1] != session:
+            continue
+        previous = df["close"][dates < dates[-1]]
+        if previous.empty or not previous.iloc[-1]:
+            continue
+        last = float(df["close"].iloc[-1])
+        changes[symbol] = ((last - previous.iloc[-1]) / previous.iloc[-1] * 100, last)
+    return changes
+
+# --- Ranking ---
+def top_losers(changes, n=TOP_N):
+    # The n most negative % changes, worst first: heap selection, O(len(changes) · log n).
+    # Unchanged and rising symbols are never losers, however short the list.
+    losers = ((symbol, change) for symbol, change in changes.items() if change[0] < 0)
+    return heapq.nsmallest(n, losers, key=lambda item: (item[1][0], item[0]))
+
+def build_universe(client=None, top_n=TOP_N, source="quotes", path=UNIVERSE_PATH):
+    instruments = eq_instruments()
+    changes = {}
+    if source == "quotes" and client is not None:
+        with metrics.stage("universe_quotes"):
+            changes = changes_from_quotes(client, instruments)
+    with metrics.stage("universe_store"):
+        # Quotes are live; a stored move from an earlier session must not rank beside them
+        changes.update(changes_from_store([s for s in instruments if s not in changes],
+                                          fresh_only=source != "candles"))
+
+    with metrics.stage("universe_rank"):
+        losers = top_losers(changes, top_n)
+    universe = pd.DataFrame([(symbol, round(pct, 2), ltp) for symbol, (pct, ltp) in losers],
+                            columns=["symbol", "pct_change", "ltp"])
+    tmp_path = path + ".tmp"
+    universe.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)  # a scanner reading mid-refresh sees the old or the new list, never half
+    print(f"📉 Ranked {len(changes)}/{len(instruments)} EQ instruments; "
+          f"saved top {len(universe)} losers to {path}")
+    return universe
+
+# --- Scheduled refresh ---
+def run_watch(top_n=TOP_N, source="quotes", scan=False, stop=None):
+    from position_guard_bot import next_bar_close
+    import top_losers_macd_bot as scanner
+
+    stop = stop or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+
+    client = get_smartapi_client() if source == "quotes" else None
+    while not stop.is_set():
+        with metrics.profiled("universe"):
+            build_universe(client, top_n, source)
+            if scan:
+                scanner.main()
+        telegram_dispatcher.flush()
+        metrics.write_summary("universe")
+
+        bar_close = next_bar_close(pd.Timestamp.now(tz=MARKET_TZ))
+        print(f"⏳ Next refresh at {bar_close:%a %d %b %H:%M}")
+        stop.wait(max(0.0, (bar_close - pd.Timestamp.now(tz=MARKET_TZ)).total_seconds() + CLOSE_GRACE))
+    print("👋 Universe builder stopped.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build top_losers.csv from live quotes or stored candles")
+    parser.add_argument("--top-n", type=int, default=TOP_N)
+    parser.add_argument("--source", choices=["quotes", "candles"], default="quotes")
+    parser.add_argument("--watch", action="store_true", help="re-rank after every 15-minute bar close")
+    parser.add_argument("--scan", action="store_true", help="with --watch, run the scanner after each refresh")
+    args = parser.parse_args()
+
+    if args.watch:
+        run_watch(args.top_n, args.source, args.scan)
+    else:
+        with metrics.profiled("universe"):
+            client = get_smartapi_client() if args.source == "quotes" else None
+            build_universe(client, args.top_n, args.source)
+        metrics.write_summary("universe")
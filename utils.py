@@ -3,123 +3,172 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
-import time
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import timedelta
 import logging
-from difflib import get_close_matches
-import re
+from instrument_index import resolve_symbol
+import candle_store
+from resample import INTERVAL_MINUTES, multi_timeframe
+from fetch_scheduler import call_with_retry
+import metrics
+import telegram_dispatcher
+import alert_store
 
 # --- Logging Setup ---
 logger = logging.getLogger(__name__)
 
-# --- Load NSE Instruments CSV ---
-instrument_df = pd.read_csv("MACD_EQ_Segment_ScripMaster.csv")
-
 # --- Send Telegram Message (with HTML escape) ---
+# Queued on the background dispatcher: returns immediately, delivery is retried/spooled
 def send_telegram_message(message, bot_token=None, chat_id=None):
-    import requests
     message = message.replace("<", "&lt;").replace(">", "&gt;")
     if bot_token is None:
         bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
     if chat_id is None:
         chat_id = os.getenv("TELEGRAM_CHAT_ID")
-    try:
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-        payload = {"chat_id": chat_id, "text": message, "parse_mode": "HTML"}
-        response = requests.post(url, json=payload)
-        print("Telegram response:", response.status_code, "-", response.text)
-    except Exception as e:
-        print("❌ Failed to send Telegram message:", str(e))
+    telegram_dispatcher.send(message, bot_token, chat_id)
 
 # --- Get Token from CSV with fallback logic ---
 def get_token_from_csv(symbol):
     try:
-        instrument_df['symbol'] = instrument_df['symbol'].astype(str)
-        instrument_df['instrumenttype'] = instrument_df['instrumenttype'].astype(str).fillna("EQ")
-        instrument_df['exchange'] = instrument_df['exchange'].astype(str)
-
-        # Normalize symbols
-        instrument_df['normalized_symbol'] = (
-            instrument_df['symbol']
-            .str.replace(r'[-.].*$', '', regex=True)
-            .str.replace(r'[^A-Z0-9]', '', regex=True)
-            .str.upper()
-        )
-        symbol_upper = re.sub(r'[^A-Z0-9]', '', symbol.upper())
-
-        # Direct match
-        row = instrument_df[
-            (instrument_df['normalized_symbol'] == symbol_upper) &
-            (instrument_df['instrumenttype'].str.upper() == "EQ") &
-            (instrument_df['exchange'].str.upper() == "NSE")
-        ]
-        if not row.empty:
-            return str(row.iloc[0]['token'])
-
-        # Fuzzy fallback
-        matches = get_close_matches(symbol_upper, instrument_df['normalized_symbol'].unique(), n=1, cutoff=0.75)
-        if matches:
-            fuzzy_match = matches[0]
-            print(f"ℹ️ Fuzzy matched '{symbol}' → '{fuzzy_match}'")
-            row = instrument_df[instrument_df['normalized_symbol'] == fuzzy_match]
-            if not row.empty:
-                print(f"✅ Using token for {symbol} → {row.iloc[0]['symbol']}")
-                return str(row.iloc[0]['token'])
-
-        logger.warning(f"⚠️ Token not found for {symbol}")
-        return None
-
+        return resolve_symbol(symbol)
     except Exception as e:
         logger.error(f"Error finding token for {symbol}: {str(e)}")
         return None
 
 # --- Get Historical OHLC Data ---
-def get_stock_data(symbol, interval="15min", days=30, smart_api=None):
-    token = get_token_from_csv(symbol)
+SMARTAPI_INTERVALS = {
+    "1min": "ONE_MINUTE", "5min": "FIVE_MINUTE",
+    "15min": "FIFTEEN_MINUTE", "30min": "THIRTY_MINUTE",
+    "60min": "ONE_HOUR", "1day": "ONE_DAY"
+}
+# Longest span SmartAPI serves in one getCandleData request, per interval
+MAX_DAYS_PER_REQUEST = {"1min": 30, "5min": 100, "15min": 200, "30min": 200, "60min": 400, "1day": 2000}
+
+def _market_time(ts):
+    # SmartAPI's fromdate/todate are IST wall-clock strings
+    return pd.Timestamp(ts, unit="s", tz="UTC").tz_convert(candle_store.MARKET_TZ).strftime("%Y-%m-%d %H:%M")
+
+def _no_data(as_candles):
+    return candle_store.Candles.from_frame(pd.DataFrame()) if as_candles else pd.DataFrame()
+
+# as_candles=True returns compact candle_store.Candles (zero-copy over the store) instead of a DataFrame
+def get_stock_data(symbol, interval="15min", days=30, smart_api=None, token=None, use_store=True, as_candles=False):
     if not token:
-        return pd.DataFrame()
-
-    time.sleep(10)
-
-    interval_map = {
-        "1min": "ONE_MINUTE", "5min": "FIVE_MINUTE",
-        "15min": "FIFTEEN_MINUTE", "30min": "THIRTY_MINUTE",
-        "60min": "ONE_HOUR", "1day": "ONE_DAY"
-    }
+        with metrics.stage("token_lookup"):
+            token = get_token_from_csv(symbol)
+    if not token:
+        return _no_data(as_candles)
 
-    to_date = datetime.now()
+    # SmartAPI reads fromdate/todate as IST wall-clock times, whatever the host's zone
+    to_date = pd.Timestamp.now(tz=candle_store.MARKET_TZ)
     from_date = to_date - timedelta(days=days)
+    fetch_from = from_date
+
+    # Only ask SmartAPI for the gap since the last stored candle (re-fetching that
+    # candle, which may have been saved mid-bar)
+    if use_store:
+        with metrics.stage("candle_store_read"):
+            covered_from, last_ts = candle_store.coverage(symbol, interval)
+        if covered_from is not None and covered_from <= from_date.timestamp() and last_ts >= from_date.timestamp():
+            fetch_from = pd.Timestamp(last_ts, unit="s", tz="UTC").tz_convert(candle_store.MARKET_TZ)
 
     params = {
         "exchange": "NSE",
         "symboltoken": token,
-        "interval": interval_map[interval],
-        "fromdate": from_date.strftime("%Y-%m-%d %H:%M"),
+        "interval": SMARTAPI_INTERVALS[interval],
+        "fromdate": fetch_from.strftime("%Y-%m-%d %H:%M"),
         "todate": to_date.strftime("%Y-%m-%d %H:%M")
     }
 
     try:
-        response = smart_api.getCandleData(params)
+        response = call_with_retry(lambda: smart_api.getCandleData(params))
         if response['status']:
             df = pd.DataFrame(response['data'], columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
             df['timestamp'] = pd.to_datetime(df['timestamp'])
             df.set_index('timestamp', inplace=True)
+            candles = None
+            if use_store:
+                with metrics.stage("candle_store_write"):
+                    candle_store.append_candles(symbol, interval, df, covered_from=fetch_from.timestamp())
+                    if as_candles:
+                        candles = candle_store.load_candles(symbol, interval)
+                        candles = candles.since(from_date.timestamp()) if candles is not None else None
+                    else:
+                        df = candle_store.read_window(symbol, interval, from_date.timestamp())
+            metrics.incr("candles_fetched", len(response['data'] or []))
+            if as_candles:
+                if candles is None:
+                    candles = candle_store.Candles.from_frame(df)
+                return candles.add_trend_indicators()
             df['EMA_50'] = df['close'].ewm(span=50, adjust=False).mean()
             df['EMA_200'] = df['close'].ewm(span=200, adjust=False).mean()
             return df
         else:
+            metrics.incr("api_error_responses")
             logger.error(f"SmartAPI error: {response.get('message', 'No message')}")
-            return pd.DataFrame()
+            return _no_data(as_candles)
     except Exception as e:
         logger.error(f"Data fetch failed for {symbol}: {str(e)}")
-        return pd.DataFrame()
-
-# --- CSV Logger for Alerts ---
-def log_alert(symbol, alert_type):
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = pd.DataFrame([[now, symbol, alert_type]], columns=["timestamp", "symbol", "alert"])
+        return _no_data(as_candles)
+
+# --- Multi-year history for the backtest ---
+def backfill_history(symbol, days, interval="15min", smart_api=None, token=None, now=None):
+    # Walk back from the start of the stored coverage in the largest chunks SmartAPI
+    # serves until `days` of history are stored; backfilled series are kept whole
+    # (never trimmed by CANDLE_RETENTION_DAYS). Returns the number of bars fetched.
+    token = token or get_token_from_csv(symbol)
+    if not token:
+        return 0
+    now = pd.Timestamp.now(tz="UTC").timestamp() if now is None else now
+    target = now - days * 86400
+    covered_from, _ = candle_store.coverage(symbol, interval)
+    cursor = now if covered_from is None else covered_from
+    fetched = 0
+    while cursor > target:
+        chunk_from = max(target, cursor - MAX_DAYS_PER_REQUEST[interval] * 86400)
+        params = {
+            "exchange": "NSE",
+            "symboltoken": token,
+            "interval": SMARTAPI_INTERVALS[interval],
+            "fromdate": _market_time(chunk_from),
+            "todate": _market_time(cursor),
+        }
+        try:
+            response = call_with_retry(lambda: smart_api.getCandleData(params))
+        except Exception as e:
+            logger.error(f"History backfill failed for {symbol}: {str(e)}")
+            break
+        if not response or not response.get("status"):
+            logger.error(f"SmartAPI error: {(response or {}).get('message', 'No message')}")
+            break
+        if not response["data"]:
+            break  # nothing older (listing date or the API's history limit)
+        df = pd.DataFrame(response["data"], columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        df.set_index('timestamp', inplace=True)
+        candle_store.prepend_history(symbol, interval, df, covered_from=chunk_from, covered_to=cursor)
+        metrics.incr("candles_fetched", len(df))
+        fetched += len(df)
+        cursor = chunk_from
+    return fetched
+
+# --- Multi-timeframe candles from a single fetch ---
+def get_multi_timeframe_data(symbol, intervals=("15min", "60min", "1day"), days=60, smart_api=None, token=None):
+    # Fetch the finest interval once and resample the coarser ones locally (09:15-anchored sessions)
+    base = min(intervals, key=INTERVAL_MINUTES.get)
+    df = get_stock_data(symbol, interval=base, days=days, smart_api=smart_api, token=token)
+    if df.empty:
+        return {}
+    with metrics.stage("resample"):
+        return multi_timeframe(df, base, intervals)
+
+# --- Alert Log (indexed SQLite store; `python alert_store.py` exports alerts_log.csv) ---
+def log_alerts(alerts):
+    # alerts: (symbol, alert_type) pairs, written in one transaction
     try:
-        log_entry.to_csv("alerts_log.csv", mode="a", header=not os.path.exists("alerts_log.csv"), index=False)
+        alert_store.get_store().log_many(alerts)
     except Exception as e:
-        logger.error(f"Error writing to alerts_log.csv: {str(e)}")
+        logger.error(f"Error writing to alert store: {str(e)}")
+
+def log_alert(symbol, alert_type):
+    log_alerts([(symbol, alert_type)])